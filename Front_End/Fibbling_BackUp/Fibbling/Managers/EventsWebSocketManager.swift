@@ -72,11 +72,20 @@ class EventsWebSocketManager: ObservableObject {
             return
         }
         
+        // ✅ The server closes sockets without a valid JWT (4001); read the token on
+        // every connect so reconnects pick up a refreshed one
+        guard let token = UserDefaults.standard.string(forKey: "access_token") else {
+            AppLogger.error("No access token, not connecting to WebSocket", category: AppLogger.websocket)
+            return
+        }
+        var request = URLRequest(url: url)
+        request.setValue("Bearer \(token)", forHTTPHeaderField: "Authorization")
+        
         // Close any existing connection
         webSocketTask?.cancel(with: .goingAway, reason: nil)
         
         // Create and start a new connection
-        webSocketTask = urlSession.webSocketTask(with: url)
+        webSocketTask = urlSession.webSocketTask(with: request)
         webSocketTask?.resume()
         
         AppLogger.logWebSocket("Connecting to WebSocket", details: url.absoluteString)
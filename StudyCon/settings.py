@@ -267,23 +267,48 @@ LOGGING = {
     },
 }
 
-# Push Notifications Settings (configure via environment)
-# Supports both certificate-based and token-based (APNs Auth Key) authentication
-import tempfile
-
-apns_auth_key_path = os.environ.get('APNS_AUTH_KEY_PATH', '')
-apns_auth_key_content = os.environ.get('APNS_AUTH_KEY_CONTENT', '')
-
-# Handle APNs Auth Key content directly from environment variable
-if apns_auth_key_content and not apns_auth_key_path:
-    # Create temporary file with the .p8 content
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.p8') as f:
-        f.write(apns_auth_key_content)
-        apns_auth_key_path = f.name
+# Semantic search: shared embedding server socket (python manage.py run_embedding_server)
+EMBEDDING_SERVICE_SOCKET = os.environ.get('EMBEDDING_SERVICE_SOCKET', '/tmp/pinit-embeddings.sock')
+
+# Engagement write-behind: buffer likes/shares in-process and flush them in
+# batches (see myapp/engagement_buffer.py). Off by default.
+ENGAGEMENT_WRITE_BEHIND = os.environ.get('ENGAGEMENT_WRITE_BEHIND', 'False').lower() == 'true'
+ENGAGEMENT_FLUSH_INTERVAL = float(os.environ.get('ENGAGEMENT_FLUSH_INTERVAL', '1.0'))  # seconds
+
+# Push notification outbox (see myapp/notifications.py). Run
+# `python manage.py run_notification_worker` and set
+# NOTIFICATION_EMBEDDED_DISPATCHER=False to deliver from a separate process.
+NOTIFICATION_EMBEDDED_DISPATCHER = os.environ.get('NOTIFICATION_EMBEDDED_DISPATCHER', 'True').lower() == 'true'
+# Priority lanes: parallel deliveries and optional device sends per second
+# 'streams' splits the APNs connection's 100 concurrent streams between the
+# lanes, so the critical lane's share is always free
+NOTIFICATION_LANES = {
+    'critical': {
+        'concurrency': int(os.environ.get('NOTIFICATION_CRITICAL_CONCURRENCY', '4')),
+        'rate_limit': None,
+        'streams': 30,
+    },
+    'default': {
+        'concurrency': int(os.environ.get('NOTIFICATION_DEFAULT_CONCURRENCY', '4')),
+        'rate_limit': None,
+        'streams': 50,
+    },
+    'bulk': {
+        'concurrency': int(os.environ.get('NOTIFICATION_BULK_CONCURRENCY', '2')),
+        'rate_limit': float(os.environ.get('NOTIFICATION_BULK_RATE_LIMIT', '200')) or None,
+        'streams': 20,
+    },
+}
+NOTIFICATION_POLL_INTERVAL = float(os.environ.get('NOTIFICATION_POLL_INTERVAL', '5.0'))  # seconds
+NOTIFICATION_COALESCE_WINDOW = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW', '60'))  # seconds, 0 disables
 
+# Push Notifications Settings (configure via environment)
+# Token-based (APNs Auth Key) authentication. The .p8 key is parsed once, in
+# memory, and validated at startup (see myapp/push.py and MyappConfig.ready).
 PUSH_NOTIFICATIONS_SETTINGS = {
     # Modern APNs Authentication (Token-based) - RECOMMENDED
-    "APNS_AUTH_KEY_PATH": apns_auth_key_path,  # Path to .p8 file
+    "APNS_AUTH_KEY_PATH": os.environ.get('APNS_AUTH_KEY_PATH', ''),  # Path to .p8 file
+    "APNS_AUTH_KEY": os.environ.get('APNS_AUTH_KEY_CONTENT', ''),    # ... or the .p8 contents
     "APNS_AUTH_KEY_ID": os.environ.get('APNS_AUTH_KEY_ID', ''),      # 10-character key ID
     "APNS_TEAM_ID": os.environ.get('APNS_TEAM_ID', ''),              # 10-character team ID
     "APNS_TOPIC": os.environ.get('APNS_TOPIC', 'com.pinit.app'),     # Bundle ID
@@ -293,6 +318,8 @@ PUSH_NOTIFICATIONS_SETTINGS = {
     
     # Environment setting
     "APNS_USE_SANDBOX": os.environ.get('APNS_USE_SANDBOX', 'True').lower() == 'true',
+    # Override the APNs host, e.g. http://127.0.0.1:8443 for a local mock server
+    "APNS_ENDPOINT": os.environ.get('APNS_ENDPOINT', ''),
     
     # FCM settings for Android (future)
     "FCM_API_KEY": os.environ.get('FCM_API_KEY', ''),
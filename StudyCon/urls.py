@@ -48,9 +48,12 @@ urlpatterns = [
     # Event search
     path("api/search_events/", views.search_events, name="search_events"),
     path('api/enhanced_search_events/', views.enhanced_search_events, name='enhanced_search_events'),
+    path("api/events_near_me/", views.get_events_near_me, name="get_events_near_me"),
+    path("api/search_cache_stats/", views.get_search_cache_stats, name="get_search_cache_stats"),
  
     # Event social interactions - UPDATED to match Swift implementation
     path("api/events/comment/", views.add_event_comment, name="add_event_comment"),
+    path("api/events/comments/batch/", views.add_event_comments_batch, name="add_event_comments_batch"),
     path("api/events/like/", views.toggle_event_like, name="toggle_event_like"),
     path("api/events/share/", views.record_event_share, name="record_event_share"),
     path("api/events/upload_image/", views.upload_event_post_image, name="upload_event_post_image"),
@@ -58,6 +61,8 @@ urlpatterns = [
     
     # NEW: Feed endpoint to match Swift implementation
     path("api/events/feed/<str:event_id>/", views.get_event_feed, name="get_event_feed"),
+    path("api/events/feed/<str:event_id>/replies/<int:post_id>/", views.get_event_feed_replies, name="get_event_feed_replies"),
+    path("api/events/detail/<str:event_id>/", views.get_event_detail, name="get_event_detail"),
     
     # Admin and Chat endpoints
     path("admin/", admin.site.urls),
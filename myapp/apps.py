@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        # Parse the APNs signing key once at startup, so a missing or broken
+        # key is reported at boot instead of on the first push
+        from myapp.push import validate_configuration
+        validate_configuration()
@@ -1,7 +1,10 @@
 import json
+import uuid
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer
 import re
 from channels.db import database_sync_to_async
+from myapp.utils import event_group, geo_tile_group, viewport_tiles
 
 def sanitize_username(username):
     """Sanitize username for WebSocket group names by removing special characters"""
@@ -279,13 +282,54 @@ class EventsConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time event updates.
     
-    This consumer allows clients to subscribe to event changes 
-    for a specific user. It will notify when events are created,
-    updated, or deleted.
+    The connection must be authenticated (a JWT access token, see
+    myapp/middleware.py) as the user named in the URL; anything else is
+    closed with code 4001 or 4003. On connect the client is subscribed to its personal events_<username>
+    group and to the event_<id> group of every upcoming event it hosts,
+    attends or is invited to. The client can then manage its subscriptions:
+    
+        {"action": "subscribe", "event_ids": ["<uuid>", ...]}
+        {"action": "unsubscribe", "event_ids": ["<uuid>", ...]}
+        {"action": "viewport", "min_lat": .., "min_lon": .., "max_lat": .., "max_lon": ..}
+        {"action": "clear_viewport"}
+    
+    A viewport subscribes to the geo tile groups covering the visible map, so
+    public events created, edited or deleted there are pushed without the
+    server computing an audience on every write.
+    
+    Create and update messages for public events carry the serialized event
+    and its version; clients apply it in place, ignoring versions older than
+    the one they hold, instead of refetching their event list. Messages for
+    private or auto-matched events carry only the ID, and an "invalidate"
+    message tells a tile the event left that its copy is stale; clients
+    refetch those through the permission-checked endpoints.
     """
+    MAX_EVENT_SUBSCRIPTIONS = 200
+    # Broadcast IDs remembered to drop a message that reached several groups
+    RECENT_BROADCASTS = 64
+
     async def connect(self):
-        # Get the username from the URL
-        self.username = self.scope["url_route"]["kwargs"]["username"]
+        self.event_groups = set()
+        self.tile_groups = set()
+        self.recent_broadcasts = deque(maxlen=self.RECENT_BROADCASTS)
+        
+        # ✅ SECURITY: Only the authenticated user may listen to their own events
+        user = self.scope.get("user")
+        requested_username = self.scope["url_route"]["kwargs"]["username"]
+        if user is None or not user.is_authenticated:
+            self.username = requested_username
+            self.user_events_group = None
+            await self.close(code=4001)
+            return
+        if user.username != requested_username:
+            self.username = requested_username
+            self.user_events_group = None
+            print(f"🚫 WebSocket REJECTED: {user.username} tried to listen to events of {requested_username}")
+            await self.close(code=4003)
+            return
+        
+        self.user_id = user.id
+        self.username = user.username
         # Sanitize username for WebSocket group name
         sanitized_username = sanitize_username(self.username)
         self.user_events_group = f"events_{sanitized_username}"
@@ -294,48 +338,201 @@ class EventsConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_add(self.user_events_group, self.channel_name)
         await self.accept()
         
-        print(f"✅ WebSocket CONNECTED: User {self.username} subscribed to event updates")
+        # Follow the user's own upcoming events
+        await self.subscribe_events(await self.get_related_event_ids())
+        
+        print(f"✅ WebSocket CONNECTED: User {self.username} subscribed to event updates ({len(self.event_groups)} event(s))")
 
     async def disconnect(self, close_code):
-        # Leave the events group
-        await self.channel_layer.group_discard(self.user_events_group, self.channel_name)
+        # Leave the events group and every subscription
+        if getattr(self, 'user_events_group', None) is None:
+            # Rejected in connect
+            return
+        groups = [self.user_events_group] + list(self.event_groups) + list(self.tile_groups)
+        for group_name in groups:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
         print(f"❌ WebSocket DISCONNECTED: User {self.username} unsubscribed from event updates")
 
+    @database_sync_to_async
+    def get_related_event_ids(self):
+        """Upcoming events the user hosts, attends or is invited to"""
+        from django.db.models import Q
+        from django.utils import timezone
+        from myapp.models import StudyEvent
+        return list(
+            StudyEvent.objects.filter(
+                Q(host_id=self.user_id)
+                | Q(attendees__id=self.user_id)
+                | Q(invited_friends__id=self.user_id),
+                end_time__gt=timezone.now()
+            ).order_by('time').values_list('id', flat=True).distinct()[:self.MAX_EVENT_SUBSCRIPTIONS]
+        )
+
+    @database_sync_to_async
+    def get_visible_event_ids(self, event_ids):
+        """
+        The subset of event_ids this user may follow: public events that
+        aren't auto-matched, and events they host, attend or are invited to
+        (directly or by auto-matching)
+        """
+        from django.db.models import Q
+        from myapp.models import StudyEvent
+        return list(
+            StudyEvent.objects.filter(id__in=event_ids).filter(
+                Q(is_public=True, auto_matching_enabled=False)
+                | Q(host_id=self.user_id)
+                | Q(attendees__id=self.user_id)
+                | Q(invited_friends__id=self.user_id)
+                | Q(invitation_records__user_id=self.user_id)
+            ).values_list('id', flat=True).distinct()
+        )
+
+    async def subscribe_events(self, event_ids):
+        for event_id in event_ids:
+            group_name = event_group(event_id)
+            if group_name in self.event_groups:
+                continue
+            if len(self.event_groups) >= self.MAX_EVENT_SUBSCRIPTIONS:
+                break
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            self.event_groups.add(group_name)
+
+    async def unsubscribe_events(self, event_ids):
+        for event_id in event_ids:
+            group_name = event_group(event_id)
+            if group_name in self.event_groups:
+                await self.channel_layer.group_discard(group_name, self.channel_name)
+                self.event_groups.discard(group_name)
+
+    async def set_tiles(self, tiles):
+        """Replace the viewport subscription with the given geo tiles"""
+        wanted = {geo_tile_group(tile) for tile in tiles}
+        for group_name in self.tile_groups - wanted:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+        for group_name in wanted - self.tile_groups:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        self.tile_groups = wanted
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            "type": "error",
+            "message": message
+        }))
+
     async def receive(self, text_data=None, bytes_data=None):
-        # We don't expect to receive messages from clients for event updates,
-        # but we'll implement a basic handler just in case
-        print(f"📩 Unexpected message received from client: {self.username}")
-        pass
+        try:
+            data = json.loads(text_data if text_data is not None else (bytes_data or b'').decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            await self.send_error("Invalid JSON format")
+            return
+        if not isinstance(data, dict):
+            await self.send_error("Invalid message format")
+            return
+
+        action = data.get("action")
+        try:
+            if action in ("subscribe", "unsubscribe"):
+                event_ids = data.get("event_ids")
+                if not isinstance(event_ids, list):
+                    await self.send_error("event_ids must be a list")
+                    return
+                event_ids = [uuid.UUID(str(event_id)) for event_id in event_ids[:self.MAX_EVENT_SUBSCRIPTIONS]]
+                if action == "subscribe":
+                    await self.subscribe_events(await self.get_visible_event_ids(event_ids))
+                else:
+                    await self.unsubscribe_events(event_ids)
+            elif action == "viewport":
+                await self.set_tiles(viewport_tiles(
+                    data["min_lat"], data["min_lon"], data["max_lat"], data["max_lon"]
+                ))
+            elif action == "clear_viewport":
+                await self.set_tiles([])
+            else:
+                print(f"📩 Unexpected message received from client: {self.username}")
+                await self.send_error("Unknown action")
+                return
+        except (KeyError, TypeError, ValueError) as e:
+            await self.send_error(f"Invalid {action} request: {e}")
+            return
+
+        await self.send(text_data=json.dumps({
+            "type": "subscriptions",
+            "events": len(self.event_groups),
+            "tiles": len(self.tile_groups)
+        }))
+
+    def event_message(self, message_type, event):
+        """
+        Client message for a broadcast. When the broadcast carries the
+        serialized event (and its version) it is passed through, so the
+        client can apply it without refetching its events.
+        """
+        message = {
+            "type": message_type,
+            "event_id": str(event["event_id"])
+        }
+        if event.get("event") is not None:
+            message["version"] = event.get("version")
+            message["event"] = event["event"]
+        return message
+
+    def is_repeat(self, event):
+        """True if this broadcast already reached the client through another group"""
+        broadcast_id = event.get("broadcast_id")
+        if broadcast_id is None:
+            return False
+        if broadcast_id in self.recent_broadcasts:
+            return True
+        self.recent_broadcasts.append(broadcast_id)
+        return False
 
     # Handler for event_update message type
     async def event_update(self, event):
         event_id = event["event_id"]
+        if event.get("follow"):
+            # Addressed to this user directly (e.g. a newly approved attendee): follow the event from now on
+            await self.subscribe_events([event_id])
+        if self.is_repeat(event):
+            return
         
         # Send the event update to the WebSocket client
-        await self.send(text_data=json.dumps({
-            "type": "update",
-            "event_id": str(event_id)
-        }))
+        await self.send(text_data=json.dumps(self.event_message("update", event)))
         print(f"📤 Sent event UPDATE notification to {self.username} for event: {event_id}")
 
     # Handler for event_create message type
     async def event_create(self, event):
         event_id = event["event_id"]
+        if event.get("follow"):
+            await self.subscribe_events([event_id])
+        if self.is_repeat(event):
+            return
         
         # Send the event creation to the WebSocket client
-        await self.send(text_data=json.dumps({
-            "type": "create",
-            "event_id": str(event_id)
-        }))
+        await self.send(text_data=json.dumps(self.event_message("create", event)))
         print(f"📤 Sent event CREATE notification to {self.username} for event: {event_id}")
 
     # Handler for event_delete message type
     async def event_delete(self, event):
         event_id = event["event_id"]
+        await self.unsubscribe_events([event_id])
+        if self.is_repeat(event):
+            return
         
         # Send the event deletion to the WebSocket client
         await self.send(text_data=json.dumps({
             "type": "delete",
             "event_id": str(event_id)
         }))
-        print(f"📤 Sent event DELETE notification to {self.username} for event: {event_id}")
\ No newline at end of file
+        print(f"📤 Sent event DELETE notification to {self.username} for event: {event_id}")
+
+    # Handler for event_invalidate message type (the event left a viewed tile)
+    async def event_invalidate(self, event):
+        event_id = event["event_id"]
+        if self.is_repeat(event):
+            return
+        
+        await self.send(text_data=json.dumps({
+            "type": "invalidate",
+            "event_id": str(event_id)
+        }))
+        print(f"📤 Sent event INVALIDATE notification to {self.username} for event: {event_id}")
@@ -0,0 +1,217 @@
+"""
+Out-of-process sentence embedding service.
+
+The SentenceTransformer model is large and slow to load, so instead of
+loading a copy into every web worker it runs in one local process
+(``python manage.py run_embedding_server``) that answers requests over a
+Unix socket. Concurrent requests are batched into a single ``encode`` call.
+
+Web workers call ``embed_texts``, which sends the texts in chunks of
+CLIENT_CHUNK_SIZE so each round trip stays well inside CLIENT_TIMEOUT even
+on a cold cache. Web workers never load the model themselves: when the
+server is not running or a request fails, semantic search is skipped.
+
+Wire format (both directions): a 4-byte big-endian length followed by a
+JSON body. Requests are ``{"texts": [...]}``, responses are
+``{"embeddings": [[...], ...]}`` or ``{"error": "..."}``.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Batching limits for the server
+MAX_BATCH_TEXTS = 64
+MAX_BATCH_WAIT = 0.01  # seconds to wait for more requests before encoding
+
+# Client timeout for one round trip to the server, and the number of texts
+# sent per round trip
+CLIENT_TIMEOUT = 5.0
+CLIENT_CHUNK_SIZE = MAX_BATCH_TEXTS
+
+_HEADER = struct.Struct('>I')
+
+
+def get_socket_path():
+    return getattr(settings, 'EMBEDDING_SERVICE_SOCKET', '/tmp/pinit-embeddings.sock')
+
+
+def semantic_search_available():
+    """True if the embedding server is running"""
+    return os.path.exists(get_socket_path())
+
+
+def _load_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _request_embeddings(sock, texts):
+    body = json.dumps({"texts": texts}).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(body)) + body)
+    (length,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    response = json.loads(_recv_exactly(sock, length).decode('utf-8'))
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['embeddings']
+
+
+def embed_texts(texts, on_chunk=None):
+    """
+    Return one embedding (list of floats) per text, or None if the server
+    isn't running or a request fails.
+
+    Texts go over one connection in chunks of CLIENT_CHUNK_SIZE, each with
+    its own CLIENT_TIMEOUT. on_chunk(start, vectors) is called as each chunk
+    arrives, so callers can cache partial progress even if a later chunk
+    fails.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    if not semantic_search_available():
+        return None
+
+    embeddings = []
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CLIENT_TIMEOUT)
+            sock.connect(get_socket_path())
+            for start in range(0, len(texts), CLIENT_CHUNK_SIZE):
+                vectors = _request_embeddings(sock, texts[start:start + CLIENT_CHUNK_SIZE])
+                if on_chunk is not None:
+                    on_chunk(start, vectors)
+                embeddings.extend(vectors)
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.warning("Embedding server request failed, skipping semantic search: %s", e)
+        return None
+    return embeddings
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class EmbeddingServer:
+    """Unix socket server that batches concurrent encode requests"""
+
+    def __init__(self, socket_path=None, model=None):
+        self.socket_path = socket_path or get_socket_path()
+        self.model = model
+        self.queue = None
+
+    async def _read_message(self, reader):
+        header = await reader.readexactly(_HEADER.size)
+        (length,) = _HEADER.unpack(header)
+        return json.loads((await reader.readexactly(length)).decode('utf-8'))
+
+    async def _write_message(self, writer, message):
+        body = json.dumps(message).encode('utf-8')
+        writer.write(_HEADER.pack(len(body)) + body)
+        await writer.drain()
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                texts = request.get('texts')
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    await self._write_message(writer, {"error": "texts must be a list of strings"})
+                    continue
+
+                future = asyncio.get_running_loop().create_future()
+                await self.queue.put((texts, future))
+                try:
+                    embeddings = await future
+                    await self._write_message(writer, {"embeddings": embeddings})
+                except Exception as e:
+                    await self._write_message(writer, {"error": str(e)})
+        except Exception as e:
+            logger.error("Embedding client error: %s", e)
+        finally:
+            writer.close()
+
+    async def batch_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            total = len(batch[0][0])
+
+            # Gather whatever else arrives within the batching window
+            deadline = loop.time() + MAX_BATCH_WAIT
+            while total < MAX_BATCH_TEXTS:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                total += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                vectors = await loop.run_in_executor(
+                    None, lambda: self.model.encode(texts, convert_to_numpy=True)
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in batch:
+                size = len(item_texts)
+                if not future.done():
+                    future.set_result([v.tolist() for v in vectors[offset:offset + size]])
+                offset += size
+
+    async def serve(self):
+        if self.model is None:
+            self.model = _load_model()
+        self.queue = asyncio.Queue()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        logger.info("Embedding server listening on %s", self.socket_path)
+
+        worker = asyncio.create_task(self.batch_worker())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            worker.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
@@ -0,0 +1,281 @@
+"""
+Write-behind buffer for likes and shares.
+
+With ENGAGEMENT_WRITE_BEHIND enabled, toggle_event_like and record_event_share
+hand their writes to this buffer instead of inserting synchronously. A daemon
+thread flushes every ENGAGEMENT_FLUSH_INTERVAL seconds, or as soon as
+MAX_PENDING writes are waiting. Writes are coalesced per event: like toggles
+that cancel out never reach the database, and each event costs one
+bulk_create/delete per table plus one counter UPDATE per touched row.
+
+The buffer lives in the web process. The pending_* helpers overlay writes
+that have not been flushed yet, so a user reading through this process sees
+their own likes and shares immediately. Writes still pending when the
+process is killed are lost, hence the short flush interval; counters can be
+repaired with reconcile_engagement_counters.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from myapp.event_detail_cache import invalidate_event_detail
+from myapp.models import StudyEvent, EventComment, EventLike, EventShare, ActivityLog, increment_counter
+
+logger = logging.getLogger(__name__)
+
+# Flush early once this many writes are waiting
+MAX_PENDING = 500
+
+
+def is_enabled():
+    return getattr(settings, 'ENGAGEMENT_WRITE_BEHIND', False)
+
+
+class EngagementBuffer:
+    """Per-process buffer of like toggles and shares, flushed by a daemon thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pending = 0
+        # (user_id, event_id, comment_id) -> [liked in database, liked now]
+        self._likes = {}
+        # event_id -> [(user_id, platform), ...]
+        self._shares = defaultdict(list)
+        # The batch currently being written, still visible to readers
+        self._flushing_likes = {}
+        self._flushing_shares = {}
+
+    # -----------------------------------------------------------------------
+    # Writes
+    # -----------------------------------------------------------------------
+
+    def toggle_like(self, user, event, comment=None):
+        """
+        Toggle user's like on an event (comment=None) or a post.
+        Returns (liked, total_likes) including writes not flushed yet.
+        """
+        comment_id = comment.id if comment else None
+        key = (user.id, event.id, comment_id)
+
+        liked_in_db = None
+        if self.pending_like_state(*key) is None:
+            liked_in_db = EventLike.objects.filter(user=user, event=event, comment=comment).exists()
+
+        with self._lock:
+            entry = self._likes.get(key)
+            if entry is None:
+                flushing = self._flushing_likes.get(key)
+                # A batch in flight is about to become the database state
+                base = flushing[1] if flushing else bool(liked_in_db)
+                entry = self._likes[key] = [base, base]
+            entry[1] = not entry[1]
+            liked = entry[1]
+            self._pending += 1
+
+        self._schedule_flush()
+        counter = comment.like_count if comment else event.like_count
+        total_likes = max(0, counter + self.pending_like_deltas(event.id).get(comment_id, 0))
+        return liked, total_likes
+
+    def add_share(self, user, event, platform):
+        """Record a share; returns the event's share total including pending shares"""
+        with self._lock:
+            self._shares[event.id].append((user.id, platform))
+            self._pending += 1
+
+        self._schedule_flush()
+        return event.share_count + self.pending_share_count(event.id)
+
+    # -----------------------------------------------------------------------
+    # Read-your-writes overlay
+    # -----------------------------------------------------------------------
+
+    def pending_like_state(self, user_id, event_id, comment_id=None):
+        """True/False if a like toggle is waiting to be written, else None"""
+        key = (user_id, event_id, comment_id)
+        with self._lock:
+            entry = self._likes.get(key) or self._flushing_likes.get(key)
+            return entry[1] if entry else None
+
+    def pending_like_deltas(self, event_id):
+        """Unwritten like count changes for an event, keyed by comment_id (None = the event)"""
+        # Pending entries start from the in-flight batch's outcome, so the two
+        # layers' deltas simply add up
+        deltas = Counter()
+        with self._lock:
+            for likes in (self._flushing_likes, self._likes):
+                for (_, entry_event_id, comment_id), (liked_in_db, liked) in likes.items():
+                    if entry_event_id == event_id and liked != liked_in_db:
+                        deltas[comment_id] += 1 if liked else -1
+        return deltas
+
+    def pending_share_count(self, event_id):
+        with self._lock:
+            return len(self._shares.get(event_id, ())) + len(self._flushing_shares.get(event_id, ()))
+
+    def apply_pending_likes(self, user_id, event_id, liked_comment_ids):
+        """Return liked_comment_ids with the user's unwritten comment like toggles applied"""
+        liked_comment_ids = set(liked_comment_ids)
+        with self._lock:
+            for likes in (self._flushing_likes, self._likes):
+                for (entry_user_id, entry_event_id, comment_id), (_, liked) in likes.items():
+                    if entry_user_id != user_id or entry_event_id != event_id or comment_id is None:
+                        continue
+                    if liked:
+                        liked_comment_ids.add(comment_id)
+                    else:
+                        liked_comment_ids.discard(comment_id)
+        return liked_comment_ids
+
+    # -----------------------------------------------------------------------
+    # Flushing
+    # -----------------------------------------------------------------------
+
+    def _schedule_flush(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name='engagement-flush', daemon=True
+                    )
+                    self._thread.start()
+                    atexit.register(self.flush)
+        if self._pending >= MAX_PENDING:
+            self._wakeup.set()
+
+    def _run(self):
+        interval = getattr(settings, 'ENGAGEMENT_FLUSH_INTERVAL', 1.0)
+        while True:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Engagement flush failed")
+
+    def flush(self):
+        """Write everything buffered so far; safe to call from any thread"""
+        with self._flush_lock:
+            with self._lock:
+                likes, shares = self._likes, self._shares
+                self._likes, self._shares = {}, defaultdict(list)
+                self._flushing_likes, self._flushing_shares = likes, shares
+                self._pending = 0
+
+            try:
+                self._write(likes, shares)
+            finally:
+                with self._lock:
+                    self._flushing_likes, self._flushing_shares = {}, {}
+                close_old_connections()
+
+    def _write(self, likes, shares):
+        # Coalesce per event; toggles that ended where they started are dropped
+        like_changes = defaultdict(lambda: ([], []))
+        for (user_id, event_id, comment_id), (liked_in_db, liked) in likes.items():
+            if liked != liked_in_db:
+                like_changes[event_id][0 if liked else 1].append((user_id, comment_id))
+
+        for event_id in set(like_changes) | set(shares):
+            added, removed = like_changes.get(event_id, ([], []))
+            try:
+                with transaction.atomic():
+                    self._write_event(event_id, added, removed, shares.get(event_id, []))
+            except Exception:
+                logger.exception(
+                    "Dropped %d like and %d share writes for event %s",
+                    len(added) + len(removed), len(shares.get(event_id, [])), event_id
+                )
+
+    def _write_event(self, event_id, added, removed, event_shares):
+        like_deltas = Counter()
+        new_likes = []
+
+        if removed:
+            rows = list(
+                EventLike.objects.filter(_likes_filter(removed), event_id=event_id)
+                .values_list('id', 'comment_id')
+            )
+            EventLike.objects.filter(id__in=[like_id for like_id, _ in rows]).delete()
+            for _, comment_id in rows:
+                like_deltas[comment_id] -= 1
+
+        if added:
+            existing = set(
+                EventLike.objects.filter(_likes_filter(added), event_id=event_id)
+                .values_list('user_id', 'comment_id')
+            )
+            candidates = [
+                EventLike(event_id=event_id, user_id=user_id, comment_id=comment_id)
+                for user_id, comment_id in added
+                if (user_id, comment_id) not in existing
+            ]
+            # A like written in the meantime (e.g. by a retried request) is
+            # skipped instead of failing, and dropping, the whole batch
+            EventLike.objects.bulk_create(candidates, ignore_conflicts=True)
+            # ignore_conflicts doesn't say which rows went in, so count the
+            # ones that are there now and weren't before
+            present = set(
+                EventLike.objects.filter(_likes_filter(added), event_id=event_id)
+                .values_list('user_id', 'comment_id')
+            )
+            new_likes = [like for like in candidates if (like.user_id, like.comment_id) in present]
+            for like in new_likes:
+                like_deltas[like.comment_id] += 1
+
+        if event_shares:
+            EventShare.objects.bulk_create([
+                EventShare(event_id=event_id, user_id=user_id, shared_platform=platform)
+                for user_id, platform in event_shares
+            ])
+
+        if new_likes or event_shares:
+            self._log_activity(event_id, new_likes, event_shares)
+
+        event_delta = like_deltas.pop(None, 0)
+        if event_delta or event_shares:
+            StudyEvent.objects.filter(pk=event_id).update(
+                like_count=Greatest(F('like_count') + event_delta, 0),
+                share_count=F('share_count') + len(event_shares),
+            )
+        for comment_id, delta in like_deltas.items():
+            if delta:
+                increment_counter(EventComment, comment_id, 'like_count', delta)
+        transaction.on_commit(lambda: invalidate_event_detail(event_id))
+
+
+    def _log_activity(self, event_id, new_likes, event_shares):
+        title = StudyEvent.objects.values_list('title', flat=True).get(pk=event_id)
+        user_ids = {like.user_id for like in new_likes} | {user_id for user_id, _ in event_shares}
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+        ActivityLog.objects.bulk_create(
+            [
+                ActivityLog(activity_type='like', user_id=like.user_id, event_id=event_id,
+                            username=usernames[like.user_id], event_title=title)
+                for like in new_likes
+            ] + [
+                ActivityLog(activity_type='share', user_id=user_id, event_id=event_id,
+                            username=usernames[user_id], event_title=title)
+                for user_id, _ in event_shares
+            ]
+        )
+
+
+def _likes_filter(pairs):
+    query = Q()
+    for user_id, comment_id in pairs:
+        query |= Q(user_id=user_id, comment_id=comment_id)
+    return query
+
+
+engagement_buffer = EngagementBuffer()
@@ -0,0 +1,50 @@
+"""
+Cached engagement read-model for the event detail screen.
+
+get_event_detail serves the event, its engagement counts, top posts,
+attendee preview and auto-matched users from one cache entry per event.
+Only data that is the same for every viewer is cached; per-user flags are
+added by the view.
+
+Like search_cache, every key embeds a per-event generation. Writes call
+invalidate_event_detail, which bumps the generation, so a read-model built
+from data that was already stale can never be read back.
+"""
+from django.core.cache import cache
+
+EVENT_DETAIL_TTL = 300
+
+_GENERATION_KEY = 'event_detail_gen:{}'
+_DETAIL_KEY = 'event_detail:{}:{}'
+
+
+def _get_generation(event_id):
+    key = _GENERATION_KEY.format(event_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def make_event_detail_key(event_id):
+    return _DETAIL_KEY.format(event_id, _get_generation(event_id))
+
+
+def invalidate_event_detail(*event_ids):
+    """Drop the cached read-model of each event after an engagement write"""
+    for event_id in event_ids:
+        key = _GENERATION_KEY.format(event_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key missing or evicted: any fresh value invalidates old entries
+            cache.set(key, 2, timeout=None)
+
+
+def get_cached_event_detail(key):
+    return cache.get(key)
+
+
+def set_cached_event_detail(key, detail):
+    cache.set(key, detail, timeout=EVENT_DETAIL_TTL)
@@ -0,0 +1,59 @@
+"""
+Django management command to prune push notification devices.
+
+Deletes devices that have been inactive (deactivated by APNs feedback or
+unregistered) for --inactive-days, and deactivates devices whose token has
+not been re-registered for --stale-days. The app re-registers its token on
+every launch, so a device that stays silent that long is no longer in use.
+Run it periodically (e.g. daily from cron).
+
+Usage:
+    python manage.py prune_stale_devices
+    python manage.py prune_stale_devices --inactive-days 30 --stale-days 180
+    python manage.py prune_stale_devices --dry-run
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.models import Device
+
+
+class Command(BaseCommand):
+    help = 'Delete long-inactive push devices and deactivate devices that stopped re-registering'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--inactive-days',
+            type=int,
+            default=30,
+            help='Delete inactive devices not updated for this many days (default: 30)',
+        )
+        parser.add_argument(
+            '--stale-days',
+            type=int,
+            default=180,
+            help='Deactivate active devices not re-registered for this many days (default: 180)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be pruned',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        dead = Device.objects.filter(is_active=False, updated_at__lt=now - timedelta(days=options['inactive_days']))
+        stale = Device.objects.filter(is_active=True, updated_at__lt=now - timedelta(days=options['stale_days']))
+
+        if options['dry_run']:
+            self.stdout.write(f'🔍 Would delete {dead.count()} inactive and deactivate {stale.count()} stale device(s)')
+            return
+
+        deleted, _ = dead.delete()
+        deactivated = stale.update(is_active=False, updated_at=now)
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Deleted {deleted} inactive device(s), deactivated {deactivated} stale device(s)'
+        ))
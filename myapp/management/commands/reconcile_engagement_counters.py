@@ -0,0 +1,94 @@
+"""
+Django management command to repair the denormalized engagement counters.
+
+StudyEvent.like_count / share_count / comment_count and EventComment.like_count
+are maintained incrementally by the write paths. This command recomputes them
+from EventLike, EventShare and EventComment and fixes any rows that drifted
+(e.g. after cascading deletes or manual data changes).
+
+Usage:
+    python manage.py reconcile_engagement_counters
+    python manage.py reconcile_engagement_counters --dry-run
+    python manage.py reconcile_engagement_counters --event <event-uuid>
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from myapp.models import StudyEvent, EventComment, EventLike, EventShare
+
+
+def _count_subquery(model, group_field, **filters):
+    """Correlated COUNT(*) of model rows pointing at the outer row"""
+    counts = (
+        model.objects.filter(**{group_field: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(group_field)
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def event_counter_expressions():
+    return {
+        'like_count': _count_subquery(EventLike, 'event', comment__isnull=True),
+        'share_count': _count_subquery(EventShare, 'event'),
+        'comment_count': _count_subquery(EventComment, 'event'),
+    }
+
+
+def comment_counter_expressions():
+    return {
+        'like_count': _count_subquery(EventLike, 'comment'),
+    }
+
+
+def _drifted(queryset, expressions):
+    """Rows whose stored counters differ from the recomputed values"""
+    annotated = queryset.annotate(**{f'actual_{field}': expr for field, expr in expressions.items()})
+    mismatch = Q()
+    for field in expressions:
+        mismatch |= ~Q(**{field: F(f'actual_{field}')})
+    return annotated.filter(mismatch)
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like/share/comment counters on events and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--event',
+            help='Only reconcile this event (UUID) and its comments',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted rows without fixing them',
+        )
+
+    def handle(self, *args, **options):
+        events = StudyEvent.objects.all()
+        comments = EventComment.objects.all()
+        if options['event']:
+            events = events.filter(id=options['event'])
+            comments = comments.filter(event_id=options['event'])
+
+        drifted_events = list(_drifted(events, event_counter_expressions()).values_list('id', flat=True))
+        drifted_comments = list(_drifted(comments, comment_counter_expressions()).values_list('id', flat=True))
+
+        self.stdout.write(
+            f'📊 Drifted counters: {len(drifted_events)} event(s), {len(drifted_comments)} comment(s)'
+        )
+        if options['dry_run'] or not (drifted_events or drifted_comments):
+            return
+
+        with transaction.atomic():
+            if drifted_events:
+                StudyEvent.objects.filter(id__in=drifted_events).update(**event_counter_expressions())
+            if drifted_comments:
+                EventComment.objects.filter(id__in=drifted_comments).update(**comment_counter_expressions())
+
+        self.stdout.write(self.style.SUCCESS('✅ Engagement counters reconciled'))
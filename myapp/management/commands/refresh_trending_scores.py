@@ -0,0 +1,74 @@
+"""
+Django management command to re-normalize trending scores.
+
+StudyEvent.trending_score is adjusted incrementally on every RSVP/invite
+change using the event's stored trending_decay. The decay itself depends on
+the current time, so this command recomputes it for every live event and
+rebuilds trending_score from the counts. Run it periodically (e.g. hourly
+from cron); get_trending_events re-applies the exact decay at read time, so
+scores only need to be roughly current to pick the right candidates.
+
+Usage:
+    python manage.py refresh_trending_scores
+    python manage.py refresh_trending_scores --recount
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from myapp.models import StudyEvent, trending_decay
+
+BATCH_SIZE = 500
+
+
+def _membership_count(through):
+    counts = (
+        through.objects.filter(studyevent=OuterRef('pk'))
+        .order_by()
+        .values('studyevent')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending decay and score of every live event'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Also recompute attendee_count/invite_count from the RSVP and invite tables',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        live = StudyEvent.objects.filter(end_time__gt=now)
+
+        if options['recount']:
+            recounted = live.update(
+                attendee_count=_membership_count(StudyEvent.attendees.through),
+                invite_count=_membership_count(StudyEvent.invited_friends.through),
+            )
+            self.stdout.write(f'🔢 Recounted RSVPs and invites for {recounted} event(s)')
+
+        events = list(live.values_list('id', 'time'))
+        for start in range(0, len(events), BATCH_SIZE):
+            batch = events[start:start + BATCH_SIZE]
+            decay = Case(
+                *[When(id=event_id, then=Value(trending_decay(time, now))) for event_id, time in batch],
+                output_field=FloatField(),
+            )
+            # Scores are rebuilt from the counts in the same UPDATE, so
+            # concurrent RSVPs are never overwritten
+            with transaction.atomic():
+                StudyEvent.objects.filter(id__in=[event_id for event_id, _ in batch]).update(
+                    trending_decay=decay,
+                    trending_score=(F('attendee_count') + F('invite_count')) * decay,
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Refreshed trending scores for {len(events)} event(s)'))
@@ -0,0 +1,42 @@
+"""
+Django management command to run the shared sentence embedding server.
+
+Loads the SentenceTransformer model once and serves embedding requests from
+the web workers over a Unix socket (settings.EMBEDDING_SERVICE_SOCKET).
+Semantic search is skipped while this server is not running.
+
+Usage:
+    python manage.py run_embedding_server
+    python manage.py run_embedding_server --socket /tmp/pinit-embeddings.sock
+"""
+
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.embedding_service import EmbeddingServer, MODEL_NAME, get_socket_path
+
+
+class Command(BaseCommand):
+    help = 'Run the shared sentence embedding server for semantic search'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=None,
+            help='Unix socket path (defaults to settings.EMBEDDING_SERVICE_SOCKET)',
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or get_socket_path()
+
+        try:
+            import sentence_transformers  # noqa: F401
+        except ImportError:
+            raise CommandError('sentence-transformers is not installed')
+
+        self.stdout.write(f'🧠 Loading {MODEL_NAME} and listening on {socket_path}...')
+        try:
+            asyncio.run(EmbeddingServer(socket_path=socket_path).serve())
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Embedding server stopped'))
@@ -0,0 +1,75 @@
+"""
+Django management command to deliver queued push notifications.
+
+Drains the NotificationOutbox concurrently through the pooled APNs sender,
+retrying transient failures with backoff (see myapp/notifications.py). Each
+priority lane (critical, default, bulk) runs its own loop and thread pool;
+--lane restricts a worker to some lanes, e.g. to give 'critical' a process
+of its own. Any number of workers can run side by side; rows are claimed
+atomically.
+
+Usage:
+    python manage.py run_notification_worker
+    python manage.py run_notification_worker --lane critical --concurrency 8
+    python manage.py run_notification_worker --once --purge-days 7
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myapp.notifications import LANES, NotificationDispatcher, purge_notifications
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued push notifications from the notification outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lane',
+            action='append',
+            choices=LANES,
+            help='Only deliver this lane (repeatable; defaults to all lanes)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=None,
+            help='Notifications delivered in parallel per lane (defaults to settings.NOTIFICATION_LANES)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Deliver everything that is due, then exit',
+        )
+        parser.add_argument(
+            '--purge-days',
+            type=int,
+            default=None,
+            help='First delete sent and failed notifications older than this many days',
+        )
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            purged = purge_notifications(timezone.now() - timedelta(days=options['purge_days']))
+            self.stdout.write(f'🧹 Purged {purged} delivered notification(s)')
+
+        lanes = [lane for lane in LANES if lane in (options['lane'] or LANES)]
+        dispatcher = NotificationDispatcher(lanes=lanes, concurrency=options['concurrency'])
+
+        if options['once']:
+            for lane, outcomes in dispatcher.drain().items():
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ {lane}: sent {outcomes['sent']}, retrying {outcomes['retry']}, failed {outcomes['failed']}"
+                ))
+            dispatcher.stop()
+            return
+
+        summary = ', '.join(f'{lane.name} x{lane.concurrency}' for lane in dispatcher.lanes)
+        self.stdout.write(f'📬 Delivering push notifications ({summary})...')
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            dispatcher.stop()
+            self.stdout.write(self.style.SUCCESS('Notification worker stopped'))
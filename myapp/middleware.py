@@ -0,0 +1,61 @@
+"""
+JWT authentication for WebSocket connections.
+
+The HTTP API authenticates with simplejwt access tokens; WebSocket clients
+pass the same token either as an "Authorization: Bearer <token>" header or,
+where the client can't set headers, as a ?token=<token> query parameter.
+A valid token sets scope["user"]; otherwise the session user resolved by
+AuthMiddlewareStack (usually AnonymousUser) is left in place.
+"""
+import logging
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.auth import AuthMiddlewareStack
+
+logger = logging.getLogger(__name__)
+
+
+def _raw_token(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            parts = value.decode("latin-1").split()
+            if len(parts) == 2 and parts[0].lower() == "bearer":
+                return parts[1]
+    tokens = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("token")
+    return tokens[0] if tokens else None
+
+
+@database_sync_to_async
+def get_jwt_user(raw_token):
+    """The active user an access token belongs to, or None if it isn't valid"""
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+    authentication = JWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed) as e:
+        logger.info("Rejected WebSocket token: %s", e)
+        return None
+    return user if user.is_active else None
+
+
+class JWTAuthMiddleware:
+    """Populate scope["user"] from a simplejwt access token"""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        raw_token = _raw_token(scope)
+        if raw_token:
+            user = await get_jwt_user(raw_token)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await self.inner(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """Session authentication with JWT tokens taking precedence"""
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
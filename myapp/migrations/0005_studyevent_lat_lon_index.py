@@ -0,0 +1,17 @@
+# Generated manually for the nearby events endpoint
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studyevent',
+            index=models.Index(fields=['latitude', 'longitude'], name='myapp_study_latitud_677bd8_idx'),
+        ),
+    ]
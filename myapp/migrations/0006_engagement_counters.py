@@ -0,0 +1,63 @@
+# Generated manually: denormalized engagement counters
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count_subquery(model, group_field, **filters):
+    counts = (
+        model.objects.filter(**{group_field: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(group_field)
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    StudyEvent = apps.get_model('myapp', 'StudyEvent')
+    EventComment = apps.get_model('myapp', 'EventComment')
+    EventLike = apps.get_model('myapp', 'EventLike')
+    EventShare = apps.get_model('myapp', 'EventShare')
+
+    StudyEvent.objects.update(
+        like_count=_count_subquery(EventLike, 'event', comment__isnull=True),
+        share_count=_count_subquery(EventShare, 'event'),
+        comment_count=_count_subquery(EventComment, 'event'),
+    )
+    EventComment.objects.update(
+        like_count=_count_subquery(EventLike, 'comment'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_studyevent_lat_lon_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventcomment',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='studyevent',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, help_text='Posts and replies'),
+        ),
+        migrations.AddField(
+            model_name='studyevent',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, help_text='Event-level likes (excludes comment likes)'),
+        ),
+        migrations.AddField(
+            model_name='studyevent',
+            name='share_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
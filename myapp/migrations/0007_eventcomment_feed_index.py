@@ -0,0 +1,17 @@
+# Generated manually for feed cursor pagination
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventcomment',
+            index=models.Index(fields=['event', 'parent', 'created_at'], name='myapp_event_event_i_084710_idx'),
+        ),
+    ]
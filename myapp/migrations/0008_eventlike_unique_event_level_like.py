@@ -0,0 +1,47 @@
+# Generated manually for the atomic like toggle
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_event_likes(apps, schema_editor):
+    """Keep the oldest event-level like per (event, user) and fix the counters"""
+    EventLike = apps.get_model('myapp', 'EventLike')
+    StudyEvent = apps.get_model('myapp', 'StudyEvent')
+
+    duplicates = (
+        EventLike.objects.filter(comment__isnull=True)
+        .values('event_id', 'user_id')
+        .annotate(n=Count('id'), keep=Min('id'))
+        .filter(n__gt=1)
+    )
+    affected_events = set()
+    for row in duplicates:
+        EventLike.objects.filter(
+            event_id=row['event_id'], user_id=row['user_id'], comment__isnull=True
+        ).exclude(id=row['keep']).delete()
+        affected_events.add(row['event_id'])
+
+    for event_id in affected_events:
+        StudyEvent.objects.filter(id=event_id).update(
+            like_count=EventLike.objects.filter(event_id=event_id, comment__isnull=True).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_eventcomment_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_event_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='eventlike',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('comment__isnull', True)),
+                fields=('event', 'user'),
+                name='unique_event_level_like',
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated manually: incrementally maintained trending scores
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def _count_subquery(through):
+    counts = (
+        through.objects.filter(studyevent=OuterRef('pk'))
+        .order_by()
+        .values('studyevent')
+        .annotate(c=Count('id'))
+        .values('c')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def backfill_trending(apps, schema_editor):
+    StudyEvent = apps.get_model('myapp', 'StudyEvent')
+
+    StudyEvent.objects.update(
+        attendee_count=_count_subquery(StudyEvent.attendees.through),
+        invite_count=_count_subquery(StudyEvent.invited_friends.through),
+    )
+
+    # Same formula as myapp.models.trending_decay
+    now = timezone.now()
+    events = list(StudyEvent.objects.only('id', 'time', 'attendee_count', 'invite_count'))
+    for event in events:
+        hours_since = (now - event.time).total_seconds() / 3600
+        event.trending_decay = max(0.1, 1.0 - (hours_since / 168))
+        event.trending_score = (event.attendee_count + event.invite_count) * event.trending_decay
+    StudyEvent.objects.bulk_update(events, ['trending_decay', 'trending_score'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_eventlike_unique_event_level_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyevent',
+            name='attendee_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='studyevent',
+            name='invite_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='studyevent',
+            name='trending_decay',
+            field=models.FloatField(default=1.0),
+        ),
+        migrations.AddField(
+            model_name='studyevent',
+            name='trending_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='studyevent',
+            index=models.Index(fields=['is_public', '-trending_score'], name='myapp_study_is_publ_588b13_idx'),
+        ),
+        migrations.RunPython(backfill_trending, migrations.RunPython.noop),
+    ]
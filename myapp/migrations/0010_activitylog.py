@@ -0,0 +1,84 @@
+# Generated manually: append-only community activity log
+
+import django.db.models.deletion
+import django.utils.timezone
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+
+
+# What get_recent_activity showed: the 10 latest upcoming events, up to 20 each of
+# the last 48 hours' comments, likes and shares, plus RSVPs, cut to 50 overall
+BACKFILL_EVENTS = 10
+BACKFILL_PER_TYPE = 20
+BACKFILL_TOTAL = 50
+
+
+def backfill_recent_activity(apps, schema_editor):
+    """Seed the log with what get_recent_activity used to show, and nothing older"""
+    ActivityLog = apps.get_model('myapp', 'ActivityLog')
+    StudyEvent = apps.get_model('myapp', 'StudyEvent')
+    EventComment = apps.get_model('myapp', 'EventComment')
+    EventLike = apps.get_model('myapp', 'EventLike')
+    EventShare = apps.get_model('myapp', 'EventShare')
+    Attendance = StudyEvent.attendees.through
+
+    now = django.utils.timezone.now()
+    since = now - timedelta(days=2)
+
+    def entry(activity_type, user, event, created_at):
+        return ActivityLog(
+            activity_type=activity_type,
+            user_id=user.id,
+            event_id=event.id,
+            username=user.username,
+            event_title=event.title,
+            created_at=created_at,
+        )
+
+    entries = []
+    # Events have no creation timestamp; use the start time as before
+    events = StudyEvent.objects.filter(end_time__gt=now).select_related('host').order_by('-time')
+    for event in events[:BACKFILL_EVENTS]:
+        entries.append(entry('create', event.host, event, event.time))
+    attendances = (
+        Attendance.objects.filter(studyevent__time__gte=since)
+        .select_related('studyevent', 'user')
+        .order_by('-studyevent__time')
+    )
+    for attendance in attendances[:BACKFILL_TOTAL]:
+        entries.append(entry('rsvp', attendance.user, attendance.studyevent, attendance.studyevent.time))
+    for model, activity_type in ((EventComment, 'comment'), (EventLike, 'like'), (EventShare, 'share')):
+        rows = model.objects.filter(created_at__gte=since).select_related('user', 'event').order_by('-created_at')
+        for row in rows[:BACKFILL_PER_TYPE]:
+            entries.append(entry(activity_type, row.user, row.event, row.created_at))
+
+    entries.sort(key=lambda log: log.created_at, reverse=True)
+    ActivityLog.objects.bulk_create(entries[:BACKFILL_TOTAL], batch_size=BACKFILL_TOTAL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_studyevent_trending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activity_type', models.CharField(choices=[('rsvp', 'RSVP'), ('comment', 'Comment'), ('like', 'Like'), ('share', 'Share'), ('create', 'Event created')], max_length=10)),
+                ('username', models.CharField(max_length=150)),
+                ('event_title', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_logs', to='myapp.studyevent')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_logs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='myapp_activ_created_db2534_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_recent_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated manually: priority lanes for notification delivery
+
+from django.db import migrations, models
+
+
+def assign_lanes(apps, schema_editor):
+    """Put queued rows in the lane enqueue_notification would have chosen"""
+    NotificationOutbox = apps.get_model('myapp', 'NotificationOutbox')
+    pending = NotificationOutbox.objects.filter(status__in=('pending', 'sending'))
+    pending.filter(notification_type__in=('event_cancellation', 'request_approved')).update(lane='critical')
+    pending.filter(
+        lane='default', notification_type__in=('event_invitation', 'rating_reminder', 'review_reminder')
+    ).update(lane='bulk')
+    for row in pending.filter(lane='default').only('id', 'user_ids'):
+        if len(row.user_ids) > 1:
+            NotificationOutbox.objects.filter(pk=row.pk).update(lane='bulk')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_notificationoutbox_coalescing'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='notificationoutbox',
+            name='myapp_notif_status_a9d6e2_idx',
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='lane',
+            field=models.CharField(choices=[('critical', 'Critical'), ('default', 'Default'), ('bulk', 'Bulk')], default='default', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='notificationoutbox',
+            index=models.Index(fields=['lane', 'status', 'next_attempt_at'], name='myapp_notif_lane_448a76_idx'),
+        ),
+        migrations.RunPython(assign_lanes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated manually: version counter for WebSocket event fragments
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_notificationoutbox_lane'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studyevent',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
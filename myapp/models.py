@@ -1,11 +1,12 @@
 import uuid
 import os
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 import json
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.files.storage import default_storage
 from django.conf import settings
@@ -232,6 +233,13 @@ class UserProfile(models.Model):
         # Return the final score
         return score
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored flag, so a changed certification invalidates certified-only searches
+        instance._loaded_is_certified = instance.__dict__.get('is_certified')
+        return instance
+    
     def __str__(self):
         return self.user.username
 
@@ -245,6 +253,21 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     instance.userprofile.save()
 
+# Certified-only searches depend on the hosts' certification: re-run them after
+# any change to it, whether from certify_user, the admin or a profile update
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_certified_search_cache(sender, instance, **kwargs):
+    from myapp.search_cache import bump_search_generation
+    is_certified = instance.__dict__.get('is_certified')
+    if kwargs.get('created') or kwargs['signal'] is post_delete:
+        changed = bool(is_certified)
+    else:
+        changed = is_certified != getattr(instance, '_loaded_is_certified', is_certified)
+    if changed:
+        transaction.on_commit(lambda: bump_search_generation(certified=True))
+    instance._loaded_is_certified = is_certified
+
 
 # Add this new model for UserInterest for more structured storage
 class UserInterest(models.Model):
@@ -379,6 +402,17 @@ class EventJoinRequest(models.Model):
 
 
 # Study Event Model - KEEP ONLY THIS ONE VERSION
+# Trending decay window: an event's engagement counts fully at its start time
+# and fades linearly over this many hours, down to TRENDING_MIN_DECAY
+TRENDING_DECAY_HOURS = 168
+TRENDING_MIN_DECAY = 0.1
+
+def trending_decay(event_time, now=None):
+    """Time decay factor applied to an event's RSVP + invite count"""
+    now = now or timezone.now()
+    hours_since = (now - event_time).total_seconds() / 3600
+    return max(TRENDING_MIN_DECAY, 1.0 - (hours_since / TRENDING_DECAY_HOURS))
+
 class StudyEvent(models.Model):
     EVENT_TYPE_CHOICES = [
         ('study', 'Study'),
@@ -387,6 +421,14 @@ class StudyEvent(models.Model):
         ('other', 'Other'),
     ]
 
+    # Columns only ever written with F() updates (increment_counter,
+    # update_trending_counts, bump_event_version); save() of a possibly stale
+    # instance leaves them alone
+    SAVE_EXCLUDED_FIELDS = (
+        'like_count', 'share_count', 'comment_count',
+        'attendee_count', 'invite_count', 'trending_score', 'version',
+    )
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255, db_index=True)
     description = models.TextField(blank=True, null=True)
@@ -408,6 +450,31 @@ class StudyEvent(models.Model):
     auto_matching_enabled = models.BooleanField(default=False, db_index=True)
     interest_tags = models.JSONField(default=list, blank=True, help_text="JSON array of interest tags for matching")
 
+    # Denormalized engagement counters, maintained with F() updates in the write
+    # paths (see increment_counter) and repaired by reconcile_engagement_counters
+    like_count = models.PositiveIntegerField(default=0, help_text="Event-level likes (excludes comment likes)")
+    share_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0, help_text="Posts and replies")
+
+    # Trending: RSVP/invite counts kept up to date by m2m_changed, and
+    # trending_score = (attendee_count + invite_count) * trending_decay, where
+    # the decay factor is refreshed periodically by refresh_trending_scores
+    attendee_count = models.PositiveIntegerField(default=0)
+    invite_count = models.PositiveIntegerField(default=0)
+    trending_decay = models.FloatField(default=1.0)
+    trending_score = models.FloatField(default=0.0)
+
+    # Bumped with bump_event_version on every broadcast change, so WebSocket
+    # clients can apply pushed event fragments in order
+    version = models.PositiveIntegerField(default=1)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored type, so a type change also invalidates the old type's searches
+        instance._loaded_event_type = instance.__dict__.get('event_type')
+        return instance
+
     @property
     def coordinate_lat(self):
         return self.latitude
@@ -441,7 +508,21 @@ class StudyEvent(models.Model):
     def save(self, *args, **kwargs):
         """Override save to run validation"""
         self.clean()
+        self.trending_decay = trending_decay(self.time)
+        if self._state.adding or args or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+            self.trending_score = (self.attendee_count + self.invite_count) * self.trending_decay
+            super().save(*args, **kwargs)
+            return
+
+        kwargs['update_fields'] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.SAVE_EXCLUDED_FIELDS
+        ]
         super().save(*args, **kwargs)
+        # The decay may have changed with the time; rescore from the stored counts
+        StudyEvent.objects.filter(pk=self.pk).update(
+            trending_score=(models.F('attendee_count') + models.F('invite_count')) * models.F('trending_decay')
+        )
     
     def get_all_invitees(self):
         """Get all invited users including direct and auto-matched"""
@@ -480,9 +561,94 @@ class StudyEvent(models.Model):
             models.Index(fields=['host', 'is_public']),
             models.Index(fields=['auto_matching_enabled', 'is_public']),
             models.Index(fields=['event_type', 'is_public']),
+            # Bounding-box lookups for nearby events
+            models.Index(fields=['latitude', 'longitude']),
+            # Trending candidates
+            models.Index(fields=['is_public', '-trending_score']),
         ]
 
 
+# Invalidate cached searches whenever an event is written or removed
+@receiver(post_save, sender=StudyEvent)
+@receiver(post_delete, sender=StudyEvent)
+def invalidate_event_search_cache(sender, instance, **kwargs):
+    from myapp.search_cache import bump_search_generation
+    # __dict__: a deferred event_type can't be loaded after a delete, and is
+    # never written by a save
+    event_type = instance.__dict__.get('event_type')
+    event_types = {event_type, getattr(instance, '_loaded_event_type', None)}
+    transaction.on_commit(lambda: bump_search_generation(event_types=event_types))
+    instance._loaded_event_type = event_type
+
+@receiver(post_save, sender=StudyEvent)
+@receiver(post_delete, sender=StudyEvent)
+def invalidate_event_detail_on_event_change(sender, instance, **kwargs):
+    # After commit, or a concurrent read could re-cache the old detail
+    from myapp.event_detail_cache import invalidate_event_detail
+    event_id = instance.id
+    transaction.on_commit(lambda: invalidate_event_detail(event_id))
+
+@receiver(m2m_changed, sender=StudyEvent.attendees.through)
+@receiver(m2m_changed, sender=StudyEvent.invited_friends.through)
+def invalidate_event_detail_on_rsvp(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    from myapp.event_detail_cache import invalidate_event_detail
+    if reverse:
+        # instance is the user; pk_set holds the events (None on clear)
+        event_ids = pk_set or []
+    else:
+        event_ids = [instance.id]
+    event_ids = list(event_ids)
+    transaction.on_commit(lambda: invalidate_event_detail(*event_ids))
+
+@receiver(m2m_changed, sender=StudyEvent.attendees.through)
+@receiver(m2m_changed, sender=StudyEvent.invited_friends.through)
+def update_trending_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep attendee_count/invite_count and trending_score in step with RSVP and
+    invite changes. remove() and clear() don't say which rows actually
+    existed, so those are counted in the pre_ step and applied in post_.
+    """
+    from collections import Counter
+
+    field = 'attendee_count' if sender is StudyEvent.attendees.through else 'invite_count'
+
+    if action in ('pre_remove', 'pre_clear'):
+        rows = sender.objects.filter(**{'user_id' if reverse else 'studyevent_id': instance.pk})
+        if pk_set is not None:
+            rows = rows.filter(**{'studyevent_id__in' if reverse else 'user_id__in': pk_set})
+        instance._trending_removed = Counter(rows.values_list('studyevent_id', flat=True))
+        return
+
+    if action == 'post_add':
+        # pk_set only holds the rows that were actually added
+        deltas = Counter(pk_set) if reverse else {instance.pk: len(pk_set)}
+    elif action in ('post_remove', 'post_clear'):
+        deltas = {event_id: -n for event_id, n in getattr(instance, '_trending_removed', {}).items()}
+        instance._trending_removed = {}
+    else:
+        return
+
+    for event_id, delta in deltas.items():
+        if not delta:
+            continue
+        queryset = StudyEvent.objects.filter(pk=event_id)
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{
+            field: models.F(field) + delta,
+            'trending_score': models.F('trending_score') + delta * models.F('trending_decay'),
+        })
+
+@receiver(post_save, sender=EventInvitation)
+@receiver(post_delete, sender=EventInvitation)
+def invalidate_event_detail_on_invitation(sender, instance, **kwargs):
+    from myapp.event_detail_cache import invalidate_event_detail
+    event_id = instance.event_id
+    transaction.on_commit(lambda: invalidate_event_detail(event_id))
+
+
 # Event interaction models
 class EventComment(models.Model):
     """
@@ -507,6 +673,14 @@ class EventComment(models.Model):
         blank=True, 
         related_name='replies'
     )
+    # Denormalized like counter, see increment_counter
+    like_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Feed pagination: posts (parent NULL) and replies of a post by time
+            models.Index(fields=['event', 'parent', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Comment by {self.user.username} on {self.event.title}"
@@ -538,6 +712,14 @@ class EventLike(models.Model):
     class Meta:
         # Prevent multiple likes from same user on same object
         unique_together = ('event', 'user', 'comment')
+        constraints = [
+            # unique_together doesn't cover event-level likes: NULL comments never collide
+            models.UniqueConstraint(
+                fields=['event', 'user'],
+                condition=models.Q(comment__isnull=True),
+                name='unique_event_level_like',
+            ),
+        ]
 
     def __str__(self):
         if self.comment:
@@ -589,6 +771,97 @@ class EventImage(models.Model):
     def __str__(self):
         return f"Image for comment {self.comment.id} in {self.comment.event.title}"
 
+def increment_counter(model, pk, field, delta=1):
+    """
+    Atomically adjust a denormalized counter column with an F() expression.
+    Decrements never take the counter below zero.
+    """
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: models.F(field) + delta})
+
+def bump_event_version(event):
+    """Atomically increment an event's version and load the new value onto it"""
+    StudyEvent.objects.filter(pk=event.pk).update(version=models.F('version') + 1)
+    event.version = StudyEvent.objects.values_list('version', flat=True).get(pk=event.pk)
+    return event.version
+
+class ActivityLog(models.Model):
+    """
+    Append-only community activity feed (RSVPs, posts, likes, shares and new
+    events), written by the write paths so get_recent_activity is one
+    indexed read. Usernames and titles are copied in so reads never join.
+    """
+    ACTIVITY_TYPES = [
+        ('rsvp', 'RSVP'),
+        ('comment', 'Comment'),
+        ('like', 'Like'),
+        ('share', 'Share'),
+        ('create', 'Event created'),
+    ]
+
+    activity_type = models.CharField(max_length=10, choices=ACTIVITY_TYPES)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_logs')
+    event = models.ForeignKey(StudyEvent, on_delete=models.CASCADE, related_name='activity_logs')
+    username = models.CharField(max_length=150)
+    event_title = models.CharField(max_length=255)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    MESSAGES = {
+        'rsvp': '{username} joined {event_title}',
+        'comment': '{username} commented on {event_title}',
+        'like': '{username} liked {event_title}',
+        'share': '{username} shared {event_title}',
+        'create': '{username} created {event_title}',
+    }
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the community feed
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+    @classmethod
+    def entry(cls, activity_type, user, event):
+        """Unsaved log row, for bulk_create"""
+        return cls(
+            activity_type=activity_type,
+            user_id=user.id,
+            event_id=event.id,
+            username=user.username,
+            event_title=event.title,
+        )
+
+    @classmethod
+    def record(cls, activity_type, user, event):
+        entry = cls.entry(activity_type, user, event)
+        entry.save()
+        return entry
+
+    @property
+    def message(self):
+        return self.MESSAGES[self.activity_type].format(username=self.username, event_title=self.event_title)
+
+    def __str__(self):
+        return self.message
+
+@receiver(post_save, sender=StudyEvent)
+def log_event_created(sender, instance, created, **kwargs):
+    if created:
+        ActivityLog.record('create', instance.host, instance)
+
+@receiver(m2m_changed, sender=StudyEvent.attendees.through)
+def log_rsvp_activity(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    # pk_set only holds the RSVPs that were actually added
+    if reverse:
+        entries = [ActivityLog.entry('rsvp', instance, event) for event in StudyEvent.objects.filter(pk__in=pk_set).only('id', 'title')]
+    else:
+        entries = [ActivityLog.entry('rsvp', user, instance) for user in User.objects.filter(pk__in=pk_set).only('id', 'username')]
+    ActivityLog.objects.bulk_create(entries)
+
 # Add this new model to track declined invitations
 class DeclinedInvitation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='declined_invitations')
@@ -618,6 +891,53 @@ class Device(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.device_type} device"
 
+class NotificationOutbox(models.Model):
+    """
+    Durable queue of push notifications. Request handlers only insert a row
+    (in their own transaction); myapp/notifications.py delivers it to APNs,
+    retrying transient failures with exponential backoff.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    LANE_CHOICES = [
+        ('critical', 'Critical'),
+        ('default', 'Default'),
+        ('bulk', 'Bulk'),
+    ]
+
+    user_ids = models.JSONField(default=list)
+    notification_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # Set on retries: only these device tokens still need the notification
+    device_tokens = models.JSONField(null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    lane = models.CharField(max_length=10, choices=LANE_CHOICES, default='default')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Same-type notifications for one user and event merge into one digest
+    coalesce_key = models.CharField(max_length=200, blank=True)
+    coalesced_count = models.PositiveIntegerField(default=1)
+    claimed_by = models.CharField(max_length=32, blank=True, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Each lane's workers claim due rows in next_attempt_at order
+            models.Index(fields=['lane', 'status', 'next_attempt_at']),
+            models.Index(fields=['coalesce_key', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.notification_type} -> {self.user_ids} ({self.status})"
+
 # User reputation models for implementing Bandura's social learning theory
 class UserRating(models.Model):
     """
@@ -0,0 +1,580 @@
+"""
+Push notification outbox and dispatcher.
+
+send_push_notification (myapp.views) only inserts a NotificationOutbox row in
+the caller's transaction, so request handlers never wait on APNs. Rows are
+delivered by `python manage.py run_notification_worker`, which claims due
+rows in batches and sends them concurrently through the pooled APNs sender
+(myapp/push.py). Transient failures (network errors, 429 and 5xx from APNs)
+are retried with exponential backoff up to MAX_ATTEMPTS, and only the device
+tokens that failed are retried. Tokens APNs reports as BadDeviceToken or
+Unregistered are deactivated so they are not sent to again; any other
+rejection (BadTopic, InvalidProviderToken, ...) fails the row. Every push of
+a row carries the same apns-collapse-id, so a device that gets a retry of a
+push it already received shows it once.
+
+Rows are split into priority lanes (critical, default, bulk), each drained
+by its own loop and thread pool with an optional rate limit, so cancellations
+never queue behind a large invitation fan-out.
+
+RSVPs, join requests and event edits for the same user and event are
+coalesced: the first push goes out immediately, and the ones that follow
+within NOTIFICATION_COALESCE_WINDOW are merged into a single digest
+("5 people want to join ...") delivered when the window closes.
+
+With NOTIFICATION_EMBEDDED_DISPATCHER enabled (the default) every web process
+also runs a dispatcher thread that is woken when a request commits, so a
+deployment without the worker keeps delivering. Rows are claimed with an
+atomic UPDATE, so any number of dispatchers and workers can drain the table.
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from myapp.models import Device, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+# Rows claimed per round trip
+CLAIM_BATCH_SIZE = 50
+
+# A row stuck in 'sending' this long belongs to a dead worker and is reclaimed
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+# Delivery lanes, highest priority first. Each lane is claimed by its own
+# loop with its own thread pool (settings.NOTIFICATION_LANES), so a large
+# auto-match fan-out in 'bulk' never delays a cancellation in 'critical'.
+LANES = ('critical', 'default', 'bulk')
+CRITICAL_TYPES = {'event_cancellation', 'request_approved'}
+BULK_TYPES = {'event_invitation', 'rating_reminder', 'review_reminder'}
+
+# Rate-limited lanes send in chunks this size, each waiting for its share of
+# the rate. Every lane also has its own stream budget on the shared APNs
+# connection (NOTIFICATION_LANES[lane]['streams']), so bulk sends can never
+# hold the streams a critical notification needs.
+RATE_LIMITED_CHUNK_SIZE = 50
+
+# APNs reasons meaning the token will never work again; the app registers a
+# fresh token (reactivating the device) on its next launch
+DEAD_TOKEN_REASONS = {'BadDeviceToken', 'Unregistered'}
+
+JOIN_REQUEST_TYPES = (
+    'join_request',
+    'event_join_request',
+    'event_join_request_invited',
+    'event_join_request_auto_matched',
+)
+
+# Notification types merged per user and event within the coalescing
+# window, mapped to the payload field naming who triggered them
+COALESCED_TYPES = {
+    'new_attendee': 'attendee_name',
+    'event_update': None,
+    **{notification_type: 'requester' for notification_type in JOIN_REQUEST_TYPES},
+}
+
+# Names kept in a digest's payload['actors']
+MAX_DIGEST_ACTORS = 10
+
+# Retry schedule: 30s, 1m, 2m, 4m, ... capped at an hour
+MAX_ATTEMPTS = 8
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+
+
+class PermanentDeliveryError(Exception):
+    """Delivery can't succeed by retrying (e.g. APNs isn't configured)"""
+
+
+def notification_text(notification_type, data):
+    """Title and message shown for a notification type; count > 1 makes a digest"""
+    title = "PinIt"
+    message = "You have a new notification"
+    count = data.get('count', 1)
+
+    if notification_type == 'event_invitation':
+        event_title = data.get('event_title', 'an event')
+        from_user = data.get('from_user', 'Someone')
+        message = f"{from_user} invited you to {event_title}"
+        title = "Event Invitation"
+    elif notification_type == 'event_update':
+        event_title = data.get('event_title', 'an event')
+        if count > 1:
+            message = f"{event_title} has been updated {count} times"
+        else:
+            message = f"{event_title} has been updated"
+        title = "Event Updated"
+    elif notification_type == 'event_cancellation':
+        event_title = data.get('event_title', 'an event')
+        message = f"{event_title} has been cancelled"
+        title = "Event Cancelled"
+    elif notification_type == 'new_attendee':
+        event_title = data.get('event_title', 'your event')
+        attendee_name = data.get('attendee_name', 'Someone')
+        if count > 1:
+            message = f"{count} people joined {event_title}"
+            title = "New Attendees"
+        else:
+            message = f"{attendee_name} joined {event_title}"
+            title = "New Attendee"
+    elif notification_type in JOIN_REQUEST_TYPES:
+        event_title = data.get('event_title', 'your event')
+        requester_name = data.get('requester_name') or data.get('requester', 'Someone')
+        if count > 1:
+            message = f"{count} people want to join {event_title}"
+            title = "Join Requests"
+        else:
+            message = f"{requester_name} wants to join {event_title}"
+            title = "Join Request"
+    elif notification_type == 'request_approved':
+        event_title = data.get('event_title', 'an event')
+        message = f"Your request to join {event_title} was approved!"
+        title = "Request Approved"
+    elif notification_type == 'new_rating':
+        from_user = data.get('from_user', 'Someone')
+        rating = data.get('rating', 5)
+        message = f"{from_user} rated you {rating} stars"
+        title = "New Rating"
+    elif notification_type == 'trust_level_change':
+        level_title = data.get('level_title', 'a new level')
+        message = f"Congratulations! You've reached {level_title}"
+        title = "Level Up!"
+    elif notification_type == 'rating_reminder':
+        event_title = data.get('event_title', 'an event')
+        message = f"Rate attendees from {event_title}"
+        title = "Rate Event"
+    elif notification_type == 'review_reminder':
+        event_title = data.get('event_title', 'an event')
+        reviewable_count = data.get('reviewable_count', 0)
+        if reviewable_count > 1:
+            message = f"Rate {reviewable_count} attendees from {event_title}"
+        else:
+            message = f"Rate attendees from {event_title}"
+        title = "Rate Attendees"
+
+    return title, message
+
+
+# ---------------------------------------------------------------------------
+# Enqueueing
+# ---------------------------------------------------------------------------
+
+def notification_lane(notification_type, user_count=1):
+    """Lane a notification is delivered in"""
+    if notification_type in CRITICAL_TYPES:
+        return 'critical'
+    if notification_type in BULK_TYPES or user_count > 1:
+        return 'bulk'
+    return 'default'
+
+
+def coalesce_window():
+    """Seconds same-type notifications for one user are merged for (0 disables)"""
+    return getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 60)
+
+
+def _coalesce_key(user_ids, notification_type, data):
+    if notification_type not in COALESCED_TYPES or len(user_ids) != 1:
+        return ''
+    return f"{notification_type}:{user_ids[0]}:{data.get('event_id', '')}"
+
+
+def _actor(notification_type, data):
+    field = COALESCED_TYPES[notification_type]
+    if field is None:
+        return None
+    return data.get(field) or data.get('requester_name')
+
+
+def _merge_into_pending(key, notification_type, payload):
+    """
+    Fold a notification into the undelivered digest for the same key.
+    Returns the digest, or None when there is nothing to merge into.
+    """
+    pending = (
+        NotificationOutbox.objects.select_for_update()
+        .filter(coalesce_key=key, status='pending', attempts=0)
+        .order_by('-id')
+        .first()
+    )
+    if pending is None:
+        return None
+
+    actors = pending.payload.get('actors') or [_actor(notification_type, pending.payload)]
+    actor = _actor(notification_type, payload)
+    if actor not in actors:
+        actors.append(actor)
+    merged = {**payload, 'actors': [a for a in actors if a][:MAX_DIGEST_ACTORS]}
+
+    # A worker may claim the row meanwhile; then the caller starts a new one
+    merged_rows = NotificationOutbox.objects.filter(pk=pending.pk, status='pending', attempts=0).update(
+        payload=merged,
+        coalesced_count=F('coalesced_count') + 1,
+    )
+    return pending if merged_rows else None
+
+
+def _digest_available_at(key, window):
+    """
+    The first notification for a key goes out immediately; later ones wait
+    until `window` after the previous one so they collect into a digest.
+    """
+    now = timezone.now()
+    previous = (
+        NotificationOutbox.objects.filter(coalesce_key=key, created_at__gte=now - timedelta(seconds=window))
+        .order_by('-created_at')
+        .values_list('created_at', flat=True)
+        .first()
+    )
+    return previous + timedelta(seconds=window) if previous else now
+
+
+def enqueue_notification(user_ids, notification_type, **data):
+    """
+    Queue a notification for delivery. The row commits with the caller's
+    transaction; the embedded dispatcher is woken once it has.
+
+    Single-user notifications of a COALESCED_TYPES type merge with an
+    undelivered one for the same user and event, so a burst of RSVPs or
+    join requests becomes one "5 people joined ..." push per window.
+    """
+    user_ids = list(user_ids)
+    payload = {'type': notification_type, **data}
+    key = _coalesce_key(user_ids, notification_type, data)
+    window = coalesce_window() if key else 0
+
+    with transaction.atomic():
+        notification = _merge_into_pending(key, notification_type, payload) if window else None
+        if notification is None:
+            notification = NotificationOutbox.objects.create(
+                user_ids=user_ids,
+                notification_type=notification_type,
+                payload=payload,
+                coalesce_key=key,
+                lane=notification_lane(notification_type, len(user_ids)),
+                next_attempt_at=_digest_available_at(key, window) if window else timezone.now(),
+            )
+
+    transaction.on_commit(wake_dispatcher)
+    return notification
+
+
+# ---------------------------------------------------------------------------
+# Delivery
+# ---------------------------------------------------------------------------
+
+def _is_transient(result):
+    return result.status == 0 or result.status == 429 or result.status >= 500
+
+
+def _is_rejected(result):
+    """A failure retrying won't fix, on a token that isn't dead"""
+    return not result.ok and not _is_transient(result) and result.reason not in DEAD_TOKEN_REASONS
+
+
+def collapse_id(notification):
+    """apns-collapse-id shared by every attempt at delivering a row"""
+    return f'outbox-{notification.id}'
+
+
+def deliver_notification(notification, rate_limiter=None):
+    """
+    Send one outbox row to all its users' active devices: one device query,
+    one payload build, and every token multiplexed over the shared APNs
+    connection. Returns a PushResult per iOS token.
+
+    With a rate_limiter the tokens go out in chunks, each waiting for its
+    share of the lane's rate.
+    """
+    from myapp.push import get_apns_sender, build_alert_payload
+
+    devices = Device.objects.filter(user_id__in=notification.user_ids, is_active=True)
+    if notification.device_tokens is not None:
+        devices = devices.filter(token__in=notification.device_tokens)
+    devices = list(devices.values_list('token', 'device_type'))
+
+    if any(device_type == 'android' for _, device_type in devices):
+        # Implementation for FCM (Android) would go here
+        logger.info("Android push notifications not yet implemented")
+
+    ios_tokens = [token for token, device_type in devices if device_type == 'ios']
+    if not ios_tokens:
+        return []
+
+    sender = get_apns_sender()
+    if sender is None:
+        raise PermanentDeliveryError("APNs is not configured")
+
+    data = notification.payload
+    if notification.coalesced_count > 1:
+        data = {**data, 'count': notification.coalesced_count}
+    title, message = notification_text(notification.notification_type, data)
+    payload = build_alert_payload(title, message, notification.notification_type, data)
+    options = {'lane': notification.lane, 'collapse_id': collapse_id(notification)}
+    if rate_limiter is None:
+        results = sender.send_many(ios_tokens, payload, **options)
+    else:
+        results = []
+        for start in range(0, len(ios_tokens), RATE_LIMITED_CHUNK_SIZE):
+            chunk = ios_tokens[start:start + RATE_LIMITED_CHUNK_SIZE]
+            rate_limiter.acquire(len(chunk))
+            results.extend(sender.send_many(chunk, payload, **options))
+
+    for result in results:
+        if not result.ok:
+            logger.warning(
+                "APNs rejected %s for %s...: %s %s",
+                notification.notification_type, result.device_token[:12], result.status, result.reason
+            )
+    return results
+
+
+def deactivate_dead_tokens(results):
+    """Mark devices APNs reported as invalid inactive, in one UPDATE"""
+    tokens = [result.device_token for result in results if result.reason in DEAD_TOKEN_REASONS]
+    if not tokens:
+        return 0
+    # update() skips auto_now; prune_stale_devices keys off updated_at
+    return Device.objects.filter(token__in=tokens, is_active=True).update(
+        is_active=False, updated_at=timezone.now()
+    )
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt, with up to 25% jitter"""
+    delay = min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY)
+    return delay * (1 + random.random() / 4)
+
+
+def process_notification(notification, rate_limiter=None):
+    """Deliver a claimed row and record the outcome"""
+    retry_tokens, error, permanent = [], '', False
+    try:
+        results = deliver_notification(notification, rate_limiter)
+        deactivated = deactivate_dead_tokens(results)
+        if deactivated:
+            logger.info("Deactivated %d invalid device token(s)", deactivated)
+        retry_tokens = [result.device_token for result in results if _is_transient(result)]
+        rejected = [result for result in results if _is_rejected(result)]
+        errors = []
+        if retry_tokens:
+            errors.append(f"{len(retry_tokens)} of {len(results)} device(s) failed transiently")
+        if rejected:
+            reasons = sorted({f"{result.status} {result.reason or ''}".strip() for result in rejected})
+            errors.append(f"{len(rejected)} of {len(results)} device(s) rejected: {', '.join(reasons)}")
+            permanent = not retry_tokens
+        error = '; '.join(errors)
+    except PermanentDeliveryError as e:
+        error, permanent = str(e), True
+    except Exception as e:
+        # Devices that already got it collapse the resend (see collapse_id)
+        logger.exception("Push notification %s failed", notification.id)
+        error = f"{type(e).__name__}: {e}"
+        retry_tokens = notification.device_tokens
+
+    now = timezone.now()
+    # Only the claim holder may record the outcome
+    row = NotificationOutbox.objects.filter(pk=notification.pk, claimed_by=notification.claimed_by)
+
+    if not error:
+        row.update(status='sent', sent_at=now, last_error='', claimed_by='')
+        return 'sent'
+    if permanent or notification.attempts >= MAX_ATTEMPTS:
+        row.update(status='failed', last_error=error, claimed_by='')
+        return 'failed'
+    row.update(
+        status='pending',
+        device_tokens=retry_tokens,
+        next_attempt_at=now + timedelta(seconds=retry_delay(notification.attempts)),
+        last_error=error,
+        claimed_by='',
+    )
+    return 'retry'
+
+
+def claim_notifications(lane, limit=CLAIM_BATCH_SIZE):
+    """Atomically claim up to `limit` due rows of a lane for this caller"""
+    now = timezone.now()
+    due = Q(lane=lane) & (
+        Q(status='pending', next_attempt_at__lte=now)
+        | Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT)
+    )
+    ids = list(
+        NotificationOutbox.objects.filter(due)
+        .order_by('next_attempt_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    # Rows another worker claimed in the meantime no longer match `due`
+    claim = uuid.uuid4().hex
+    NotificationOutbox.objects.filter(due, id__in=ids).update(
+        status='sending',
+        claimed_by=claim,
+        claimed_at=now,
+        attempts=F('attempts') + 1,
+    )
+    return list(NotificationOutbox.objects.filter(claimed_by=claim))
+
+
+def purge_notifications(older_than):
+    """Delete sent and failed rows created before `older_than`; returns the count"""
+    deleted, _ = NotificationOutbox.objects.filter(
+        status__in=('sent', 'failed'), created_at__lt=older_than
+    ).delete()
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# Dispatcher
+# ---------------------------------------------------------------------------
+
+class RateLimiter:
+    """Token bucket allowing `rate` device sends per second"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._allowance = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Block until `count` sends fit under the rate"""
+        needed = min(count, self.rate)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate)
+                self._last = now
+                if self._allowance >= needed:
+                    # Bursts larger than the rate are paid back by later callers
+                    self._allowance -= count
+                    return
+                wait = (needed - self._allowance) / self.rate
+            time.sleep(wait)
+
+
+def lane_config(lane):
+    """
+    {'concurrency': n, 'rate_limit': sends per second or None, 'streams':
+    APNs streams the lane may hold at once or None} for a lane
+    """
+    defaults = {'concurrency': 4, 'rate_limit': None, 'streams': None}
+    return {**defaults, **getattr(settings, 'NOTIFICATION_LANES', {}).get(lane, {})}
+
+
+class NotificationLane:
+    """One lane's claim loop, thread pool and rate limiter"""
+
+    def __init__(self, name, concurrency=None, rate_limit=None):
+        config = lane_config(name)
+        self.name = name
+        self.concurrency = concurrency or config['concurrency']
+        rate_limit = rate_limit or config['rate_limit']
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix=f'push-{name}')
+        self.wakeup = threading.Event()
+
+    def _process(self, notification):
+        try:
+            return process_notification(notification, self.rate_limiter)
+        finally:
+            close_old_connections()
+
+    def drain(self, stop):
+        outcomes = {'sent': 0, 'retry': 0, 'failed': 0}
+        while not stop.is_set():
+            batch = claim_notifications(self.name, max(CLAIM_BATCH_SIZE, self.concurrency))
+            if not batch:
+                break
+            for outcome in self.executor.map(self._process, batch):
+                outcomes[outcome] += 1
+        return outcomes
+
+
+class NotificationDispatcher:
+    """Claims due outbox rows and delivers them, one loop per lane"""
+
+    def __init__(self, lanes=LANES, concurrency=None, poll_interval=None):
+        self.lanes = [NotificationLane(name, concurrency) for name in lanes]
+        self.poll_interval = poll_interval or getattr(settings, 'NOTIFICATION_POLL_INTERVAL', 5.0)
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def drain(self):
+        """Deliver every due row in all lanes at once; returns outcome counts per lane"""
+        with ThreadPoolExecutor(len(self.lanes)) as pool:
+            futures = {lane.name: pool.submit(self._drain_lane, lane) for lane in self.lanes}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _drain_lane(self, lane):
+        try:
+            return lane.drain(self._stop)
+        finally:
+            close_old_connections()
+
+    def _run_lane(self, lane):
+        while not self._stop.is_set():
+            try:
+                lane.drain(self._stop)
+            except Exception:
+                logger.exception("Notification dispatch failed in lane %s", lane.name)
+            finally:
+                close_old_connections()
+            lane.wakeup.wait(self.poll_interval)
+            lane.wakeup.clear()
+
+    def start(self):
+        """Run every lane's loop on a daemon thread (idempotent)"""
+        with self._lock:
+            if self._threads and all(thread.is_alive() for thread in self._threads):
+                return
+            self._threads = [
+                threading.Thread(target=self._run_lane, args=(lane,), name=f'notifications-{lane.name}', daemon=True)
+                for lane in self.lanes
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def run_forever(self):
+        self.start()
+        while not self._stop.is_set():
+            self._stop.wait(1.0)
+
+    def wake(self):
+        for lane in self.lanes:
+            lane.wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self.wake()
+        for lane in self.lanes:
+            lane.executor.shutdown(wait=True)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def wake_dispatcher():
+    """Start or wake this process's embedded dispatcher, if enabled"""
+    global _dispatcher
+    if not getattr(settings, 'NOTIFICATION_EMBEDDED_DISPATCHER', True):
+        return
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher()
+    _dispatcher.start()
+    _dispatcher.wake()
@@ -0,0 +1,367 @@
+"""
+Long-lived Apple Push Notification service (APNs) sender.
+
+One APNsSender per topic/environment keeps a single HTTP/2 connection to
+APNs open on a background event-loop thread and reuses a signed provider
+token (ES256 JWT) for up to PROVIDER_TOKEN_TTL. Sending a notification is a
+single stream on that connection, and send_many multiplexes a batch of
+notifications concurrently instead of paying a TLS handshake and a JWT
+signature per device. Each delivery lane can be given its own stream
+budget on the connection (NOTIFICATION_LANES[lane]['streams']), so a bulk
+fan-out never occupies the streams a critical notification needs.
+
+Configuration comes from settings.PUSH_NOTIFICATIONS_SETTINGS. The .p8 key
+(APNS_AUTH_KEY contents or APNS_AUTH_KEY_PATH) is parsed once per process
+into an in-memory signing key shared by every sender; MyappConfig.ready
+validates it at startup. Setting
+APNS_ENDPOINT (e.g. http://127.0.0.1:8443) points the sender at a local mock
+APNs server; plain http:// endpoints use HTTP/2 with prior knowledge (h2c).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+APNS_ENDPOINTS = {
+    'production': 'https://api.push.apple.com',
+    'sandbox': 'https://api.sandbox.push.apple.com',
+}
+
+# APNs rejects provider tokens older than an hour and throttles refreshes
+# more frequent than every 20 minutes
+PROVIDER_TOKEN_TTL = 50 * 60
+
+# Per-request timeout and the cap on streams in flight per connection
+REQUEST_TIMEOUT = 10.0
+MAX_CONCURRENT_STREAMS = 100
+
+
+def lane_stream_limits():
+    """{lane: max streams in flight} from settings.NOTIFICATION_LANES"""
+    lanes = getattr(settings, 'NOTIFICATION_LANES', {})
+    return {lane: config['streams'] for lane, config in lanes.items() if config.get('streams')}
+
+
+def _push_settings():
+    return getattr(settings, 'PUSH_NOTIFICATIONS_SETTINGS', {})
+
+
+def load_auth_key(key_or_path):
+    """Return the .p8 key as PEM text, given either the key itself or a path to it"""
+    if not key_or_path:
+        return None
+    if key_or_path.lstrip().startswith('-----BEGIN'):
+        # Keys pasted into a single-line env var often carry escaped newlines
+        if '\n' not in key_or_path and '\\n' in key_or_path:
+            key_or_path = key_or_path.replace('\\n', '\n')
+        return key_or_path
+    with open(key_or_path) as f:
+        return f.read()
+
+
+class APNsCredentials:
+    """The parsed ES256 signing key with its key and team IDs, held in memory"""
+
+    def __init__(self, signing_key, key_id, team_id):
+        self.signing_key = signing_key
+        self.key_id = key_id
+        self.team_id = team_id
+
+
+class APNsConfigurationError(Exception):
+    pass
+
+
+def load_credentials(config=None):
+    """
+    Parse the provider-token credentials from PUSH_NOTIFICATIONS_SETTINGS.
+    Returns None when APNs isn't configured at all; raises
+    APNsConfigurationError when it is configured but unusable.
+    """
+    config = _push_settings() if config is None else config
+    key_or_path = config.get('APNS_AUTH_KEY') or config.get('APNS_AUTH_KEY_PATH', '')
+    key_id = config.get('APNS_AUTH_KEY_ID', '')
+    team_id = config.get('APNS_TEAM_ID', '')
+    if not key_or_path and not key_id and not team_id:
+        return None
+    if not key_or_path or not key_id or not team_id:
+        raise APNsConfigurationError(
+            f"APNs configuration incomplete: auth_key={'set' if key_or_path else 'missing'}, "
+            f"auth_key_id={key_id or 'missing'}, team_id={team_id or 'missing'}"
+        )
+
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+    try:
+        signing_key = load_pem_private_key(load_auth_key(key_or_path).encode(), password=None)
+    except (OSError, ValueError, TypeError) as e:
+        raise APNsConfigurationError(f"APNs auth key could not be loaded: {e}")
+    if not isinstance(signing_key, ec.EllipticCurvePrivateKey):
+        raise APNsConfigurationError("APNs auth key is not an EC (ES256) private key")
+    return APNsCredentials(signing_key, key_id, team_id)
+
+
+_credentials = None
+_credentials_loaded = False
+_credentials_lock = threading.Lock()
+
+
+def get_credentials():
+    """Credentials parsed once per process, or None when APNs is unconfigured or invalid"""
+    global _credentials, _credentials_loaded
+    if not _credentials_loaded:
+        with _credentials_lock:
+            if not _credentials_loaded:
+                try:
+                    _credentials = load_credentials()
+                except APNsConfigurationError as e:
+                    logger.error("%s", e)
+                    _credentials = None
+                _credentials_loaded = True
+    return _credentials
+
+
+def validate_configuration():
+    """Parse the APNs credentials at startup so a bad key is reported at boot"""
+    credentials = get_credentials()
+    if credentials is None:
+        logger.warning("APNs is not configured; push notifications will not be delivered")
+    return credentials is not None
+
+
+class PushResult:
+    """Outcome of one notification; reason is the APNs error reason, if any"""
+
+    __slots__ = ('device_token', 'status', 'reason', 'apns_id')
+
+    def __init__(self, device_token, status, reason=None, apns_id=None):
+        self.device_token = device_token
+        self.status = status
+        self.reason = reason
+        self.apns_id = apns_id
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+    def __repr__(self):
+        return f"PushResult({self.device_token[:12]}..., {self.status}, {self.reason})"
+
+
+class ProviderToken:
+    """Signed APNs provider token, re-signed only when it is about to expire"""
+
+    def __init__(self, credentials, ttl=PROVIDER_TOKEN_TTL):
+        self.credentials = credentials
+        self.ttl = ttl
+        self._token = None
+        self._issued_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, force_refresh=False):
+        with self._lock:
+            now = time.time()
+            if force_refresh or self._token is None or now - self._issued_at >= self.ttl:
+                import jwt
+                self._token = jwt.encode(
+                    {'iss': self.credentials.team_id, 'iat': int(now)},
+                    self.credentials.signing_key,
+                    algorithm='ES256',
+                    headers={'kid': self.credentials.key_id},
+                )
+                self._issued_at = now
+            return self._token
+
+
+def build_alert_payload(title, message, notification_type, extra=None):
+    """The aps alert dictionary used for every PinIt notification"""
+    return {
+        'aps': {
+            'alert': {
+                'title': title,
+                'body': message
+            },
+            'sound': 'default',
+            'badge': 1,
+            'thread-id': notification_type  # Group notifications by type
+        },
+        # Include custom payload
+        **(extra or {})
+    }
+
+
+class APNsSender:
+    """
+    Pooled HTTP/2 APNs client for one topic and environment.
+
+    The httpx client lives on a dedicated event loop thread; the blocking
+    send/send_many methods can be called from any thread. Sends tagged with
+    a lane in lane_streams hold at most that many of the connection's
+    streams; the rest stay free for the other lanes.
+    """
+
+    def __init__(self, credentials, topic, use_sandbox=True, endpoint=None, lane_streams=None):
+        self.topic = topic
+        self.endpoint = endpoint or APNS_ENDPOINTS['sandbox' if use_sandbox else 'production']
+        self.token = ProviderToken(credentials)
+        self.lane_streams = {
+            lane: min(streams, MAX_CONCURRENT_STREAMS) for lane, streams in (lane_streams or {}).items()
+        }
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._lane_semaphores = {}
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name=f'apns-{self.topic}', daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._open_client(), loop).result()
+            self._loop = loop
+
+    async def _open_client(self):
+        import httpx
+
+        # h2c with prior knowledge for a plain-http mock server
+        http1 = not self.endpoint.startswith('http://')
+        self._client = httpx.AsyncClient(
+            base_url=self.endpoint,
+            http1=http1,
+            http2=True,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1, keepalive_expiry=None),
+        )
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_STREAMS)
+        self._lane_semaphores = {lane: asyncio.Semaphore(streams) for lane, streams in self.lane_streams.items()}
+
+    async def _post(self, device_token, body, headers, lane=None):
+        lane_semaphore = self._lane_semaphores.get(lane)
+        if lane_semaphore is None:
+            async with self._semaphore:
+                return await self._client.post(f'/3/device/{device_token}', content=body, headers=headers)
+        # Wait for the lane's budget before taking a connection-wide stream
+        async with lane_semaphore, self._semaphore:
+            return await self._client.post(f'/3/device/{device_token}', content=body, headers=headers)
+
+    async def _send_one(self, device_token, payload, push_type='alert', priority=10, collapse_id=None, lane=None):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        headers = {
+            'apns-topic': self.topic,
+            'apns-push-type': push_type,
+            'apns-priority': str(priority),
+        }
+        if collapse_id:
+            headers['apns-collapse-id'] = collapse_id
+
+        for attempt in range(2):
+            headers['authorization'] = f'bearer {self.token.get(force_refresh=attempt > 0)}'
+            try:
+                response = await self._post(device_token, body, headers, lane)
+            except Exception as e:
+                logger.warning("APNs request failed for %s...: %s", device_token[:12], e)
+                return PushResult(device_token, 0, reason=type(e).__name__)
+
+            reason = None
+            if response.status_code != 200:
+                try:
+                    reason = response.json().get('reason')
+                except ValueError:
+                    reason = response.text or None
+                if response.status_code == 403 and reason == 'ExpiredProviderToken' and attempt == 0:
+                    continue
+            return PushResult(device_token, response.status_code, reason, response.headers.get('apns-id'))
+
+    def _run(self, coroutine, timeout):
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def send(self, device_token, payload, **options):
+        """Send one notification and wait for APNs' answer"""
+        return self._run(self._send_one(device_token, payload, **options), REQUEST_TIMEOUT * 2)
+
+    def send_many(self, device_tokens, payload, **options):
+        """
+        Send the same payload to many devices over the shared connection.
+        Returns one PushResult per token, in order. Pass lane= to keep the
+        batch within that lane's stream budget.
+
+        Tokens still unanswered when the batch times out get a transient
+        PushResult (status 0, reason 'Timeout'), so callers retry those
+        alone instead of resending to devices that already got the push.
+        """
+        if not device_tokens:
+            return []
+
+        streams = self.lane_streams.get(options.get('lane'), MAX_CONCURRENT_STREAMS)
+        timeout = REQUEST_TIMEOUT * 2 * (len(device_tokens) // streams + 1)
+
+        async def send_all():
+            tasks = [
+                asyncio.ensure_future(self._send_one(device_token, payload, **options))
+                for device_token in device_tokens
+            ]
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            return [
+                PushResult(device_token, 0, reason='Timeout') if task in pending else task.result()
+                for device_token, task in zip(device_tokens, tasks)
+            ]
+
+        return self._run(send_all(), timeout + REQUEST_TIMEOUT)
+
+    def close(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(REQUEST_TIMEOUT)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+
+
+def get_apns_sender(topic=None, use_sandbox=None):
+    """
+    Shared sender for a topic/environment, or None when APNs isn't configured.
+    Defaults come from PUSH_NOTIFICATIONS_SETTINGS.
+    """
+    config = _push_settings()
+    topic = topic or config.get('APNS_TOPIC', 'com.pinit.app')
+    if use_sandbox is None:
+        use_sandbox = config.get('APNS_USE_SANDBOX', True)
+
+    key = (topic, use_sandbox)
+    sender = _senders.get(key)
+    if sender is not None:
+        return sender
+
+    with _senders_lock:
+        sender = _senders.get(key)
+        if sender is not None:
+            return sender
+
+        credentials = get_credentials()
+        if credentials is None:
+            return None
+
+        sender = APNsSender(
+            credentials, topic,
+            use_sandbox=use_sandbox,
+            endpoint=config.get('APNS_ENDPOINT') or None,
+            lane_streams=lane_stream_limits(),
+        )
+        _senders[key] = sender
+        return sender
@@ -0,0 +1,120 @@
+"""
+Query-result cache for the event search endpoints.
+
+Search results are cached as ordered lists of event IDs keyed by the
+normalized query and filters. Every key also embeds the current generation
+of the filter bucket it depends on; event writes (and changes to a host's
+certification) bump those generations, so stale entries are simply never
+read again and expire on their own TTL.
+
+Hit/miss counters are served to staff at api/search_cache_stats/.
+"""
+import hashlib
+import json
+import logging
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Short TTL: popular queries stay warm, everything else ages out quickly
+SEARCH_CACHE_TTL = 60
+
+# Generation buckets. Queries without an event_type depend on ALL_TYPES,
+# queries with certified_only additionally depend on CERTIFIED.
+ALL_TYPES = '*'
+CERTIFIED = 'certified'
+
+_GENERATION_KEY = 'search_gen:{}'
+_STATS_KEY = 'search_cache_stats:{}'
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so equivalent queries share a key"""
+    return ' '.join((query or '').lower().split())
+
+
+def _get_generation(bucket):
+    key = _GENERATION_KEY.format(bucket)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_search_generation(event_types=(), certified=False):
+    """
+    Invalidate cached searches affected by a write.
+
+    Args:
+        event_types (iterable): Event types touched by the write
+        certified (bool): True when a host's certification changed
+    """
+    buckets = {ALL_TYPES} | {(t or '').lower() for t in event_types if t}
+    if certified:
+        buckets.add(CERTIFIED)
+    for bucket in buckets:
+        key = _GENERATION_KEY.format(bucket)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Key missing or evicted: any fresh value invalidates old entries
+            cache.set(key, 2, timeout=None)
+
+
+def _record(outcome):
+    key = _STATS_KEY.format(outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def search_cache_stats():
+    """Return cumulative hit/miss counters and the hit ratio"""
+    hits = cache.get(_STATS_KEY.format('hit'), 0)
+    misses = cache.get(_STATS_KEY.format('miss'), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 3) if total else 0.0,
+    }
+
+
+def make_search_key(namespace, query, **filters):
+    """
+    Build the cache key for a search.
+
+    Args:
+        namespace (str): Endpoint name, so different response shapes never collide
+        query (str): Raw query text (normalized here)
+        **filters: public_only, certified_only, event_type, semantic, ...
+    """
+    event_type = (filters.get('event_type') or '').lower()
+    generations = [_get_generation(event_type or ALL_TYPES)]
+    if filters.get('certified_only'):
+        generations.append(_get_generation(CERTIFIED))
+
+    raw = json.dumps(
+        {"q": normalize_query(query), **filters},
+        sort_keys=True,
+        default=str,
+    )
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f"search:{namespace}:{digest}:" + ":".join(str(g) for g in generations)
+
+
+def get_cached_search(key):
+    """Return the cached entry for key (or None) and record a hit or miss"""
+    entry = cache.get(key)
+    _record('hit' if entry is not None else 'miss')
+    if entry is None:
+        logger.debug("search cache miss: %s", key)
+    return entry
+
+
+def set_cached_search(key, entry):
+    cache.set(key, entry, timeout=SEARCH_CACHE_TTL)
@@ -1,3 +1,851 @@
-from django.test import TestCase
+import json
+import uuid
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapp.models import (
+    StudyEvent, EventComment, EventLike, EventShare, EventJoinRequest, NotificationOutbox, Device, UserProfile,
+    ActivityLog,
+)
+from myapp.search_cache import make_search_key
+from myapp.utils import encode_cursor, decode_cursor
+
+
+def make_event(host, title='Study session', **kwargs):
+    now = timezone.now()
+    fields = dict(
+        title=title, host=host, latitude=-34.6, longitude=-58.4,
+        time=now + timedelta(hours=2), end_time=now + timedelta(hours=4),
+    )
+    fields.update(kwargs)
+    return StudyEvent.objects.create(**fields)
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False)
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create_user(username='host', password='pw')
+
+    def search_keys(self, **filters):
+        return {event_type: make_search_key('enhanced', 'calc', event_type=event_type, **filters)
+                for event_type in ('', 'study', 'party')}
+
+    def changed_keys(self, before, **filters):
+        after = self.search_keys(**filters)
+        return sorted(event_type for event_type in before if before[event_type] != after[event_type])
+
+    def test_event_writes_invalidate_their_type(self):
+        before = self.search_keys()
+        with self.captureOnCommitCallbacks(execute=True):
+            event = make_event(self.host, event_type='study')
+        self.assertEqual(self.changed_keys(before), ['', 'study'])
+
+        # Moving an event to another type also invalidates the type it left
+        before = self.search_keys()
+        event = StudyEvent.objects.get(pk=event.pk)
+        event.event_type = 'party'
+        with self.captureOnCommitCallbacks(execute=True):
+            event.save()
+        self.assertEqual(self.changed_keys(before), ['', 'party', 'study'])
+
+    def test_certification_changes_invalidate_certified_searches(self):
+        before = self.search_keys(certified_only=True)
+        profile = UserProfile.objects.get(user=self.host)
+        profile.bio = 'Maths tutor'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(self.changed_keys(before, certified_only=True), [])
+
+        # An admin edit, not just certify_user
+        profile = UserProfile.objects.get(user=self.host)
+        profile.is_certified = True
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(self.changed_keys(before, certified_only=True), ['', 'party', 'study'])
+
+    def test_repeated_search_is_a_hit_and_counted(self):
+        make_event(self.host, 'Calculus', event_type='study')
+        client = api_client(self.host)
+        url = '/api/enhanced_search_events/?query=calc'
+
+        self.assertEqual(client.get(url)['X-Search-Cache'], 'miss')
+        response = client.get(url)
+        self.assertEqual(response['X-Search-Cache'], 'hit')
+        self.assertEqual([event['title'] for event in response.json()['events']], ['Calculus'])
+
+        self.assertEqual(client.get('/api/search_cache_stats/').status_code, 403)
+        self.host.is_staff = True
+        self.host.save()
+        stats = api_client(self.host).get('/api/search_cache_stats/').json()
+        self.assertEqual(stats, {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_facets_count_the_whole_result_set(self):
+        from myapp.views import _search_facets
+
+        certified = User.objects.create_user(username='certified', password='pw')
+        UserProfile.objects.filter(user=certified).update(is_certified=True)
+        make_event(self.host, 'Calc I', event_type='study')
+        make_event(self.host, 'Calc II', event_type='study', is_public=False)
+        make_event(certified, 'Calc party', event_type='party')
+        make_event(self.host, 'Unrelated', event_type='business')
+
+        page = api_client(self.host).get('/api/enhanced_search_events/?query=calc&facets=true&limit=1').json()
+        self.assertEqual(len(page['events']), 1)
+        self.assertEqual(page['facets'], {
+            'event_type': {'study': 2, 'party': 1, 'business': 0, 'other': 0},
+            'host_certified': {'certified': 1, 'not_certified': 2},
+            'visibility': {'public': 2, 'private': 1},
+        })
+        with self.assertNumQueries(1):
+            _search_facets(StudyEvent.objects.all())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False)
+class NearbyEventsTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.other = User.objects.create_user(username='other', password='pw')
+
+    def near(self, **params):
+        return api_client(self.host).get('/api/events_near_me/', params)
+
+    def test_nearest_first_within_the_radius(self):
+        # Kilometres north of (-34.6, -58.4)
+        for km in (50, 0.5, 200, 5, 1.5):
+            make_event(self.host, f'{km} km', latitude=-34.6 + km / 111.32)
+        make_event(self.other, 'Private', latitude=-34.6, is_public=False)
+
+        page = self.near(latitude=-34.6, longitude=-58.4, k=3).json()
+        self.assertEqual([event['title'] for event in page['events']], ['0.5 km', '1.5 km', '5 km'])
+        self.assertEqual(page['radius_km'], 8.0)
+
+        page = self.near(latitude=-34.6, longitude=-58.4, k=10, radius_km=60).json()
+        self.assertEqual([event['title'] for event in page['events']], ['0.5 km', '1.5 km', '5 km', '50 km'])
+
+    def test_search_wraps_across_the_antimeridian(self):
+        make_event(self.host, 'East', latitude=0, longitude=179.99)
+        page = self.near(latitude=0, longitude=-179.99).json()
+        self.assertEqual([event['title'] for event in page['events']], ['East'])
+        self.assertLess(page['events'][0]['distance_km'], 3)
+
+    def test_rejects_bad_parameters(self):
+        for params in (
+            {'longitude': -58.4},
+            {'latitude': 91, 'longitude': 0},
+            {'latitude': 0, 'longitude': 0, 'radius_km': 'nan'},
+            {'latitude': 0, 'longitude': 0, 'hours': '-1'},
+        ):
+            self.assertEqual(self.near(**params).status_code, 400, params)
+
+
+class CursorTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.event = make_event(self.host)
+
+    def test_round_trip(self):
+        created = timezone.now()
+        cursor = encode_cursor(created, 42)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor), [created.isoformat(), '42'])
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('', 'not-a-cursor', encode_cursor('only-one'), encode_cursor(1, 2, 3)):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_feed_pages_cover_every_post_once(self):
+        posts = [EventComment.objects.create(event=self.event, user=self.host, text=f'post {i}') for i in range(5)]
+        client = api_client(self.host)
+
+        seen, cursor = [], None
+        for _ in range(5):
+            url = f'/api/events/feed/{self.event.id}/?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            page = client.get(url).json()
+            seen += [post['id'] for post in page['posts']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [post.id for post in reversed(posts)])
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_feed_rejects_bad_cursor(self):
+        response = api_client(self.host).get(f'/api/events/feed/{self.event.id}/?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False)
+class EventCounterTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+        self.friend = User.objects.create_user(username='friend', password='pw')
+        self.event = make_event(self.host)
+
+    def assertCountersMatchRows(self, event):
+        event.refresh_from_db()
+        self.assertEqual(event.attendee_count, event.attendees.count())
+        self.assertEqual(event.invite_count, event.invited_friends.count())
+        self.assertAlmostEqual(event.trending_score, (event.attendee_count + event.invite_count) * event.trending_decay)
+        self.assertEqual(event.like_count, EventLike.objects.filter(event=event, comment=None).count())
+
+    def test_create_counts_host_and_invitees(self):
+        start = timezone.now() + timedelta(days=1)
+        response = api_client(self.host).post('/api/create_study_event/', json.dumps({
+            'title': 'Calculus',
+            'latitude': -34.6,
+            'longitude': -58.4,
+            'time': start.isoformat(),
+            'end_time': (start + timedelta(hours=2)).isoformat(),
+            'invited_friends': ['fan', 'friend'],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        event = StudyEvent.objects.get(title='Calculus')
+        self.assertCountersMatchRows(event)
+        self.assertEqual((event.attendee_count, event.invite_count), (1, 2))
+
+    def test_rsvp_approve_and_leave(self):
+        join_request = EventJoinRequest.objects.create(event=self.event, user=self.fan)
+        response = api_client(self.host).post(
+            '/api/approve_join_request/', json.dumps({'request_id': str(join_request.id)}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCountersMatchRows(self.event)
+        self.assertEqual(self.event.attendee_count, 1)
+
+        response = api_client(self.fan).post(
+            '/api/rsvp_study_event/', json.dumps({'event_id': str(self.event.id)}), content_type='application/json'
+        )
+        self.assertEqual(response.json()['action'], 'left')
+        self.assertCountersMatchRows(self.event)
+        self.assertEqual(self.event.attendee_count, 0)
+
+    def test_like_and_unlike(self):
+        from myapp.views import _toggle_like
+
+        self.assertEqual(_toggle_like(self.fan, self.event), (True, 1))
+        self.assertEqual(_toggle_like(self.friend, self.event), (True, 2))
+        self.assertEqual(_toggle_like(self.fan, self.event), (False, 1))
+        self.assertCountersMatchRows(self.event)
+
+    def test_stale_save_keeps_engagement_counters(self):
+        from myapp.views import _toggle_like
+
+        stale = StudyEvent.objects.get(pk=self.event.pk)
+        self.assertEqual(_toggle_like(self.fan, self.event), (True, 1))
+        self.assertEqual(_toggle_like(self.fan, self.event), (False, 0))
+        _toggle_like(self.host, self.event)
+        StudyEvent.objects.filter(pk=self.event.pk).update(share_count=3, comment_count=2)
+
+        stale.title = 'Renamed'
+        stale.save()
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.title, 'Renamed')
+        self.assertEqual(self.event.like_count, EventLike.objects.filter(event=self.event).count())
+        self.assertEqual(self.event.like_count, 1)
+        self.assertEqual(self.event.share_count, 3)
+        self.assertEqual(self.event.comment_count, 2)
+
+    def test_reply_to_reply_joins_top_level_post(self):
+        post = EventComment.objects.create(event=self.event, user=self.host, text='post')
+        reply = EventComment.objects.create(event=self.event, user=self.fan, text='reply', parent=post)
+
+        response = api_client(self.friend).post('/api/events/comment/', json.dumps({
+            'username': 'friend', 'event_id': str(self.event.id), 'text': 'nested', 'parent_id': reply.id,
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(EventComment.objects.get(id=response.json()['post']['id']).parent_id, post.id)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False)
+class EventInteractionTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+        self.event = make_event(self.host)
+
+    def interactions(self):
+        return api_client(self.fan).get(f'/api/events/interactions/{self.event.id}/').json()
+
+    def add_thread(self, replies):
+        post = EventComment.objects.create(event=self.event, user=self.host, text='post')
+        for i in range(replies):
+            EventComment.objects.create(event=self.event, user=self.fan, text=f'reply {i}', parent=post)
+        return post
+
+    def test_thread_likes_and_shares(self):
+        from myapp.views import _toggle_like
+
+        post = self.add_thread(replies=2)
+        _toggle_like(self.fan, self.event)
+        _toggle_like(self.host, self.event)
+        _toggle_like(self.fan, self.event, post)
+        EventShare.objects.create(event=self.event, user=self.fan, shared_platform='whatsapp')
+        StudyEvent.objects.filter(pk=self.event.pk).update(share_count=1)
+
+        data = self.interactions()
+        [thread] = data['comments']
+        self.assertEqual((thread['text'], thread['likes']), ('post', 1))
+        self.assertEqual([reply['text'] for reply in thread['replies']], ['reply 0', 'reply 1'])
+        self.assertEqual(data['likes']['total'], 2)
+        self.assertEqual(data['likes']['users'], ['fan', 'host'])
+        self.assertEqual(data['likes']['detailed_breakdown']['fan'], {'event_likes': 1, 'comment_likes': 1})
+        self.assertEqual(data['shares']['total'], 1)
+        self.assertEqual(data['shares']['breakdown']['whatsapp'], 1)
+
+    def like(self, key):
+        return api_client(self.fan).post('/api/events/like/', json.dumps({
+            'username': 'fan', 'event_id': str(self.event.id), 'idempotency_key': key,
+        }), content_type='application/json')
+
+    def test_retried_like_toggles_once(self):
+        key = str(uuid.uuid4())
+        first, retry = self.like(key), self.like(key)
+        self.assertEqual(first.json(), {'success': True, 'liked': True, 'total_likes': 1})
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replay'], 'true')
+        self.assertEqual(EventLike.objects.filter(event=self.event).count(), 1)
+
+        # A new key is a new tap
+        self.assertEqual(self.like(str(uuid.uuid4())).json()['liked'], False)
+
+    def test_concurrent_duplicate_like_is_counted_once(self):
+        from myapp.models import increment_counter
+        from myapp.views import _toggle_like
+
+        # Another request's like lands between our DELETE (which saw nothing) and our INSERT
+        EventLike.objects.create(user=self.fan, event=self.event)
+        increment_counter(StudyEvent, self.event.id, 'like_count')
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            self.assertEqual(_toggle_like(self.fan, self.event), (True, 1))
+        self.assertEqual(EventLike.objects.filter(event=self.event).count(), 1)
+
+    def test_query_count_does_not_grow_with_the_thread(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.add_thread(replies=1)
+        with CaptureQueriesContext(connection) as small:
+            self.interactions()
+        for _ in range(5):
+            self.add_thread(replies=4)
+        with CaptureQueriesContext(connection) as large:
+            self.interactions()
+        self.assertEqual(len(large), len(small))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False, ENGAGEMENT_WRITE_BEHIND=True)
+class EngagementBufferTests(TestCase):
+    def setUp(self):
+        from myapp.engagement_buffer import EngagementBuffer
+
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+        self.event = make_event(self.host)
+        # A private buffer, flushed by hand instead of by the daemon thread
+        self.buffer = EngagementBuffer()
+        patcher = mock.patch.object(self.buffer, '_schedule_flush')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.flush()
+        self.event.refresh_from_db()
+
+    def test_reads_see_writes_before_the_flush(self):
+        self.assertEqual(self.buffer.toggle_like(self.fan, self.event), (True, 1))
+        self.assertEqual(self.buffer.add_share(self.fan, self.event, 'whatsapp'), 1)
+        self.assertFalse(EventLike.objects.exists())
+
+        with mock.patch('myapp.views.engagement_buffer', self.buffer):
+            data = api_client(self.fan).get(f'/api/events/feed/{self.event.id}/').json()
+        self.assertEqual(data['likes'], {'total': 1, 'users': ['fan']})
+        self.assertEqual(data['shares']['total'], 1)
+
+        self.flush()
+        self.assertEqual((self.event.like_count, self.event.share_count), (1, 1))
+        self.assertTrue(EventLike.objects.filter(user=self.fan, event=self.event).exists())
+        self.assertEqual(
+            sorted(ActivityLog.objects.filter(user=self.fan).values_list('activity_type', flat=True)),
+            ['like', 'share']
+        )
+        self.assertIsNone(self.buffer.pending_like_state(self.fan.id, self.event.id))
+
+    def test_toggles_that_cancel_out_write_nothing(self):
+        post = EventComment.objects.create(event=self.event, user=self.host, text='post')
+        self.buffer.toggle_like(self.fan, self.event)
+        self.buffer.toggle_like(self.fan, self.event)
+        self.buffer.toggle_like(self.fan, self.event, post)
+        self.assertEqual(self.buffer.apply_pending_likes(self.fan.id, self.event.id, []), {post.id})
+
+        self.flush()
+        self.assertEqual(self.event.like_count, 0)
+        self.assertEqual(list(EventLike.objects.values_list('comment_id', flat=True)), [post.id])
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 1)
+
+    def test_like_written_meanwhile_is_not_counted_twice(self):
+        from myapp.views import _toggle_like
+
+        self.buffer.toggle_like(self.fan, self.event)
+        # e.g. a retried request that took the synchronous path
+        _toggle_like(self.fan, self.event)
+
+        self.flush()
+        self.assertEqual(self.event.like_count, 1)
+        self.assertEqual(EventLike.objects.filter(event=self.event).count(), 1)
+        self.assertEqual(ActivityLog.objects.filter(activity_type='like').count(), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False)
+class EventDetailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+        self.event = make_event(self.host)
+
+    def detail(self, user, event=None):
+        response = api_client(user).get(f'/api/events/detail/{(event or self.event).id}/')
+        return response.get('X-Event-Detail-Cache'), response
+
+    def test_engagement_writes_invalidate_the_cached_detail(self):
+        from myapp.views import _toggle_like
+
+        self.assertEqual(self.detail(self.fan)[0], 'MISS')
+        self.assertEqual(self.detail(self.fan)[0], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            _toggle_like(self.fan, self.event)
+        status, response = self.detail(self.fan)
+        self.assertEqual(status, 'MISS')
+        self.assertEqual(response.json()['engagement']['likes'], 1)
+        self.assertTrue(response.json()['engagement']['isLikedByCurrentUser'])
+
+        # The shared entry carries no per-user flags
+        status, response = self.detail(self.host)
+        self.assertEqual(status, 'HIT')
+        self.assertFalse(response.json()['engagement']['isLikedByCurrentUser'])
+
+    def test_rsvp_and_edits_invalidate_the_cached_detail(self):
+        self.detail(self.fan)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.attendees.add(self.fan)
+        status, response = self.detail(self.fan)
+        self.assertEqual(status, 'MISS')
+        self.assertEqual(response.json()['attendees']['preview'], ['fan'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.title = 'Renamed'
+            self.event.save()
+        self.assertEqual(self.detail(self.fan)[1].json()['event']['title'], 'Renamed')
+
+    def test_cached_private_event_is_still_access_checked(self):
+        private = make_event(self.host, 'Private', is_public=False)
+        self.assertEqual(self.detail(self.host, private)[1].status_code, 200)
+        self.assertEqual(self.detail(self.fan, private)[1].status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            private.invited_friends.add(self.fan)
+        self.assertEqual(self.detail(self.fan, private)[1].status_code, 200)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, RATELIMIT_ENABLE=False)
+class ActivityFeedTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+
+    def feed(self, **params):
+        response = api_client(self.fan).get('/api/get_recent_activity/fan/', params)
+        return response.status_code, response.json()
+
+    def test_write_paths_append_to_the_feed(self):
+        from myapp.views import _toggle_like, _create_event_posts
+
+        event = make_event(self.host, 'Calculus')
+        event.attendees.add(self.fan)
+        _create_event_posts(event, self.fan, [{'text': 'hi', 'parent_id': None, 'image_urls': []}])
+        _toggle_like(self.fan, event)
+        _toggle_like(self.fan, event)  # unliking isn't activity
+
+        _, page = self.feed()
+        self.assertEqual([activity['message'] for activity in page['activities']], [
+            'fan liked Calculus', 'fan commented on Calculus', 'fan joined Calculus', 'host created Calculus',
+        ])
+
+    def test_pages_follow_the_cursor(self):
+        event = make_event(self.host)
+        ActivityLog.objects.bulk_create([ActivityLog.entry('share', self.fan, event) for _ in range(4)])
+
+        _, first = self.feed(limit=3)
+        _, second = self.feed(limit=3, cursor=first['next_cursor'])
+        ids = [activity['id'] for activity in first['activities'] + second['activities']]
+        self.assertEqual(len(set(ids)), ActivityLog.objects.count())
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(self.feed(cursor='garbage')[0], 400)
+
+    def test_backfill_covers_only_what_the_old_feed_showed(self):
+        from django.apps import apps
+
+        backfill = import_module('myapp.migrations.0010_activitylog').backfill_recent_activity
+        now = timezone.now()
+        past = make_event(self.host, 'Past')
+        StudyEvent.objects.filter(pk=past.pk).update(time=now - timedelta(days=30), end_time=now - timedelta(days=29))
+        upcoming = [
+            make_event(self.host, f'Upcoming {i}', time=now + timedelta(days=i + 1), end_time=now + timedelta(days=i + 1, hours=2))
+            for i in range(12)
+        ]
+        for i in range(25):
+            EventComment.objects.create(event=upcoming[0], user=self.fan, text=f'post {i}')
+        ActivityLog.objects.all().delete()
+
+        backfill(apps, None)
+
+        created = ActivityLog.objects.filter(activity_type='create').values_list('event_title', flat=True)
+        self.assertEqual(sorted(created), sorted(f'Upcoming {i}' for i in range(2, 12)))
+        self.assertEqual(ActivityLog.objects.filter(activity_type='comment').count(), 20)
+
+
+class FakeSender:
+    """Records send_many calls; a token's prefix picks the APNs answer (see RESPONSES)"""
+
+    RESPONSES = {
+        'flaky': (503, 'ServiceUnavailable'),
+        'dead': (410, 'Unregistered'),
+        'wrong': (400, 'BadTopic'),
+    }
+
+    def __init__(self):
+        self.calls = []
+
+    def send_many(self, device_tokens, payload, **options):
+        from myapp.push import PushResult
+        self.calls.append((list(device_tokens), payload, options))
+        return [PushResult(token, *self.RESPONSES.get(token.split('-')[0], (200,))) for token in device_tokens]
+
+
+@override_settings(NOTIFICATION_EMBEDDED_DISPATCHER=False, NOTIFICATION_COALESCE_WINDOW=60)
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+        Device.objects.create(user=self.host, token='host-token', device_type='ios')
+        self.sender = FakeSender()
+        patcher = mock.patch('myapp.push.get_apns_sender', return_value=self.sender)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_lane_routing(self):
+        from myapp.notifications import enqueue_notification
+
+        cancellation = enqueue_notification([self.host.id], 'event_cancellation', event_title='Calc')
+        rating = enqueue_notification([self.host.id], 'new_rating', from_user='fan', rating=5)
+        invitation = enqueue_notification([self.host.id], 'event_invitation', event_title='Calc')
+        fan_out = enqueue_notification([self.host.id, self.fan.id], 'new_rating', from_user='fan', rating=5)
+
+        self.assertEqual(
+            [cancellation.lane, rating.lane, invitation.lane, fan_out.lane],
+            ['critical', 'default', 'bulk', 'bulk'],
+        )
+
+    def test_claims_are_exclusive_and_stale_claims_reclaimed(self):
+        from myapp.notifications import enqueue_notification, claim_notifications, CLAIM_TIMEOUT
+
+        notification = enqueue_notification([self.host.id], 'new_rating', from_user='fan', rating=5)
+        claimed = claim_notifications('default')
+        self.assertEqual([row.id for row in claimed], [notification.id])
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claim_notifications('default'), [])
+        self.assertEqual(claim_notifications('critical'), [])
+
+        # A worker that died mid-delivery gives the row up after CLAIM_TIMEOUT
+        NotificationOutbox.objects.filter(pk=notification.pk).update(
+            claimed_at=timezone.now() - CLAIM_TIMEOUT - timedelta(seconds=1)
+        )
+        reclaimed = claim_notifications('default')
+        self.assertEqual([row.id for row in reclaimed], [notification.id])
+        self.assertNotEqual(reclaimed[0].claimed_by, claimed[0].claimed_by)
+
+    def test_burst_coalesces_into_one_digest(self):
+        from myapp.notifications import enqueue_notification, claim_notifications, notification_text
+
+        def attendee_joined(name):
+            return enqueue_notification(
+                [self.host.id], 'new_attendee', event_id='e1', event_title='Calc', attendee_name=name
+            )
+
+        # The first one goes out at once; the rest of the burst waits for the window
+        first = attendee_joined('ana')
+        self.assertEqual([row.id for row in claim_notifications('default')], [first.id])
+        attendee_joined('ben')
+        attendee_joined('cy')
+
+        rows = list(NotificationOutbox.objects.order_by('id'))
+        self.assertEqual(len(rows), 2)
+        digest = rows[1]
+        self.assertEqual(digest.coalesced_count, 2)
+        self.assertEqual(digest.payload['actors'], ['ben', 'cy'])
+        self.assertGreater(digest.next_attempt_at, timezone.now())
+        title, message = notification_text('new_attendee', {**digest.payload, 'count': 2})
+        self.assertIn('2', message)
+
+    def test_delivery_retries_only_failed_tokens(self):
+        from myapp.notifications import enqueue_notification, claim_notifications, process_notification
+
+        Device.objects.create(user=self.fan, token='flaky-token', device_type='ios')
+        notification = enqueue_notification([self.host.id, self.fan.id], 'new_rating', from_user='x', rating=4)
+
+        self.assertEqual(process_notification(claim_notifications('bulk')[0]), 'retry')
+        tokens, _, options = self.sender.calls[0]
+        self.assertEqual(sorted(tokens), ['flaky-token', 'host-token'])
+        self.assertEqual(options, {'lane': 'bulk', 'collapse_id': f'outbox-{notification.id}'})
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.device_tokens, ['flaky-token'])
+
+    def test_dead_tokens_deactivated(self):
+        from myapp.notifications import enqueue_notification, claim_notifications, process_notification
+
+        dead = Device.objects.create(user=self.host, token='dead-token', device_type='ios')
+        notification = enqueue_notification([self.host.id], 'new_rating', from_user='fan', rating=5)
+
+        self.assertEqual(process_notification(claim_notifications('default')[0]), 'sent')
+        dead.refresh_from_db()
+        self.assertFalse(dead.is_active)
+        self.assertTrue(Device.objects.get(token='host-token').is_active)
+
+        # The next push skips the deactivated device
+        enqueue_notification([self.host.id], 'new_rating', from_user='fan', rating=4)
+        process_notification(claim_notifications('default')[0])
+        self.assertEqual(self.sender.calls[-1][0], ['host-token'])
+
+    def test_rejected_tokens_fail_the_row(self):
+        from myapp.notifications import enqueue_notification, claim_notifications, process_notification
+
+        Device.objects.filter(user=self.host).update(token='wrong-topic')
+        notification = enqueue_notification([self.host.id], 'new_rating', from_user='fan', rating=5)
+
+        self.assertEqual(process_notification(claim_notifications('default')[0]), 'failed')
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'failed')
+        self.assertIn('400 BadTopic', notification.last_error)
+
+    def test_timed_out_tokens_alone_are_transient(self):
+        import asyncio
+        from myapp.push import APNsSender, PushResult
+
+        async def send_one(device_token, payload, **options):
+            if device_token.startswith('slow'):
+                await asyncio.sleep(5)
+            return PushResult(device_token, 200)
+
+        sender = APNsSender(None, 'com.pinit.test')
+        self.addCleanup(sender.close)
+        with mock.patch('myapp.push.REQUEST_TIMEOUT', 0.05), mock.patch.object(sender, '_send_one', send_one):
+            results = sender.send_many(['fast-token', 'slow-token'], {'aps': {}})
+
+        self.assertEqual([(result.status, result.reason) for result in results], [(200, None), (0, 'Timeout')])
+
+
+class FakeChannelLayer:
+    """Records group_send calls; sends to groups in `failing` raise"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    async def group_send(self, group_name, message):
+        if group_name in self.failing:
+            raise ConnectionError('channel layer unavailable')
+        self.sent.append((group_name, message))
+
+
+class BroadcastTests(TestCase):
+    def broadcast(self, layer, *args, **kwargs):
+        from myapp.utils import broadcast_event_update
+
+        with mock.patch('myapp.utils.get_channel_layer', return_value=layer):
+            broadcast_event_update(*args, **kwargs)
+        return layer.sent
+
+    def test_one_failing_group_does_not_stop_the_rest(self):
+        from myapp.utils import event_group, geo_tile, geo_tile_group, user_events_group
+
+        event_id = uuid.uuid4()
+        tile = geo_tile_group(geo_tile(-34.6, -58.4))
+        layer = FakeChannelLayer(failing=[event_group(event_id)])
+        sent = self.broadcast(layer, event_id, 'update', ['fan', 'fan', 'host'], [(-34.6, -58.4)])
+
+        self.assertEqual(
+            [group_name for group_name, _ in sent],
+            [tile, user_events_group('fan'), user_events_group('host')]
+        )
+        # One broadcast, told apart from the repeats by broadcast_id
+        self.assertEqual(len({message['broadcast_id'] for _, message in sent}), 1)
+        self.assertEqual(
+            [message.get('follow', False) for _, message in sent], [False, True, True]
+        )
+
+
+class EventBroadcastPayloadTests(TestCase):
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', password='pw')
+
+    def save_and_broadcast(self, event, previous_placement=None):
+        from myapp.views import _broadcast_event_saved
+
+        layer = FakeChannelLayer()
+        with mock.patch('myapp.utils.get_channel_layer', return_value=layer):
+            with self.captureOnCommitCallbacks(execute=True):
+                _broadcast_event_saved(event, previous_placement=previous_placement)
+        return {group_name: message for group_name, message in layer.sent}
+
+    def test_public_event_carries_its_fragment_and_version(self):
+        from myapp.utils import event_group, geo_tile, geo_tile_group
+
+        event = make_event(self.host, 'Public')
+        sent = self.save_and_broadcast(event)
+        event.refresh_from_db()
+
+        self.assertEqual(set(sent), {event_group(event.id), geo_tile_group(geo_tile(-34.6, -58.4))})
+        for message in sent.values():
+            self.assertEqual(message['version'], event.version)
+            self.assertEqual(message['event']['title'], 'Public')
+            self.assertEqual(message['event']['version'], event.version)
+
+    def test_private_and_auto_matched_events_send_only_the_id(self):
+        from myapp.utils import event_group
+
+        for fields in ({'is_public': False}, {'auto_matching_enabled': True}):
+            event = make_event(self.host, 'Hidden', **fields)
+            sent = self.save_and_broadcast(event)
+            # No map tile either
+            self.assertEqual(list(sent), [event_group(event.id)])
+            self.assertNotIn('event', sent[event_group(event.id)])
+
+    def test_tiles_the_event_left_are_only_invalidated(self):
+        from myapp.views import _placement
+        from myapp.utils import geo_tile, geo_tile_group
+
+        old_tile = geo_tile_group(geo_tile(-34.6, -58.4))
+        new_tile = geo_tile_group(geo_tile(-34.9, -58.4))
+
+        event = make_event(self.host, 'Moving')
+        previous = _placement(event)
+        event.latitude = -34.9
+        sent = self.save_and_broadcast(event, previous)
+        self.assertEqual(sent[old_tile], {
+            'type': 'event_invalidate', 'event_id': str(event.id), 'broadcast_id': mock.ANY,
+        })
+        self.assertEqual(sent[new_tile]['event']['latitude'], -34.9)
+
+        # Going private: the tile hears nothing about the new state
+        previous = _placement(event)
+        event.is_public = False
+        sent = self.save_and_broadcast(event, previous)
+        self.assertEqual(sent[new_tile]['type'], 'event_invalidate')
+        self.assertTrue(all('event' not in message for message in sent.values()))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class EventsConsumerTests(TestCase):
+    def setUp(self):
+        from myapp.middleware import JWTAuthMiddlewareStack
+        from myapp.routing import websocket_urlpatterns
+
+        self.application = JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        self.host = User.objects.create_user(username='host', password='pw')
+        self.stranger = User.objects.create_user(username='stranger', password='pw')
+        self.public_event = make_event(self.host, 'Public')
+        self.private_event = make_event(self.host, 'Private', is_public=False)
+        self.matched_event = make_event(self.host, 'Matched', auto_matching_enabled=True)
+
+    def connect(self, path, user=None):
+        headers = []
+        if user is not None:
+            headers.append((b'authorization', f'Bearer {AccessToken.for_user(user)}'.encode()))
+        return WebsocketCommunicator(self.application, path, headers=headers)
+
+    def test_rejects_anonymous_and_other_users(self):
+        async def attempt():
+            outcomes = []
+            for path, user in (('/ws/events/host/', None), ('/ws/events/host/', self.stranger)):
+                communicator = self.connect(path, user)
+                connected, code = await communicator.connect()
+                outcomes.append((connected, code))
+                await communicator.disconnect()
+            return outcomes
+
+        self.assertEqual(async_to_sync(attempt)(), [(False, 4001), (False, 4003)])
+
+    def test_subscriptions_limited_to_visible_events(self):
+        async def subscribe(user):
+            communicator = self.connect(f'/ws/events/{user.username}/', user)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.send_json_to({
+                'action': 'subscribe',
+                'event_ids': [str(self.public_event.id), str(self.private_event.id), str(self.matched_event.id)],
+            })
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response['events']
+
+        # The host follows all three on connect; a stranger only the public one
+        self.assertEqual(async_to_sync(subscribe)(self.host), 3)
+        self.assertEqual(async_to_sync(subscribe)(self.stranger), 1)
+
+    def test_viewport_receives_fragments_and_invalidations(self):
+        from asgiref.sync import sync_to_async
+        from myapp.utils import broadcast_event_updated
+
+        fragment = {'id': str(self.public_event.id), 'title': 'Renamed', 'version': 7}
+
+        async def watch():
+            communicator = self.connect('/ws/events/stranger/', self.stranger)
+            await communicator.connect()
+            await communicator.send_json_to({
+                'action': 'viewport', 'min_lat': -34.7, 'min_lon': -58.5, 'max_lat': -34.5, 'max_lon': -58.3,
+            })
+            await communicator.receive_json_from()
+            await sync_to_async(broadcast_event_updated)(
+                self.public_event.id, locations=[(-34.6, -58.4)], event=fragment
+            )
+            update = await communicator.receive_json_from()
+            await sync_to_async(broadcast_event_updated)(
+                self.private_event.id, departed_locations=[(-34.6, -58.4)]
+            )
+            invalidate = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return update, invalidate
+
+        update, invalidate = async_to_sync(watch)()
+        self.assertEqual(update, {
+            'type': 'update', 'event_id': str(self.public_event.id), 'version': 7, 'event': fragment,
+        })
+        self.assertEqual(invalidate, {'type': 'invalidate', 'event_id': str(self.private_event.id)})
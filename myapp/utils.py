@@ -3,6 +3,10 @@ Utility functions for the myapp Django application.
 """
 import json
 import asyncio
+import base64
+import hashlib
+import math
+import uuid
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import re
@@ -11,23 +15,169 @@ def _sanitize_group_name(name: str) -> str:
     """Sanitize string for Channels group names (alnum, dash, underscore)."""
     return re.sub(r'[^a-zA-Z0-9_-]', '_', name or '')
 
-def broadcast_event_update(event_id, event_type, usernames):
+def encode_cursor(*values):
     """
-    Broadcast an event update to all connected WebSocket clients
-    who are subscribed to this event.
+    Encode keyset pagination values (e.g. a timestamp and an ID) into an
+    opaque, URL-safe cursor string.
+    """
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, size=2):
+    """
+    Decode a cursor produced by encode_cursor into its list of string values.
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+def parse_limit(value, default=20, maximum=100):
+    """Parse a page size query parameter, clamped to 1..maximum"""
+    try:
+        limit = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError("Invalid limit")
+    return max(1, min(limit, maximum))
+
+# How long a completed response is replayed for the same idempotency key
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# How long an in-flight request holds its key before another attempt may run
+IDEMPOTENCY_LOCK_TTL = 30
+
+def get_idempotency_key(request, data=None):
+    """
+    Return the client-supplied idempotency key from the Idempotency-Key
+    header or the "idempotency_key" JSON field, or None.
+    """
+    key = request.headers.get('Idempotency-Key') or (data or {}).get('idempotency_key')
+    if not key:
+        return None
+    return str(key)[:128]
+
+def run_idempotent(scope, user_id, key, handler):
+    """
+    Run handler() (which returns an HttpResponse) at most once per
+    (scope, user, key) and replay its response for retries.
+
+    Returns 409 while the first attempt is still in flight. Server errors
+    are not stored, so the client can retry them.
+    """
+    from django.core.cache import cache
+    from django.http import HttpResponse, JsonResponse
+
+    if not key:
+        return handler()
+
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    cache_key = f"idempotency:{scope}:{user_id}:{digest}"
+
+    if not cache.add(cache_key, {"pending": True}, timeout=IDEMPOTENCY_LOCK_TTL):
+        stored = cache.get(cache_key)
+        if stored and not stored.get("pending"):
+            response = HttpResponse(
+                stored["content"],
+                status=stored["status"],
+                content_type='application/json'
+            )
+            response['Idempotent-Replay'] = 'true'
+            return response
+        return JsonResponse({"error": "A request with this idempotency key is already in progress"}, status=409)
+
+    try:
+        response = handler()
+    except Exception:
+        cache.delete(cache_key)
+        raise
+
+    if response.status_code >= 500:
+        cache.delete(cache_key)
+    else:
+        cache.set(cache_key, {
+            "status": response.status_code,
+            "content": response.content,
+        }, timeout=IDEMPOTENCY_TTL)
+    return response
+
+def group_send_many(messages):
+    """
+    Send several (group_name, message) pairs through the channel layer in a
+    single async_to_sync call. The group_send calls run concurrently, so with
+    Redis their round trips overlap instead of adding up one per group.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not messages:
+        return
+
+    async def send_all():
+        results = await asyncio.gather(
+            *[channel_layer.group_send(group_name, message) for group_name, message in messages],
+            return_exceptions=True
+        )
+        for (group_name, _), result in zip(messages, results):
+            if isinstance(result, Exception):
+                print(f"❌ Broadcast to {group_name} failed: {result}")
+
+    async_to_sync(send_all)()
+
+# Map viewports subscribe to square geo tiles of GEO_TILE_SIZE degrees
+# (about 11 km at the equator); public event changes go to the event's tile
+GEO_TILE_SIZE = 0.1
+MAX_VIEWPORT_TILES = 100
+
+def user_events_group(username):
+    return f"events_{_sanitize_group_name(username)}"
+
+def event_group(event_id):
+    return f"event_{_sanitize_group_name(str(event_id).lower())}"
+
+def geo_tile(latitude, longitude):
+    """(row, column) of the tile containing a point"""
+    return math.floor(float(latitude) / GEO_TILE_SIZE), math.floor(float(longitude) / GEO_TILE_SIZE)
+
+def geo_tile_group(tile):
+    return f"geo_{tile[0]}_{tile[1]}"
+
+def viewport_tiles(min_lat, min_lon, max_lat, max_lon):
+    """
+    Tiles covering a map viewport. Raises ValueError for invalid bounds or
+    viewports wider than MAX_VIEWPORT_TILES tiles.
+    """
+    min_row, min_col = geo_tile(min_lat, min_lon)
+    max_row, max_col = geo_tile(max_lat, max_lon)
+    if max_row < min_row or max_col < min_col:
+        raise ValueError("Invalid viewport bounds")
+    if (max_row - min_row + 1) * (max_col - min_col + 1) > MAX_VIEWPORT_TILES:
+        raise ValueError("Viewport too large")
+    return [(row, col) for row in range(min_row, max_row + 1) for col in range(min_col, max_col + 1)]
+
+def broadcast_event_update(event_id, event_type, usernames=(), locations=(), event=None, departed_locations=()):
+    """
+    Broadcast an event change to every WebSocket client watching the event.
+    
+    Clients that have the event on screen (or host/attend/are invited to it)
+    are subscribed to its event_<id> group, and map viewers to the geo tile
+    groups, so the write path never has to look up the audience.
     
     Args:
         event_id (str): The UUID of the event
         event_type (str): Type of update: 'create', 'update', or 'delete'
-        usernames (list): List of usernames to notify
+        usernames (list): Users who may not be subscribed yet (e.g. new
+            invitees), notified through their personal events_<username> group
+        locations (list): (latitude, longitude) of the event's current
+            public placement; its geo tile group is notified
+        event (dict): The serialized, versioned event fragment, so clients
+            can apply the change without refetching their event list. Only
+            pass it for events every viewer may see
+        departed_locations (list): (latitude, longitude) of public placements
+            the event no longer occupies; those tiles get an ID-only
+            invalidation and never see the new state
     """
-    # Get the channel layer
-    channel_layer = get_channel_layer()
-    
-    # Make sure we have usernames to notify
-    if not usernames:
-        return
-    
     # Map event_type to consumer handler method
     handler_map = {
         'create': 'event_create',
@@ -37,35 +187,47 @@ def broadcast_event_update(event_id, event_type, usernames):
     
     # Default to update if event_type is not recognized
     handler = handler_map.get(event_type, 'event_update')
+    message = {
+        "type": handler,
+        "event_id": str(event_id),
+        # Clients in several of the groups drop the repeats
+        "broadcast_id": uuid.uuid4().hex
+    }
+    if event is not None:
+        message["event"] = event
+        message["version"] = event.get("version")
     
-    # Notify each user of the event change
-    for username in usernames:
-        group_name = f"events_{_sanitize_group_name(username)}"
-        print(f"📢 Broadcasting {event_type} for event {event_id} to user: {username}")
-        
-        # Send the message to the group
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": handler,
-                "event_id": str(event_id)
-            }
-        )
+    group_names = [event_group(event_id)]
+    group_names += [geo_tile_group(geo_tile(latitude, longitude)) for latitude, longitude in locations]
+    user_groups = [user_events_group(username) for username in usernames if username]
+    group_names = list(dict.fromkeys(group_names))
+    print(f"📢 Broadcasting {event_type} for event {event_id} to {len(group_names) + len(set(user_groups))} group(s)")
+    
+    # Users addressed directly start following the event
+    messages = [(group_name, message) for group_name in group_names]
+    messages += [(group_name, {**message, "follow": True}) for group_name in dict.fromkeys(user_groups)]
+    
+    # Tiles the event moved out of (or left by going private) only learn
+    # that their copy is stale
+    departed_groups = {geo_tile_group(geo_tile(latitude, longitude)) for latitude, longitude in departed_locations}
+    invalidation = {
+        "type": "event_invalidate",
+        "event_id": str(event_id),
+        "broadcast_id": uuid.uuid4().hex
+    }
+    messages += [(group_name, invalidation) for group_name in sorted(departed_groups - set(group_names))]
+    
+    # Notify every group in one batched send
+    group_send_many(messages)
+
+def broadcast_event_created(event_id, host_username, invited_friends=[], locations=(), event=None):
+    """Notify the host, any invited friends and map viewers that a new event was created"""
+    broadcast_event_update(event_id, 'create', [host_username] + list(invited_friends), locations, event)
+
+def broadcast_event_updated(event_id, usernames=[], locations=(), event=None, departed_locations=()):
+    """Notify everyone watching an event (plus any users not subscribed yet) that it changed"""
+    broadcast_event_update(event_id, 'update', usernames, locations, event, departed_locations)
 
-def broadcast_event_created(event_id, host_username, invited_friends=[]):
-    """Notify the host and any invited friends that a new event was created"""
-    # Create list of users to notify: host + invited friends
-    users_to_notify = [host_username] + invited_friends
-    broadcast_event_update(event_id, 'create', users_to_notify)
-
-def broadcast_event_updated(event_id, host_username, attendees=[], invited_friends=[]):
-    """Notify the host, attendees, and invited friends that an event was updated"""
-    # Create list of users to notify: host + attendees + invited friends
-    users_to_notify = [host_username] + attendees + invited_friends
-    broadcast_event_update(event_id, 'update', users_to_notify)
-
-def broadcast_event_deleted(event_id, host_username, attendees=[], invited_friends=[]):
-    """Notify the host, attendees, and invited friends that an event was deleted"""
-    # Create list of users to notify: host + attendees + invited friends
-    users_to_notify = [host_username] + attendees + invited_friends
-    broadcast_event_update(event_id, 'delete', users_to_notify) 
\ No newline at end of file
+def broadcast_event_deleted(event_id, locations=()):
+    """Notify everyone watching an event that it was deleted"""
+    broadcast_event_update(event_id, 'delete', (), locations)
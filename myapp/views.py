@@ -5,9 +5,17 @@ from django.views.decorators.csrf import csrf_exempt
 from django.db import transaction
 from django.conf import settings
 import json
-from .models import FriendRequest, UserProfile, StudyEvent, EventInvitation, DeclinedInvitation, Device, UserRating, UserReputationStats, UserTrustLevel, UserImage, EventJoinRequest
+from .models import FriendRequest, UserProfile, StudyEvent, EventInvitation, DeclinedInvitation, Device, UserRating, UserReputationStats, UserTrustLevel, UserImage, EventJoinRequest, ActivityLog
+from .models import bump_event_version
 from django.utils import timezone
 from myapp.utils import broadcast_event_created, broadcast_event_updated, broadcast_event_deleted
+from myapp.utils import encode_cursor, decode_cursor, parse_limit
+from myapp.utils import get_idempotency_key, run_idempotent
+from myapp.engagement_buffer import engagement_buffer, is_enabled as engagement_buffer_enabled
+from myapp.event_detail_cache import (
+    make_event_detail_key, get_cached_event_detail, set_cached_event_detail, invalidate_event_detail,
+)
+from myapp.search_cache import make_search_key, get_cached_search, set_cached_search, search_cache_stats
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
@@ -486,6 +494,86 @@ from django.http import JsonResponse
 from django.contrib.auth.models import User
 from .models import StudyEvent
 
+def _public_locations(*placements):
+    """
+    (latitude, longitude) of each (latitude, longitude, on_map) placement
+    of an event that is visible on the map, for geo tile broadcasts
+    """
+    return [
+        (latitude, longitude) for latitude, longitude, on_map in placements
+        if on_map and latitude is not None and longitude is not None
+    ]
+
+def _placement(event):
+    """
+    Where map viewers see the event. Auto-matched events are only visible
+    to matched users (see _can_view_event_feed), so like private events they
+    are never broadcast to geo tiles.
+    """
+    return (event.latitude, event.longitude, event.is_public and not event.auto_matching_enabled)
+
+def _event_fragment(event):
+    """
+    The fields of an event that get_study_events returns to every viewer,
+    plus its version. Sent with WebSocket broadcasts so clients can apply an
+    edit in place; per-viewer fields (invitedFriends, isAutoMatched,
+    matchedUsers) are left for the next full fetch.
+    """
+    return {
+        "id": str(event.id),
+        "title": event.title,
+        "description": event.description or "",
+        "latitude": event.latitude,
+        "longitude": event.longitude,
+        "time": event.time.isoformat(),
+        "end_time": event.end_time.isoformat(),
+        "host": event.host.username,
+        "hostIsCertified": event.host.userprofile.is_certified,
+        "isPublic": event.is_public,
+        "event_type": (event.event_type or "other").lower(),
+        "attendees": list(event.attendees.values_list("username", flat=True)),
+        "max_participants": event.max_participants,
+        "auto_matching_enabled": event.auto_matching_enabled,
+        "interest_tags": event.get_interest_tags() if hasattr(event, 'get_interest_tags') else [],
+        "version": event.version
+    }
+
+def _broadcast_event_saved(event, usernames=(), previous_placement=None, created=False):
+    """
+    Bump the event's version and broadcast it to WebSocket clients after the
+    transaction commits. The serialized fragment is only sent for events
+    every viewer may see (public, not auto-matched); for the rest clients get
+    the ID and refetch through the permission-checked endpoints.
+    previous_placement is the event's placement before an edit: a tile the
+    event left only receives an ID-only invalidation.
+    """
+    if not created:
+        bump_event_version(event)
+    placement = _placement(event)
+    fragment = _event_fragment(event) if placement[2] else None
+    locations = _public_locations(placement)
+    departed_locations = _public_locations(previous_placement) if previous_placement else []
+    event_id = event.id
+    usernames = list(usernames)
+
+    if created:
+        host_username = event.host.username
+        transaction.on_commit(lambda: broadcast_event_created(
+            event_id=event_id,
+            host_username=host_username,
+            invited_friends=usernames,
+            locations=locations,
+            event=fragment
+        ))
+    else:
+        transaction.on_commit(lambda: broadcast_event_updated(
+            event_id=event_id,
+            usernames=usernames,
+            locations=locations,
+            event=fragment,
+            departed_locations=departed_locations
+        ))
+
 @ratelimit(key='user', rate='20/h', method='POST', block=True)
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
@@ -559,27 +647,19 @@ def create_study_event(request):
             
             # Send push notifications outside the transaction (non-critical operations)
             invited_friends = data.get("invited_friends", [])
-            for friend in invited_friends:
-                try:
-                    friend_user = User.objects.get(username=friend)
-                    send_push_notification(
-                        user_id=friend_user.id,
-                        notification_type='event_invitation',
-                        event_id=str(event.id),
-                        event_title=event.title,
-                        from_user=host.username
-                    )
-                except Exception as notif_error:
-                    print(f"⚠️ Failed to send event_invitation to {friend}: {notif_error}")
+            if invited_friends:
+                send_bulk_push_notification(
+                    User.objects.filter(username__in=invited_friends).values_list('id', flat=True),
+                    'event_invitation',
+                    event_id=str(event.id),
+                    event_title=event.title,
+                    from_user=host.username
+                )
             
             # IMPORTANT: Log the created event ID for verification
             
             # Broadcast event creation to WebSocket clients
-            broadcast_event_created(
-                event_id=event.id,
-                host_username=host.username,
-                invited_friends=invited_friends
-            )
+            _broadcast_event_saved(event, usernames=invited_friends, created=True)
             
             # If auto-matching is enabled, do it now in the same transaction
             matched_users = []
@@ -1022,7 +1102,8 @@ def get_study_events(request, username):
                     "auto_matching_enabled": event.auto_matching_enabled,
                     "isAutoMatched": False,
                     "matchedUsers": [],
-                    "interest_tags": event.get_interest_tags() if hasattr(event, 'get_interest_tags') else []
+                    "interest_tags": event.get_interest_tags() if hasattr(event, 'get_interest_tags') else [],
+                    "version": event.version
                 }
                 event_data.append(event_info)
             
@@ -1097,7 +1178,8 @@ def get_study_events(request, username):
                 "auto_matching_enabled": event.auto_matching_enabled,
                 "isAutoMatched": is_user_auto_matched,
                 "matchedUsers": auto_matched_users,
-                "interest_tags": event.get_interest_tags() if hasattr(event, 'get_interest_tags') else []
+                "interest_tags": event.get_interest_tags() if hasattr(event, 'get_interest_tags') else [],
+                "version": event.version
             }
             
             event_data.append(event_info)
@@ -1204,6 +1286,11 @@ def get_user_recent_activity(request, username):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+# Trending: events returned, and how many top stored scores are re-ranked
+# with the exact decay (stored scores lag by up to one refresh interval)
+TRENDING_LIMIT = 20
+TRENDING_CANDIDATES = 100
+
 @ratelimit(key='user', rate='100/h', method='GET', block=True)
 @api_view(['GET'])
 @authentication_classes([JWTAuthentication])
@@ -1212,37 +1299,41 @@ def get_trending_events(request):
     """
     Get trending events sorted by popularity (RSVP count) and recency
     Used by the community hub to show popular events
+
+    Scores are maintained incrementally on RSVP/invite changes (see
+    update_trending_counts) and re-normalized by refresh_trending_scores, so
+    this reads the top candidates from the (is_public, -trending_score)
+    index and only re-applies the exact time decay to those.
     """
+    from django.db.models import prefetch_related_objects
+    from myapp.models import trending_decay
+
     try:
         # Get current time to exclude past events
         now = timezone.now()
         
-        # Get events from the last 7 days OR upcoming events, sorted by popularity
-        from datetime import timedelta
-        week_ago = now - timedelta(days=7)
+        candidates = list(
+            StudyEvent.objects.select_related('host', 'host__userprofile').filter(
+                end_time__gt=now,    # Not yet ended
+                is_public=True       # Only public events for trending
+            ).order_by('-trending_score')[:TRENDING_CANDIDATES]
+        )
         
-        events = StudyEvent.objects.select_related('host', 'host__userprofile').prefetch_related(
-            'attendees', 'invited_friends'
-        ).filter(
-            end_time__gt=now,    # Not yet ended
-            is_public=True       # Only public events for trending
-        ).distinct()
+        # Popularity score with the time decay as of now
+        for event in candidates:
+            event.popularity_score = (event.attendee_count + event.invite_count) * trending_decay(event.time, now)
+        
+        # Sort by popularity score (highest first) and keep the top 20
+        candidates.sort(key=lambda event: event.popularity_score, reverse=True)
+        events = candidates[:TRENDING_LIMIT]
+        prefetch_related_objects(
+            events,
+            Prefetch('attendees', queryset=User.objects.only('username'))
+        )
         
         # Format events with popularity metrics
         event_data = []
         for event in events:
-            # Calculate popularity score
-            rsvp_count = event.attendees.count()
-            invite_count = event.invited_friends.count()
-            total_engagement = rsvp_count + invite_count
-            
-            # Time decay factor (more recent = higher score)
-            hours_since_created = (now - event.time).total_seconds() / 3600
-            time_decay = max(0.1, 1.0 - (hours_since_created / 168))  # Decay over 7 days
-            
-            # Popularity score
-            popularity_score = total_engagement * time_decay
-            
             event_info = {
                 "id": str(event.id),
                 "title": event.title,
@@ -1255,26 +1346,24 @@ def get_trending_events(request):
                 "hostIsCertified": event.host.userprofile.is_certified,
                 "isPublic": event.is_public,
                 "event_type": (event.event_type or "other").lower(),
-                "attendees": list(event.attendees.values_list("username", flat=True)),
+                "attendees": [attendee.username for attendee in event.attendees.all()],
                 "max_participants": event.max_participants,
                 "auto_matching_enabled": event.auto_matching_enabled,
-                "popularity_score": round(popularity_score, 2),
-                "rsvp_count": rsvp_count,
+                "popularity_score": round(event.popularity_score, 2),
+                "rsvp_count": event.attendee_count,
                 "interest_tags": event.get_interest_tags() if hasattr(event, 'get_interest_tags') else []
             }
             event_data.append(event_info)
         
-        # Sort by popularity score (highest first)
-        event_data.sort(key=lambda x: x['popularity_score'], reverse=True)
-        
-        # Limit to top 20 trending events
-        event_data = event_data[:20]
-        
         return JsonResponse({"events": event_data}, safe=False)
         
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+# Community activity feed page sizes
+ACTIVITY_PAGE_SIZE = 50
+ACTIVITY_MAX_PAGE_SIZE = 100
+
 @ratelimit(key='user', rate='100/h', method='GET', block=True)
 @api_view(['GET'])
 @authentication_classes([JWTAuthentication])
@@ -1283,118 +1372,50 @@ def get_recent_activity(request, username):
     """
     Get recent community-wide social activity (RSVPs, comments, likes, shares)
     Used by the community hub to show what's happening in the community
+
+    Reads the ActivityLog newest first, one page at a time:
+        ?limit=50             activities per page (max 100)
+        ?cursor=<next_cursor> continue after the previous page
     """
+    from django.db.models import Q
+
     try:
-        # Get current time
-        now = timezone.now()
-        
-        # Get recent activities from the last 48 hours OR upcoming events
-        from datetime import timedelta
-        two_days_ago = now - timedelta(days=2)
-        
-        activities = []
-        
-        # 1. Recent RSVPs
-        recent_rsvps = StudyEvent.objects.select_related('host').prefetch_related('attendees').filter(
-            time__gte=two_days_ago,
-            attendees__isnull=False
-        ).distinct()
-        
-        for event in recent_rsvps:
-            for attendee in event.attendees.all():
-                activities.append({
-                    "id": f"rsvp_{event.id}_{attendee.id}",
-                    "type": "rsvp",
-                    "username": attendee.username,
-                    "event_title": event.title,
-                    "event_id": str(event.id),
-                    "timestamp": event.time.isoformat(),
-                    "message": f"{attendee.username} joined {event.title}"
-                })
-        
-        # 2. Recent event comments (if EventComment model exists)
-        try:
-            from .models import EventComment
-            recent_comments = EventComment.objects.select_related('user', 'event').filter(
-                created_at__gte=two_days_ago
-            ).order_by('-created_at')[:20]
-            
-            for comment in recent_comments:
-                activities.append({
-                    "id": f"comment_{comment.id}",
-                    "type": "comment",
-                    "username": comment.user.username,
-                    "event_title": comment.event.title,
-                    "event_id": str(comment.event.id),
-                    "timestamp": comment.created_at.isoformat(),
-                    "message": f"{comment.user.username} commented on {comment.event.title}"
-                })
-        except ImportError:
-            pass  # EventComment model doesn't exist
-        
-        # 3. Recent event likes (if EventLike model exists)
         try:
-            from .models import EventLike
-            recent_likes = EventLike.objects.select_related('user', 'event').filter(
-                created_at__gte=two_days_ago
-            ).order_by('-created_at')[:20]
-            
-            for like in recent_likes:
-                activities.append({
-                    "id": f"like_{like.id}",
-                    "type": "like",
-                    "username": like.user.username,
-                    "event_title": like.event.title,
-                    "event_id": str(like.event.id),
-                    "timestamp": like.created_at.isoformat(),
-                    "message": f"{like.user.username} liked {like.event.title}"
-                })
-        except ImportError:
-            pass  # EventLike model doesn't exist
-        
-        # 4. Recent event shares (if EventShare model exists)
-        try:
-            from .models import EventShare
-            recent_shares = EventShare.objects.select_related('user', 'event').filter(
-                created_at__gte=two_days_ago
-            ).order_by('-created_at')[:20]
-            
-            for share in recent_shares:
-                activities.append({
-                    "id": f"share_{share.id}",
-                    "type": "share",
-                    "username": share.user.username,
-                    "event_title": share.event.title,
-                    "event_id": str(share.event.id),
-                    "timestamp": share.created_at.isoformat(),
-                    "message": f"{share.user.username} shared {share.event.title}"
-                })
-        except ImportError:
-            pass  # EventShare model doesn't exist
-        
-        # 5. Recent event creations (include all upcoming events)
-        recent_events = StudyEvent.objects.select_related('host').filter(
-            end_time__gt=now  # All upcoming events
-        ).order_by('-time')[:10]
-        
-        for event in recent_events:
-            activities.append({
-                "id": f"create_{event.id}",
-                "type": "create",
-                "username": event.host.username,
-                "event_title": event.title,
-                "event_id": str(event.id),
-                "timestamp": event.time.isoformat(),
-                "message": f"{event.host.username} created {event.title}"
-            })
-        
-        # Sort all activities by timestamp (most recent first)
-        activities.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        # Limit to 50 most recent activities
-        activities = activities[:50]
+            limit = parse_limit(request.GET.get('limit'), default=ACTIVITY_PAGE_SIZE, maximum=ACTIVITY_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        logs = ActivityLog.objects.order_by('-created_at', '-id')
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                cursor_created, cursor_id = decode_cursor(cursor)
+                cursor_created = datetime.fromisoformat(cursor_created)
+                cursor_id = int(cursor_id)
+            except ValueError:
+                return JsonResponse({"error": "Invalid cursor"}, status=400)
+            logs = logs.filter(Q(created_at__lt=cursor_created) | Q(created_at=cursor_created, id__lt=cursor_id))
+
+        logs = list(logs[:limit + 1])
+        next_cursor = None
+        if len(logs) > limit:
+            logs = logs[:limit]
+            next_cursor = encode_cursor(logs[-1].created_at, logs[-1].id)
+
+        activities = [
+            {
+                "id": f"{log.activity_type}_{log.id}",
+                "type": log.activity_type,
+                "username": log.username,
+                "event_title": log.event_title,
+                "event_id": str(log.event_id),
+                "timestamp": log.created_at.isoformat(),
+                "message": log.message
+            }
+            for log in logs
+        ]
         
-        return JsonResponse({"activities": activities}, safe=False)
+        return JsonResponse({"activities": activities, "next_cursor": next_cursor}, safe=False)
         
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
@@ -1495,12 +1516,7 @@ def rsvp_study_event(request):
                 }
                 
                 # Broadcast event update (user left the event)
-                broadcast_event_updated(
-                    event_id=event.id,
-                    host_username=event.host.username,
-                    attendees=[u.username for u in event.attendees.all()],
-                    invited_friends=[u.username for u in event.invited_friends.all()]
-                )
+                _broadcast_event_saved(event)
                 
                 return JsonResponse({
                     "success": True,
@@ -1640,24 +1656,18 @@ def delete_study_event(request):
         # Store attendees and invited friends before deleting the event
         host_username = event.host.username
         event_title = event.title
+        placement = _placement(event)
         attendees_list = list(event.attendees.all())
         invited_friends_list = list(event.invited_friends.all())
-        attendees = [u.username for u in attendees_list]
-        invited_friends = [u.username for u in invited_friends_list]
         
         # Send cancellation notifications to all attendees and invited friends BEFORE deletion
         all_notified_users = set(attendees_list) | set(invited_friends_list)
-        for notified_user in all_notified_users:
-            if notified_user.id != user.id:  # Don't notify the host
-                try:
-                    send_push_notification(
-                        user_id=notified_user.id,
-                        notification_type='event_cancellation',
-                        event_title=event_title,
-                        host_name=host_username
-                    )
-                except Exception as notif_error:
-                    logger.warning(f"Failed to send cancellation notification to {notified_user.username}: {notif_error}")
+        send_bulk_push_notification(
+            [notified_user.id for notified_user in all_notified_users if notified_user.id != user.id],  # Don't notify the host
+            'event_cancellation',
+            event_title=event_title,
+            host_name=host_username
+        )
         
         # Delete the event atomically
         from django.db import transaction
@@ -1669,9 +1679,7 @@ def delete_study_event(request):
         try:
             broadcast_event_deleted(
                 event_id=str(event_id),
-                host_username=host_username,
-                attendees=attendees,
-                invited_friends=invited_friends
+                locations=_public_locations(placement)
             )
         except Exception as broadcast_error:
             logger.error(f"WebSocket broadcast failed: {broadcast_error}")
@@ -1772,6 +1780,8 @@ def update_study_event(request):
             if event.host != user:
                 return JsonResponse({"error": "Only the host can update this event"}, status=403)
             
+            previous_placement = _placement(event)
+            
             # Update event fields
             if "title" in data:
                 event.title = data["title"]
@@ -1806,16 +1816,8 @@ def update_study_event(request):
             
             event.save()
             
-            # Broadcast event update to WebSocket clients
-            attendees = [u.username for u in event.attendees.all()]
-            invited_friends = [u.username for u in event.invited_friends.all()]
-            
-            broadcast_event_updated(
-                event_id=event_uuid,
-                host_username=event.host.username,
-                attendees=attendees,
-                invited_friends=invited_friends
-            )
+            # Broadcast event update to WebSocket clients (old and new map tiles)
+            _broadcast_event_saved(event, previous_placement=previous_placement)
             
             return JsonResponse({
                 "success": True,
@@ -1881,6 +1883,10 @@ def get_user_profile(request, username):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+# Keyset pagination defaults for the search endpoints
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 100
+
 @ratelimit(key='ip', rate='500/h', method='GET', block=True)
 @api_view(['GET'])
 @authentication_classes([JWTAuthentication])
@@ -1891,7 +1897,13 @@ def search_events(request):
         public_only = request.GET.get("public_only", "false").lower() == "true"
         certified_only = request.GET.get("certified_only", "false").lower() == "true"
 
-        qs = StudyEvent.objects.all()
+        try:
+            limit = parse_limit(request.GET.get("limit"), default=SEARCH_PAGE_SIZE, maximum=SEARCH_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({"error": "Invalid limit"}, status=400)
+
+        # ✅ PERFORMANCE: Host is joined in, not fetched per result
+        qs = StudyEvent.objects.select_related('host')
 
         # If user typed a text query, match event titles
         if query:
@@ -1906,9 +1918,14 @@ def search_events(request):
         if certified_only:
             qs = qs.filter(host__userprofile__is_certified=True)
 
+        try:
+            events, next_cursor = _search_page(qs, request.GET.get("cursor"), limit)
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+
         # Build JSON
         data = []
-        for event in qs:
+        for event in events:
             data.append({
                 "id": str(event.id),
                 "title": event.title,
@@ -1921,67 +1938,130 @@ def search_events(request):
                 # ...
             })
 
-        return JsonResponse({"events": data}, safe=False)
+        return JsonResponse({"events": data, "next_cursor": next_cursor}, safe=False)
 
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
 
-# Try to import SentenceTransformer, but make it optional
-try:
-    from sentence_transformers import SentenceTransformer
-    import numpy as np
-    SEMANTIC_SEARCH_AVAILABLE = True
-    MODEL = None
-except ImportError:
-    SEMANTIC_SEARCH_AVAILABLE = False
-    MODEL = None
+def _search_page(qs, cursor, limit):
+    """
+    Keyset-paginate an event queryset on (time, id) so only one page is ever
+    materialized. Returns (events, next_cursor); raises ValueError for a bad cursor.
+    """
+    from django.db.models import Q
+
+    qs = qs.order_by('time', 'id')
+    if cursor:
+        cursor_time, cursor_id = decode_cursor(cursor)
+        cursor_time = datetime.fromisoformat(cursor_time)
+        cursor_id = uuid.UUID(cursor_id)
+        qs = qs.filter(Q(time__gt=cursor_time) | Q(time=cursor_time, id__gt=cursor_id))
+
+    events = list(qs[:limit + 1])
+    next_cursor = None
+    if len(events) > limit:
+        events = events[:limit]
+        next_cursor = encode_cursor(events[-1].time, events[-1].id)
+    return events, next_cursor
+
+def _search_facets(qs):
+    """
+    Count a filtered event queryset by event type, host certification and
+    visibility using one grouped aggregation.
+    """
+    from django.db.models import Count
+
+    facets = {
+        "event_type": {choice: 0 for choice, _ in StudyEvent.EVENT_TYPE_CHOICES},
+        "host_certified": {"certified": 0, "not_certified": 0},
+        "visibility": {"public": 0, "private": 0},
+    }
+    groups = (
+        qs.order_by()
+        .values('event_type', 'is_public', 'host__userprofile__is_certified')
+        .annotate(count=Count('id'))
+    )
+    for group in groups:
+        count = group['count']
+        event_type = (group['event_type'] or 'other').lower()
+        facets["event_type"][event_type] = facets["event_type"].get(event_type, 0) + count
+        certified_key = "certified" if group['host__userprofile__is_certified'] else "not_certified"
+        facets["host_certified"][certified_key] += count
+        facets["visibility"]["public" if group['is_public'] else "private"] += count
+    return facets
+
+def _search_result_queryset():
+    """Fixed prefetch plan for search results: 3 queries per page regardless of page size"""
+    usernames_only = User.objects.only('username')
+    return StudyEvent.objects.select_related('host', 'host__userprofile').prefetch_related(
+        Prefetch('invited_friends', queryset=usernames_only),
+        Prefetch('attendees', queryset=usernames_only),
+    )
+
+
+# Semantic search: embeddings come from the shared embedding server
+# (run_embedding_server). Nothing heavy is imported here, so web workers
+# start fast, and without the server semantic search is simply skipped.
+from django.core.cache import cache
+from myapp.embedding_service import embed_texts, semantic_search_available
+
+def _cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
 
 def semantic_search(query, events):
     """
     Performs semantic search over the given events based on the query.
-    Returns the top 5 events ranked by cosine similarity.
+    Returns the top 5 events ranked by cosine similarity, or no events when
+    the embeddings can't be computed.
     """
-    if not SEMANTIC_SEARCH_AVAILABLE:
-        return events[:5]
-    
-    global MODEL
-    if MODEL is None:
-        MODEL = SentenceTransformer('all-MiniLM-L6-v2')
-        
-    # Compute embedding for the query
-    query_embedding = MODEL.encode(query, convert_to_numpy=True)
-    similarities = []
-    
-    for event in events:
-        emb = get_event_embedding(event)
-        # Calculate cosine similarity
-        sim = np.dot(query_embedding, emb) / (np.linalg.norm(query_embedding) * np.linalg.norm(emb))
-        similarities.append(sim)
+    query_embedding = embed_texts([query])
+    if not query_embedding:
+        return []
+    query_embedding = query_embedding[0]
+
+    embeddings = get_event_embeddings(events)
+    if any(embedding is None for embedding in embeddings):
+        return []
+    similarities = [_cosine_similarity(query_embedding, emb) for emb in embeddings]
     
     # Sort events by similarity score (highest first)
     ranked_events = sorted(zip(events, similarities), key=lambda x: x[1], reverse=True)
     top_events = [event for event, sim in ranked_events[:5]]
     return top_events
 
+def get_event_embeddings(events):
+    """
+    Returns the embeddings for the events' titles and descriptions (None
+    for any that couldn't be computed). Cached embeddings are reused; the
+    rest are requested in chunks, each cached as soon as it arrives.
+    """
+    cache_keys = {f'event_embedding_{event.id}': event for event in events}
+    cached = cache.get_many(list(cache_keys))
+
+    missing = [key for key in cache_keys if key not in cached]
+    if missing:
+        texts = [f"{cache_keys[key].title} {cache_keys[key].description or ''}" for key in missing]
+
+        def cache_chunk(start, vectors):
+            computed = dict(zip(missing[start:start + len(vectors)], vectors))
+            cache.set_many(computed, timeout=3600)  # Cache for 1 hour
+            cached.update(computed)
+
+        embed_texts(texts, on_chunk=cache_chunk)
+
+    return [cached.get(key) for key in cache_keys]
+
 def get_event_embedding(event):
     """
     Returns the embedding for an event's title and description.
     Caches the embedding to avoid re-computation.
     """
-    if not SEMANTIC_SEARCH_AVAILABLE:
-        return None
-    
-    global MODEL
-    if MODEL is None:
-        MODEL = SentenceTransformer('all-MiniLM-L6-v2')
-        
-    cache_key = f'event_embedding_{event.id}'
-    embedding = cache.get(cache_key)
-    if embedding is None:
-        text = f"{event.title} {event.description or ''}"
-        embedding = MODEL.encode(text, convert_to_numpy=True)
-        cache.set(cache_key, embedding, timeout=3600)  # Cache for 1 hour
-    return embedding
+    return get_event_embeddings([event])[0] or None
 
 @ratelimit(key='ip', rate='500/h', method='GET', block=True)
 @api_view(['GET'])
@@ -1994,33 +2074,79 @@ def enhanced_search_events(request):
         certified_only = request.GET.get("certified_only", "false").lower() == "true"
         event_type = request.GET.get("event_type", "").lower()
         use_semantic = request.GET.get("semantic", "false").lower() == "true"
+        include_facets = request.GET.get("facets", "false").lower() == "true"
 
-        qs = StudyEvent.objects.all()
-
-        # Basic search filtering
-        if query:
-            qs = qs.filter(Q(title__icontains=query) | Q(description__icontains=query))
-        if public_only:
-            qs = qs.filter(is_public=True)
-        if certified_only:
-            qs = qs.filter(host__userprofile__is_certified=True)
-        if event_type:
-            qs = qs.filter(event_type__iexact=event_type)
+        try:
+            limit = parse_limit(request.GET.get("limit"), default=SEARCH_PAGE_SIZE, maximum=SEARCH_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({"error": "Invalid limit"}, status=400)
+        cursor = request.GET.get("cursor") or ""
+
+        # ✅ PERFORMANCE: Popular queries are served from the search cache (one page of event IDs)
+        cache_key = make_search_key(
+            'enhanced', query,
+            public_only=public_only,
+            certified_only=certified_only,
+            event_type=event_type,
+            semantic=use_semantic,
+            facets=include_facets,
+            cursor=cursor,
+            limit=limit,
+        )
+        cached = get_cached_search(cache_key)
+
+        if cached is not None:
+            event_ids = cached["ids"]
+            next_cursor = cached["next_cursor"]
+            facets = cached.get("facets")
+            events_by_id = _search_result_queryset().in_bulk(event_ids)
+            # Preserve result order; skip events deleted since the page was cached
+            events = [events_by_id[event_id] for event_id in event_ids if event_id in events_by_id]
+        else:
+            qs = _search_result_queryset()
+
+            # Basic search filtering
+            if query:
+                qs = qs.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            if public_only:
+                qs = qs.filter(is_public=True)
+            if certified_only:
+                qs = qs.filter(host__userprofile__is_certified=True)
+            if event_type:
+                qs = qs.filter(event_type__iexact=event_type)
 
-        # Use semantic search if enabled, available, and no basic results found
-        if use_semantic and SEMANTIC_SEARCH_AVAILABLE and query and qs.count() == 0:
             try:
-                events_list = list(StudyEvent.objects.all())
-                semantic_results = semantic_search(query, events_list)
-                if semantic_results:
-                    semantic_ids = [str(event.id) for event in semantic_results]
-                    qs = StudyEvent.objects.filter(id__in=semantic_ids)
-            except Exception as e:
-                pass
+                events, next_cursor = _search_page(qs, cursor, limit)
+            except ValueError:
+                return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+            # Facets describe the whole filtered result set, not just this page
+            facets = _search_facets(qs) if include_facets else None
+
+            # Use semantic search if enabled, available, and no basic results found
+            if use_semantic and query and not events and not cursor and semantic_search_available():
+                try:
+                    events_list = list(StudyEvent.objects.all())
+                    semantic_results = semantic_search(query, events_list)
+                    if semantic_results:
+                        # Semantic results are a single ranked page
+                        events_by_id = _search_result_queryset().in_bulk([event.id for event in semantic_results])
+                        events = [events_by_id[event.id] for event in semantic_results if event.id in events_by_id]
+                        next_cursor = None
+                        if include_facets:
+                            facets = _search_facets(StudyEvent.objects.filter(id__in=events_by_id.keys()))
+                except Exception as e:
+                    pass
+
+            set_cached_search(cache_key, {
+                "ids": [event.id for event in events],
+                "next_cursor": next_cursor,
+                "facets": facets,
+            })
 
         # Build JSON response data
         data = []
-        for event in qs:
+        for event in events:
             data.append({
                 "id": str(event.id),
                 "title": event.title,
@@ -2033,13 +2159,28 @@ def enhanced_search_events(request):
                 "hostIsCertified": event.host.userprofile.is_certified,
                 "isPublic": event.is_public,
                 "event_type": event.event_type.lower() if event.event_type else "other",
-                "invitedFriends": list(event.invited_friends.values_list("username", flat=True)),
-                "attendees": list(event.attendees.values_list("username", flat=True)),
+                # Prefetched above - no per-result queries
+                "invitedFriends": [u.username for u in event.invited_friends.all()],
+                "attendees": [u.username for u in event.attendees.all()],
             })
 
-        return JsonResponse({"events": data}, safe=False)
+        response_data = {"events": data, "next_cursor": next_cursor}
+        if include_facets:
+            response_data["facets"] = facets
+        response = JsonResponse(response_data, safe=False)
+        response["X-Search-Cache"] = "hit" if cached is not None else "miss"
+        return response
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_search_cache_stats(request):
+    """Cumulative search cache hits, misses and hit ratio (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+    return JsonResponse(search_cache_stats())
+
 @ratelimit(key='user', rate='5/h', method='POST', block=True)
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
@@ -2189,7 +2330,7 @@ def get_invitations(request, username):
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.models import User
-from .models import StudyEvent, EventComment, EventLike, EventShare
+from .models import StudyEvent, EventComment, EventLike, EventShare, ActivityLog, increment_counter
 import json
 import uuid
 
@@ -2233,15 +2374,23 @@ def record_event_share(request):
             # Fetch event
             event = StudyEvent.objects.get(id=uuid.UUID(event_id))
 
-            # Create share record
-            share = EventShare.objects.create(
-                user=user,
-                event=event,
-                shared_platform=platform
-            )
+            if engagement_buffer_enabled():
+                # Buffered; written with other shares of this event on the next flush
+                total_shares = engagement_buffer.add_share(user, event, platform)
+            else:
+                # Create share record and bump the event's share counter together
+                with transaction.atomic():
+                    share = EventShare.objects.create(
+                        user=user,
+                        event=event,
+                        shared_platform=platform
+                    )
+                    increment_counter(StudyEvent, event.id, 'share_count')
+                    ActivityLog.record('share', user, event)
+                    transaction.on_commit(lambda: invalidate_event_detail(event.id))
 
-            # Get total shares
-            total_shares = EventShare.objects.filter(event=event).count()
+                # Get total shares
+                total_shares = StudyEvent.objects.values_list('share_count', flat=True).get(id=event.id)
 
             return JsonResponse({
                 "success": True,
@@ -2263,68 +2412,64 @@ def get_event_interactions(request, event_id):
     Retrieve all interactions (comments, likes, shares) for a specific event
     with detailed like tracking
     """
+    from django.db.models import Count, Min, Q
+
     try:
         event = StudyEvent.objects.get(id=uuid.UUID(event_id))
 
-        # Detailed comment like tracking
-        def get_nested_comments(parent=None):
-            base_comments = EventComment.objects.filter(
-                event=event, 
-                parent=parent
-            ).order_by('created_at')
-            
-            comments_data = []
-            for comment in base_comments:
-                # Count likes for this specific comment
-                comment_likes = EventLike.objects.filter(
-                    event=event, 
-                    comment=comment
-                ).count()
-                
-                # Debug print for comment likes
-                
-                comment_data = {
-                    "id": comment.id,
-                    "text": comment.text,
-                    "username": comment.user.username,
-                    "created_at": comment.created_at.isoformat(),
-                    "likes": comment_likes,  # Add like count
-                    "replies": get_nested_comments(comment)
-                }
-                comments_data.append(comment_data)
-            
-            return comments_data
-
-        # Root level comments with likes
-        comments = get_nested_comments()
+        # ✅ PERFORMANCE: Load the whole thread in one query and build the tree
+        # in memory; like counts come from the denormalized counters
+        thread = list(
+            EventComment.objects
+                .filter(event=event)
+                .select_related('user')
+                .order_by('created_at', 'id')
+        )
+        nodes = {
+            comment.id: {
+                "id": comment.id,
+                "text": comment.text,
+                "username": comment.user.username,
+                "created_at": comment.created_at.isoformat(),
+                "likes": comment.like_count,  # Denormalized counter
+                "replies": []
+            }
+            for comment in thread
+        }
+        # Root level comments with their replies nested underneath
+        comments = []
+        for comment in thread:
+            parent = nodes.get(comment.parent_id)
+            (parent["replies"] if parent else comments).append(nodes[comment.id])
 
         # Event-level likes (without comments)
-        event_likes = EventLike.objects.filter(event=event, comment__isnull=True).count()
-
-        # Detailed likes tracking
-        likes_by_user = {}
-        for like in EventLike.objects.filter(event=event):
-            username = like.user.username
-            if like.comment:
-                # Comment-specific like
-                if username not in likes_by_user:
-                    likes_by_user[username] = {"event_likes": 0, "comment_likes": 0}
-                likes_by_user[username]["comment_likes"] += 1
-            else:
-                # Event-level like
-                if username not in likes_by_user:
-                    likes_by_user[username] = {"event_likes": 0, "comment_likes": 0}
-                likes_by_user[username]["event_likes"] += 1
-
-        # Debug print for likes breakdown
-        for username, likes in likes_by_user.items():
-            pass
+        event_likes = event.like_count
+
+        # ✅ PERFORMANCE: Per-user like breakdown from one grouped aggregation,
+        # in order of each user's first like
+        likes_by_user = {
+            row['user__username']: {
+                "event_likes": row['event_likes'],
+                "comment_likes": row['comment_likes']
+            }
+            for row in EventLike.objects.filter(event=event)
+                .values('user__username')
+                .annotate(
+                    event_likes=Count('id', filter=Q(comment__isnull=True)),
+                    comment_likes=Count('id', filter=Q(comment__isnull=False)),
+                    first_like=Min('id')
+                )
+                .order_by('first_like')
+        }
 
-        # Shares breakdown
-        shares_breakdown = {}
-        shares = EventShare.objects.filter(event=event)
-        for platform in ['whatsapp', 'facebook', 'twitter', 'instagram', 'other']:
-            shares_breakdown[platform] = shares.filter(shared_platform=platform).count()
+        # ✅ PERFORMANCE: Shares breakdown from one grouped aggregation
+        shares_breakdown = {platform: 0 for platform in ['whatsapp', 'facebook', 'twitter', 'instagram', 'other']}
+        shares_breakdown.update(
+            EventShare.objects.filter(event=event, shared_platform__in=shares_breakdown)
+            .values('shared_platform')
+            .annotate(count=Count('id'))
+            .values_list('shared_platform', 'count')
+        )
 
         return JsonResponse({
             "comments": comments,
@@ -2334,7 +2479,7 @@ def get_event_interactions(request, event_id):
                 "detailed_breakdown": likes_by_user
             },
             "shares": {
-                "total": shares.count(),
+                "total": event.share_count,
                 "breakdown": shares_breakdown
             }
         })
@@ -2346,6 +2491,58 @@ def get_event_interactions(request, event_id):
 
 # Add these functions to your views.py file
 
+# Feed pagination: posts per page and replies shown inline under each post
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 50
+FEED_REPLY_PREVIEW = 3
+FEED_MAX_REPLIES_PAGE_SIZE = 50
+
+def _can_view_event_feed(event, username):
+    """
+    Auto-matched events are only visible to matched users, the host,
+    attendees and directly invited users (same rule as get_study_events)
+    """
+    if not event.auto_matching_enabled:
+        return True
+    if event.host.username == username:
+        return True
+    if EventInvitation.objects.filter(event=event, is_auto_matched=True, user__username=username).exists():
+        return True
+    if event.attendees.filter(username=username).exists():
+        return True
+    return event.invited_friends.filter(username=username).exists()
+
+def _feed_replies_queryset():
+    return (
+        EventComment.objects
+            .select_related('user')
+            .prefetch_related('images')
+            .order_by('created_at', 'id')
+    )
+
+def _serialize_feed_comment(comment, user_likes, replies=None):
+    image_urls = [image.image_url for image in comment.images.all()]
+    return {
+        "id": comment.id,
+        "text": comment.text,
+        "username": comment.user.username,
+        "created_at": comment.created_at.isoformat(),
+        "imageURLs": image_urls if image_urls else None,
+        "likes": comment.like_count,  # Denormalized counter
+        "isLikedByCurrentUser": comment.id in user_likes,
+        "replies": replies if replies is not None else []  # We don't support nested replies beyond 1 level
+    }
+
+def _user_liked_comment_ids(user, event, comments):
+    """IDs of the given comments that user has liked, in one query"""
+    return set(
+        EventLike.objects.filter(
+            user=user,
+            event=event,
+            comment_id__in=[comment.id for comment in comments]
+        ).values_list('comment_id', flat=True)
+    )
+
 @ratelimit(key='ip', rate='100/h', method='GET', block=True)
 @api_view(['GET'])
 @authentication_classes([JWTAuthentication])
@@ -2354,164 +2551,439 @@ def get_event_feed(request, event_id):
     """
     Retrieve event feed data (posts, likes, shares) in the format expected by the new Swift implementation.
     This combines comments, likes, and shares into the new Posts structure.
+
+    Posts are returned newest first, one page at a time:
+        ?limit=20            posts per page (max 50)
+        ?cursor=<next_cursor> continue after the previous page
+    Each post includes its first FEED_REPLY_PREVIEW replies; when it has more,
+    "replies_cursor" can be passed to get_event_feed_replies.
     """
+    from django.db.models import Count, Q, Sum
+
     try:
         # Use authenticated user instead of query parameter
         current_user = request.user
         current_username = getattr(current_user, 'username', '') or ''
         
         # Convert string ID to UUID
-        event = StudyEvent.objects.get(id=uuid.UUID(event_id))
+        event = StudyEvent.objects.select_related('host').get(id=uuid.UUID(event_id))
         
         # IMPORTANT: Check if the user should be able to see this event
-        # Similar to the filtering logic in get_study_events
-        
-        # Check if this is an auto-matched event
-        if event.auto_matching_enabled:
-            
-            # Get the list of matched users for this event
-            auto_matched_invitations = EventInvitation.objects.filter(
-                event=event,
-                is_auto_matched=True
-            )
-            matched_users = [invitation.user.username for invitation in auto_matched_invitations]
-            
-            # Check if the current user is in the matched users list
-            is_matched = current_username in matched_users
-            
-            # Check if the user is the host, an attendee, or directly invited
-            is_host = event.host.username == current_username
-            is_attendee = event.attendees.filter(username=current_username).exists()
-            is_invited = event.invited_friends.filter(username=current_username).exists()
-            
-            # If this is an auto-matched event AND user is not in matched_users list,
-            # AND user is not host, attendee, or directly invited, then deny access
-            if (not is_matched and not is_host and not is_attendee and not is_invited):
-                return JsonResponse({"error": "You do not have access to this event"}, status=403)
-            else:
-                if is_matched:
-                    pass
-                elif is_host:
-                    pass
-                elif is_attendee:
-                    pass
-                elif is_invited:
-                    pass
-        
-        # ✅ PERFORMANCE: Optimize database queries to prevent N+1 issues
-        from django.db.models import Count, Case, When, IntegerField
-        
-        # Get all comments with optimized queries
-        comments = (
+        if not _can_view_event_feed(event, current_username):
+            return JsonResponse({"error": "You do not have access to this event"}, status=403)
+
+        try:
+            limit = parse_limit(request.GET.get('limit'), default=FEED_PAGE_SIZE, maximum=FEED_MAX_PAGE_SIZE)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        
+        # ✅ PERFORMANCE: Keyset pagination on (created_at, id) over the
+        # (event, parent, created_at) index, and a sliced replies prefetch, so
+        # one page costs the same however long the thread is
+        posts_queryset = (
             EventComment.objects
                 .filter(event=event, parent=None)
                 .select_related('user')
                 .prefetch_related(
                     'images',
+                    # One extra reply tells us whether to hand out a replies cursor
                     Prefetch(
                         'replies',
-                        queryset=EventComment.objects.select_related('user').prefetch_related('images')
+                        queryset=_feed_replies_queryset()[:FEED_REPLY_PREVIEW + 1],
+                        to_attr='reply_preview'
                     )
                 )
-                .annotate(
-                    # Count likes for each comment in a single query
-                    likes_count=Count('eventlike', distinct=True)
-                )
-                .order_by('-created_at')
+                .order_by('-created_at', '-id')
+        )
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                cursor_created, cursor_id = decode_cursor(cursor)
+                cursor_created = datetime.fromisoformat(cursor_created)
+                cursor_id = int(cursor_id)
+            except ValueError:
+                return JsonResponse({"error": "Invalid cursor"}, status=400)
+            posts_queryset = posts_queryset.filter(
+                Q(created_at__lt=cursor_created) | Q(created_at=cursor_created, id__lt=cursor_id)
+            )
+
+        comments = list(posts_queryset[:limit + 1])
+        next_cursor = None
+        if len(comments) > limit:
+            comments = comments[:limit]
+            next_cursor = encode_cursor(comments[-1].created_at, comments[-1].id)
+        
+        # ✅ PERFORMANCE: Totals come from the denormalized counters
+        comment_likes_total = EventComment.objects.filter(event=event).aggregate(
+            total=Sum('like_count')
+        )['total'] or 0
+        likes_total = event.like_count + comment_likes_total
+        likes_users = list(
+            EventLike.objects.filter(event=event, comment__isnull=True)
+            .values_list('user__username', flat=True)
         )
-        
-        # ✅ PERFORMANCE: Get all likes data in optimized queries
-        likes_data = EventLike.objects.filter(event=event).values('user__username', 'comment_id')
-        likes_total = likes_data.count()
-        likes_users = list(likes_data.filter(comment__isnull=True).values_list('user__username', flat=True))
-        
-        # ✅ PERFORMANCE: Get all shares data in optimized queries
-        shares_data = EventShare.objects.filter(event=event)
-        shares_total = shares_data.count()
         
         # ✅ PERFORMANCE: Get shares breakdown in a single query using aggregation
-        from django.db.models import Count
         shares_breakdown = dict(
-            shares_data.values('shared_platform')
+            EventShare.objects.filter(event=event)
+            .values('shared_platform')
             .annotate(count=Count('id'))
             .values_list('shared_platform', 'count')
         )
+        shares_total = event.share_count
         
         # Ensure all platforms are represented
         for platform in ['whatsapp', 'facebook', 'twitter', 'instagram', 'other']:
             if platform not in shares_breakdown:
                 shares_breakdown[platform] = 0
         
-        # ✅ PERFORMANCE: Pre-fetch all user likes to avoid N+1 queries
-        user_likes = set(
-            EventLike.objects.filter(
-                user=current_user, 
-                event=event
-            ).values_list('comment_id', flat=True)
-        )
+        # ✅ PERFORMANCE: Only look up likes for the posts and replies on this page
+        page_replies = [reply for comment in comments for reply in comment.reply_preview[:FEED_REPLY_PREVIEW]]
+        user_likes = _user_liked_comment_ids(current_user, event, comments + page_replies)
+
+        if engagement_buffer_enabled():
+            # Read-your-writes: overlay likes and shares not flushed yet
+            pending_likes = engagement_buffer.pending_like_deltas(event.id)
+            likes_total = max(0, likes_total + sum(pending_likes.values()))
+            shares_total += engagement_buffer.pending_share_count(event.id)
+            liked_event = engagement_buffer.pending_like_state(current_user.id, event.id)
+            if liked_event is True and current_username not in likes_users:
+                likes_users.append(current_username)
+            elif liked_event is False and current_username in likes_users:
+                likes_users.remove(current_username)
+            user_likes = engagement_buffer.apply_pending_likes(current_user.id, event.id, user_likes)
+            for comment in comments + page_replies:
+                comment.like_count = max(0, comment.like_count + pending_likes.get(comment.id, 0))
         
         # Format posts data in the format expected by the Swift implementation
         posts_data = []
         for comment in comments:
-            # ✅ PERFORMANCE: Use pre-fetched data instead of individual queries
-            is_liked = comment.id in user_likes
-            comment_likes_count = comment.likes_count  # Use annotated count
-            
-            # Collect image URLs for the top-level comment
-            top_image_urls = list(comment.images.values_list('image_url', flat=True))
-            
-            # ✅ PERFORMANCE: Process replies using pre-fetched data
-            replies = []
-            for reply in comment.replies.all():  # Use prefetched replies
-                reply_is_liked = reply.id in user_likes
-                # Note: We need to add likes_count annotation to replies too
-                reply_likes_count = EventLike.objects.filter(
-                    event=event,
-                    comment=reply
-                ).count()  # This is still needed for replies
-                reply_image_urls = list(reply.images.values_list('image_url', flat=True))
-                replies.append({
-                    "id": reply.id,
-                    "text": reply.text,
-                    "username": reply.user.username,
-                    "created_at": reply.created_at.isoformat(),
-                    "imageURLs": reply_image_urls if reply_image_urls else None,
-                    "likes": reply_likes_count,
-                    "isLikedByCurrentUser": reply_is_liked,
-                    "replies": []  # We don't support nested replies beyond 1 level
-                })
-            
-            # Build the post structure
-            post = {
-                "id": comment.id,
-                "text": comment.text,
-                "username": comment.user.username,
-                "created_at": comment.created_at.isoformat(),
-                "imageURLs": top_image_urls if top_image_urls else None,
-                "likes": comment_likes_count,
-                "isLikedByCurrentUser": is_liked,
-                "replies": replies
-            }
+            preview = comment.reply_preview
+            replies = [
+                _serialize_feed_comment(reply, user_likes)
+                for reply in preview[:FEED_REPLY_PREVIEW]
+            ]
+            post = _serialize_feed_comment(comment, user_likes, replies)
+            post["replies_cursor"] = (
+                encode_cursor(preview[FEED_REPLY_PREVIEW - 1].created_at, preview[FEED_REPLY_PREVIEW - 1].id)
+                if len(preview) > FEED_REPLY_PREVIEW else None
+            )
             posts_data.append(post)
         
         # Return the event feed data
         return JsonResponse({
             "posts": posts_data,
+            "next_cursor": next_cursor,
             "likes": {
                 "total": likes_total,
                 "users": likes_users
             },
             "shares": {
-                "total": shares_total,
+                "total": shares_total,
+                "breakdown": shares_breakdown
+            }
+        })
+        
+    except StudyEvent.DoesNotExist:
+        return JsonResponse({"error": "Event not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@ratelimit(key='ip', rate='200/h', method='GET', block=True)
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_event_feed_replies(request, event_id, post_id):
+    """
+    Load more replies for one feed post, oldest first.
+        ?cursor=<replies_cursor>  from the post in get_event_feed, or the
+                                  previous response's next_cursor
+        ?limit=20                 replies per page (max 50)
+    """
+    from django.db.models import Q
+
+    try:
+        current_user = request.user
+        event = StudyEvent.objects.select_related('host').get(id=uuid.UUID(event_id))
+
+        if not _can_view_event_feed(event, getattr(current_user, 'username', '') or ''):
+            return JsonResponse({"error": "You do not have access to this event"}, status=403)
+
+        if not EventComment.objects.filter(id=post_id, event=event, parent=None).exists():
+            return JsonResponse({"error": "Post not found"}, status=404)
+
+        try:
+            limit = parse_limit(request.GET.get('limit'), default=FEED_PAGE_SIZE, maximum=FEED_MAX_REPLIES_PAGE_SIZE)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        replies_queryset = _feed_replies_queryset().filter(event=event, parent_id=post_id)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                cursor_created, cursor_id = decode_cursor(cursor)
+                cursor_created = datetime.fromisoformat(cursor_created)
+                cursor_id = int(cursor_id)
+            except ValueError:
+                return JsonResponse({"error": "Invalid cursor"}, status=400)
+            replies_queryset = replies_queryset.filter(
+                Q(created_at__gt=cursor_created) | Q(created_at=cursor_created, id__gt=cursor_id)
+            )
+
+        replies = list(replies_queryset[:limit + 1])
+        next_cursor = None
+        if len(replies) > limit:
+            replies = replies[:limit]
+            next_cursor = encode_cursor(replies[-1].created_at, replies[-1].id)
+
+        user_likes = _user_liked_comment_ids(current_user, event, replies)
+        return JsonResponse({
+            "replies": [_serialize_feed_comment(reply, user_likes) for reply in replies],
+            "next_cursor": next_cursor
+        })
+
+    except StudyEvent.DoesNotExist:
+        return JsonResponse({"error": "Event not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+# Event detail read-model: posts and attendees embedded in the cached entry
+EVENT_DETAIL_TOP_POSTS = 3
+EVENT_DETAIL_ATTENDEE_PREVIEW = 5
+
+def _build_event_detail(event):
+    """
+    Viewer-independent part of the event detail screen: event fields,
+    engagement counts, top posts, attendee preview and auto-matched users
+    """
+    from django.db.models import Count
+
+    shares_breakdown = {platform: 0 for platform in ['whatsapp', 'facebook', 'twitter', 'instagram', 'other']}
+    shares_breakdown.update(
+        EventShare.objects.filter(event=event, shared_platform__in=shares_breakdown)
+        .values('shared_platform')
+        .annotate(count=Count('id'))
+        .values_list('shared_platform', 'count')
+    )
+
+    top_posts = (
+        EventComment.objects
+            .filter(event=event, parent=None)
+            .select_related('user')
+            .prefetch_related('images')
+            .order_by('-like_count', '-created_at', '-id')[:EVENT_DETAIL_TOP_POSTS]
+    )
+
+    attendee_count = event.attendees.count()
+    attendee_preview = list(
+        event.attendees.order_by('username').values_list('username', flat=True)[:EVENT_DETAIL_ATTENDEE_PREVIEW]
+    )
+
+    auto_matched_users = list(
+        EventInvitation.objects.filter(event=event, is_auto_matched=True)
+        .values_list('user__username', flat=True)
+    )
+
+    return {
+        "event": {
+            "id": str(event.id),
+            "title": event.title,
+            "description": event.description,
+            "host": event.host.username,
+            "host_is_certified": getattr(event.host.userprofile, 'is_certified', False),
+            "latitude": event.latitude,
+            "longitude": event.longitude,
+            "time": event.time.isoformat(),
+            "end_time": event.end_time.isoformat(),
+            "is_public": event.is_public,
+            "auto_matching_enabled": event.auto_matching_enabled,
+            "event_type": event.event_type,
+            "max_participants": event.max_participants,
+        },
+        "engagement": {
+            "likes": event.like_count,
+            "comments": event.comment_count,
+            "shares": {
+                "total": event.share_count,
                 "breakdown": shares_breakdown
             }
+        },
+        "top_posts": [_serialize_feed_comment(post, set()) for post in top_posts],
+        "attendees": {
+            "count": attendee_count,
+            "preview": attendee_preview
+        },
+        "auto_matched_users": auto_matched_users,
+    }
+
+@ratelimit(key='ip', rate='200/h', method='GET', block=True)
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_event_detail(request, event_id):
+    """
+    Everything the event detail screen needs in one round trip: the event,
+    engagement counts, top posts, attendee preview and auto-matched users.
+
+    The shared part comes from a cached read-model (see event_detail_cache)
+    that engagement and RSVP writes invalidate; only the current user's
+    like flags are looked up per request.
+    """
+    from django.db.models import Q
+
+    try:
+        try:
+            event_uuid = uuid.UUID(event_id)
+        except ValueError:
+            return JsonResponse({"error": "Invalid event ID format"}, status=400)
+
+        current_user = request.user
+        current_username = current_user.username
+
+        cache_key = make_event_detail_key(event_uuid)
+        detail = get_cached_event_detail(cache_key)
+        cache_status = 'HIT'
+        if detail is None:
+            cache_status = 'MISS'
+            event = StudyEvent.objects.select_related('host', 'host__userprofile').get(id=event_uuid)
+            detail = _build_event_detail(event)
+            set_cached_event_detail(cache_key, detail)
+
+        # Access: private and auto-matched events are limited to the host,
+        # matched users, attendees and invited users
+        event_data = detail["event"]
+        if not event_data["is_public"] or event_data["auto_matching_enabled"]:
+            has_access = (
+                event_data["host"] == current_username
+                or current_username in detail["auto_matched_users"]
+                or StudyEvent.objects.filter(id=event_uuid).filter(
+                    Q(attendees=current_user) | Q(invited_friends=current_user)
+                ).exists()
+            )
+            if not has_access:
+                return JsonResponse({"error": "You don't have access to this event"}, status=403)
+
+        # Per-user flags, never cached
+        engagement = dict(detail["engagement"])
+        top_posts = [dict(post) for post in detail["top_posts"]]
+        liked = set(
+            EventLike.objects.filter(
+                user=current_user,
+                event_id=event_uuid
+            ).filter(
+                Q(comment__isnull=True) | Q(comment_id__in=[post["id"] for post in top_posts])
+            ).values_list('comment_id', flat=True)
+        )
+        liked_event = None in liked
+
+        if engagement_buffer_enabled():
+            # Read-your-writes: overlay likes and shares not flushed yet
+            pending_likes = engagement_buffer.pending_like_deltas(event_uuid)
+            engagement["likes"] = max(0, engagement["likes"] + pending_likes.get(None, 0))
+            engagement["shares"] = dict(
+                engagement["shares"],
+                total=engagement["shares"]["total"] + engagement_buffer.pending_share_count(event_uuid)
+            )
+            pending_event_like = engagement_buffer.pending_like_state(current_user.id, event_uuid)
+            if pending_event_like is not None:
+                liked_event = pending_event_like
+            liked = engagement_buffer.apply_pending_likes(current_user.id, event_uuid, liked)
+            for post in top_posts:
+                post["likes"] = max(0, post["likes"] + pending_likes.get(post["id"], 0))
+
+        engagement["isLikedByCurrentUser"] = liked_event
+        for post in top_posts:
+            post["isLikedByCurrentUser"] = post["id"] in liked
+
+        response = JsonResponse({
+            "success": True,
+            "event": event_data,
+            "engagement": engagement,
+            "top_posts": top_posts,
+            "attendees": detail["attendees"],
+            "auto_matched_users": detail["auto_matched_users"],
         })
-        
+        response['X-Event-Detail-Cache'] = cache_status
+        return response
+
     except StudyEvent.DoesNotExist:
         return JsonResponse({"error": "Event not found"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+# Limits for the batch post endpoint
+MAX_BATCH_POSTS = 20
+MAX_IMAGES_PER_POST = 10
+
+def _clean_image_urls(image_urls):
+    """Keep the image URLs that fit EventImage.image_url, in order"""
+    from myapp.models import EventImage
+
+    if not isinstance(image_urls, list):
+        return []
+    max_length = EventImage._meta.get_field('image_url').max_length
+    return [
+        url for url in image_urls
+        if isinstance(url, str) and url and len(url) <= max_length
+    ][:MAX_IMAGES_PER_POST]
+
+def _create_event_posts(event, user, posts):
+    """
+    Create posts/replies with their images in one transaction and a fixed
+    number of queries, however many posts and images there are.
+
+    Args:
+        posts (list): dicts with "text", "parent_id" (or None) and cleaned "image_urls"
+
+    Threads are one level deep: a reply to a reply is attached to that
+    reply's top-level post. Returns the created EventComments, in order.
+    Raises EventComment.DoesNotExist if a parent_id is not a post of this event.
+    """
+    from myapp.models import EventImage
+
+    try:
+        parent_ids = [int(post["parent_id"]) if post["parent_id"] else None for post in posts]
+    except (TypeError, ValueError):
+        raise EventComment.DoesNotExist("Parent post not found")
+
+    wanted = {parent_id for parent_id in parent_ids if parent_id}
+    with transaction.atomic():
+        parents = EventComment.objects.filter(event=event).select_related('parent').in_bulk(wanted) if wanted else {}
+        if len(parents) != len(wanted):
+            raise EventComment.DoesNotExist("Parent post not found")
+        parents = {parent_id: parent.parent or parent for parent_id, parent in parents.items()}
+
+        comments = EventComment.objects.bulk_create([
+            EventComment(
+                event=event,
+                user=user,
+                text=post["text"],
+                parent=parents.get(parent_id)
+            )
+            for post, parent_id in zip(posts, parent_ids)
+        ])
+        EventImage.objects.bulk_create([
+            EventImage(comment=comment, image_url=url)
+            for comment, post in zip(comments, posts)
+            for url in post["image_urls"]
+        ])
+        increment_counter(StudyEvent, event.id, 'comment_count', len(comments))
+        ActivityLog.objects.bulk_create([ActivityLog.entry('comment', user, event) for _ in comments])
+        transaction.on_commit(lambda: invalidate_event_detail(event.id))
+    return comments
+
+def _serialize_new_post(comment, image_urls):
+    return {
+        "id": comment.id,
+        "text": comment.text,
+        "username": comment.user.username,
+        "created_at": comment.created_at.isoformat(),
+        "imageURLs": image_urls if image_urls else None,
+        "likes": 0,
+        "isLikedByCurrentUser": False,
+        "replies": []
+    }
+
 @ratelimit(key='user', rate='20/h', method='POST', block=True)
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
@@ -2535,7 +3007,7 @@ def add_event_comment(request):
             event_id = data.get("event_id")
             text = data.get("text")
             parent_id = data.get("parent_id")
-            image_urls = data.get("image_urls", [])  # List of image URLs if any
+            image_urls = _clean_image_urls(data.get("image_urls", []))  # List of image URLs if any
 
             # ✅ SECURITY: Sanitize text input to prevent XSS
             import bleach
@@ -2547,50 +3019,21 @@ def add_event_comment(request):
                 return JsonResponse({"error": "Missing required fields"}, status=400)
 
             # Fetch user and event
-            user = User.objects.get(username=username)
+            user = request.user if request.user.username == username else User.objects.get(username=username)
             event = StudyEvent.objects.get(id=uuid.UUID(event_id))
 
-            # Create comment/post
-            if parent_id:
-                # This is a reply
-                parent_comment = EventComment.objects.get(id=parent_id)
-                comment = EventComment.objects.create(
-                    event=event,
-                    user=user,
-                    text=text,
-                    parent=parent_comment
-                )
-            else:
-                # This is a top-level post
-                comment = EventComment.objects.create(
-                    event=event,
-                    user=user,
-                    text=text
-                )
-            
-            # If the post has images, store them as EventImage records
-            if image_urls and len(image_urls) > 0:
-                from myapp.models import EventImage
-                for url in image_urls:
-                    try:
-                        EventImage.objects.create(comment=comment, image_url=url)
-                    except Exception:
-                        # Continue on individual failures
-                        continue
+            # Create comment/post together with its images
+            try:
+                comment, = _create_event_posts(event, user, [
+                    {"text": text, "parent_id": parent_id, "image_urls": image_urls}
+                ])
+            except EventComment.DoesNotExist:
+                return JsonResponse({"error": "Parent post not found"}, status=404)
 
             # Return the created post data
             return JsonResponse({
                 "success": True,
-                "post": {
-                    "id": comment.id,
-                    "text": comment.text,
-                    "username": comment.user.username,
-                    "created_at": comment.created_at.isoformat(),
-                    "imageURLs": image_urls if image_urls else None,
-                    "likes": 0,
-                    "isLikedByCurrentUser": False,
-                    "replies": []
-                }
+                "post": _serialize_new_post(comment, image_urls)
             }, status=201)
 
         except User.DoesNotExist:
@@ -2602,6 +3045,70 @@ def add_event_comment(request):
     
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
+@ratelimit(key='user', rate='10/h', method='POST', block=True)
+@api_view(['POST'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def add_event_comments_batch(request):
+    """
+    Add several posts/replies to an event in one call, as the authenticated user
+    Expected JSON:
+    {
+        "event_id": "<event-uuid>",
+        "posts": [
+            {"text": "Great event!", "parent_id": null, "image_urls": []},
+            ...
+        ]
+    }
+    Up to MAX_BATCH_POSTS posts; all are created or none are.
+    """
+    import bleach
+
+    try:
+        data = json.loads(request.body)
+        event_id = data.get("event_id")
+        raw_posts = data.get("posts")
+
+        if not event_id or not isinstance(raw_posts, list) or not raw_posts:
+            return JsonResponse({"error": "Missing required fields"}, status=400)
+        if len(raw_posts) > MAX_BATCH_POSTS:
+            return JsonResponse({"error": f"At most {MAX_BATCH_POSTS} posts per request"}, status=400)
+
+        posts = []
+        for raw in raw_posts:
+            if not isinstance(raw, dict):
+                return JsonResponse({"error": "Each post must be an object"}, status=400)
+            # ✅ SECURITY: Sanitize text input to prevent XSS
+            text = bleach.clean(raw.get("text") or '', strip=True)
+            if not text:
+                return JsonResponse({"error": "Each post needs text"}, status=400)
+            posts.append({
+                "text": text,
+                "parent_id": raw.get("parent_id"),
+                "image_urls": _clean_image_urls(raw.get("image_urls", []))
+            })
+
+        event = StudyEvent.objects.get(id=uuid.UUID(event_id))
+
+        try:
+            comments = _create_event_posts(event, request.user, posts)
+        except EventComment.DoesNotExist:
+            return JsonResponse({"error": "Parent post not found"}, status=404)
+
+        return JsonResponse({
+            "success": True,
+            "posts": [
+                _serialize_new_post(comment, post["image_urls"])
+                for comment, post in zip(comments, posts)
+            ]
+        }, status=201)
+
+    except StudyEvent.DoesNotExist:
+        return JsonResponse({"error": "Event not found"}, status=404)
+    except ValueError:
+        return JsonResponse({"error": "Invalid request"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
 # New: Upload event post image to R2 and return a public URL
 # (Imports already at top of file: api_view, IsAuthenticated, JWTAuthentication, ratelimit)
@@ -2644,6 +3151,39 @@ def upload_event_post_image(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+def _toggle_like(user, event, comment=None):
+    """
+    Toggle user's like on an event (comment=None) or on one of its posts and
+    keep the matching like_count in step. Returns (liked, total_likes).
+    """
+    from django.db import IntegrityError
+
+    counter_model, counter_id = (EventComment, comment.id) if comment else (StudyEvent, event.id)
+
+    with transaction.atomic():
+        # The DELETE either removes an existing like or tells us there wasn't one
+        deleted, _ = EventLike.objects.filter(user=user, event=event, comment=comment).delete()
+        if deleted:
+            # Unlike
+            increment_counter(counter_model, counter_id, 'like_count', -deleted)
+            liked = False
+        else:
+            # Like; the unique constraint settles concurrent taps
+            try:
+                with transaction.atomic():
+                    EventLike.objects.create(user=user, event=event, comment=comment)
+            except IntegrityError:
+                # Another request inserted the same like (and counted it) first
+                pass
+            else:
+                increment_counter(counter_model, counter_id, 'like_count')
+                ActivityLog.record('like', user, event)
+            liked = True
+        transaction.on_commit(lambda: invalidate_event_detail(event.id))
+
+    total_likes = counter_model.objects.values_list('like_count', flat=True).get(id=counter_id)
+    return liked, total_likes
+
 @ratelimit(key='user', rate='50/h', method='POST', block=True)
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
@@ -2655,8 +3195,11 @@ def toggle_event_like(request):
     {
         "username": "johndoe",
         "event_id": "<event-uuid>",
-        "post_id": null  # optional, if liking a specific post rather than the event
+        "post_id": null,  # optional, if liking a specific post rather than the event
+        "idempotency_key": "<uuid>"  # optional, or send an Idempotency-Key header
     }
+    A retried request with the same idempotency key gets the original
+    response back instead of toggling again.
     """
     if request.method == "POST":
         try:
@@ -2669,86 +3212,48 @@ def toggle_event_like(request):
             if not username or not event_id:
                 return JsonResponse({"error": "Missing required fields"}, status=400)
 
-            # Fetch user and event
-            user = User.objects.get(username=username)
-            event = StudyEvent.objects.get(id=uuid.UUID(event_id))
-
-            # Check if this is a post like or an event like
-            if post_id:
-                # This is a post like - modify this to fit your models
-                # For simplicity, we're just assuming there's a CommentLike model
+            def toggle():
                 try:
-                    comment = EventComment.objects.get(id=post_id)
-                    existing_like = EventLike.objects.filter(
-                        user=user, 
-                        event=event,
-                        comment=comment
-                    )
-                    
-                    if existing_like.exists():
-                        # Unlike
-                        existing_like.delete()
-                        liked = False
+                    # Fetch user and event
+                    user = User.objects.get(username=username)
+                    event = StudyEvent.objects.get(id=uuid.UUID(event_id))
+
+                    # Check if this is a post like or an event like
+                    comment = None
+                    if post_id:
+                        try:
+                            comment = EventComment.objects.get(id=post_id, event=event)
+                        except EventComment.DoesNotExist:
+                            return JsonResponse({"error": "Post not found"}, status=404)
+
+                    if engagement_buffer_enabled():
+                        liked, total_likes = engagement_buffer.toggle_like(user, event, comment)
                     else:
-                        # Like
-                        EventLike.objects.create(
-                            user=user, 
-                            event=event,
-                            comment=comment
-                        )
-                        liked = True
-                        
-                    # Get total likes for this post
-                    total_likes = EventLike.objects.filter(
-                        event=event,
-                        comment=comment
-                    ).count()
-                    
-                except EventComment.DoesNotExist:
-                    return JsonResponse({"error": "Post not found"}, status=404)
-                
-            else:
-                # This is an event like
-                existing_like = EventLike.objects.filter(
-                    user=user, 
-                    event=event,
-                    comment__isnull=True
-                )
+                        liked, total_likes = _toggle_like(user, event, comment)
 
-                if existing_like.exists():
-                    # Unlike
-                    existing_like.delete()
-                    liked = False
-                else:
-                    # Like
-                    EventLike.objects.create(
-                        user=user, 
-                        event=event
-                    )
-                    liked = True
-                
-                # Get total likes for the event
-                total_likes = EventLike.objects.filter(
-                    event=event,
-                    comment__isnull=True
-                ).count()
+                    return JsonResponse({
+                        "success": True,
+                        "liked": liked,
+                        "total_likes": total_likes
+                    })
 
-            return JsonResponse({
-                "success": True,
-                "liked": liked,
-                "total_likes": total_likes
-            })
+                except User.DoesNotExist:
+                    return JsonResponse({"error": "User not found"}, status=404)
+                except StudyEvent.DoesNotExist:
+                    return JsonResponse({"error": "Event not found"}, status=404)
+
+            return run_idempotent(
+                'toggle_event_like',
+                request.user.id,
+                get_idempotency_key(request, data),
+                toggle
+            )
 
-        except User.DoesNotExist:
-            return JsonResponse({"error": "User not found"}, status=404)
-        except StudyEvent.DoesNotExist:
-            return JsonResponse({"error": "Event not found"}, status=404)
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
     
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
-
 from django.http import JsonResponse
 from django.contrib.auth.models import User
 
@@ -2921,6 +3426,149 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     
     return r * c
 
+def haversine_many(lat, lon, points):
+    """
+    Vectorized Haversine distance from (lat, lon) to every (lat, lon) pair in
+    points. Returns a list of distances in kilometers. Uses numpy when it is
+    installed and falls back to plain math otherwise.
+    """
+    if not points:
+        return []
+    try:
+        import numpy as np
+    except ImportError:
+        return [calculate_distance(lat, lon, p_lat, p_lon) for p_lat, p_lon in points]
+
+    coords = np.radians(np.asarray(points, dtype=float))
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    dlat = coords[:, 0] - lat1
+    dlon = coords[:, 1] - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(coords[:, 0]) * np.sin(dlon / 2) ** 2
+    return (6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))).tolist()
+
+
+# Nearby events search parameters
+NEARBY_INITIAL_RADIUS_KM = 2.0
+NEARBY_MAX_RADIUS_KM = 100.0
+NEARBY_DEFAULT_K = 20
+NEARBY_MAX_K = 100
+NEARBY_MAX_HOURS = 24 * 365
+# Bounding-box doublings from the initial radius (2 km -> 128 km covers the max)
+NEARBY_MAX_EXPANSIONS = 7
+
+def _longitude_range_q(lon, lon_delta):
+    """
+    Q for longitudes within lon_delta degrees of lon, split in two when the
+    box crosses the antimeridian
+    """
+    if lon_delta >= 180:
+        return Q()
+    low, high = lon - lon_delta, lon + lon_delta
+    if low < -180:
+        return Q(longitude__gte=low + 360) | Q(longitude__lte=high)
+    if high > 180:
+        return Q(longitude__gte=low) | Q(longitude__lte=high - 360)
+    return Q(longitude__range=(low, high))
+
+@ratelimit(key='user', rate='500/h', method='GET', block=True)
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_events_near_me(request):
+    """
+    Return the k nearest upcoming events to a location, sorted by distance.
+
+    Query parameters:
+    - latitude, longitude: the user's location (required)
+    - k: number of events to return (default 20, max 100)
+    - radius_km: maximum search radius (default/max 100)
+    - hours: only events starting within the next N hours (optional)
+    - event_type: only events of this type (optional)
+
+    Candidates come from a bounding-box query on the (latitude, longitude)
+    index that doubles in size until it holds k events within its radius;
+    only their coordinates are loaded and re-ranked with a vectorized
+    Haversine before the k winners are fetched.
+    """
+    import math
+
+    try:
+        lat = float(request.GET["latitude"])
+        lon = float(request.GET["longitude"])
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "latitude and longitude are required"}, status=400)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return JsonResponse({"error": "Invalid coordinates"}, status=400)
+
+    try:
+        k = parse_limit(request.GET.get("k"), default=NEARBY_DEFAULT_K, maximum=NEARBY_MAX_K)
+        max_radius = float(request.GET.get("radius_km", NEARBY_MAX_RADIUS_KM))
+        hours = float(request.GET["hours"]) if request.GET.get("hours") else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid k, radius_km or hours"}, status=400)
+    # nan/inf would keep the radius loop from ever finishing
+    if not math.isfinite(max_radius) or max_radius <= 0:
+        return JsonResponse({"error": "radius_km must be a positive number"}, status=400)
+    if hours is not None and (not math.isfinite(hours) or hours <= 0):
+        return JsonResponse({"error": "hours must be a positive number"}, status=400)
+    max_radius = min(max_radius, NEARBY_MAX_RADIUS_KM)
+    event_type = request.GET.get("event_type", "").lower()
+
+    now = timezone.now()
+    qs = StudyEvent.objects.filter(end_time__gt=now).filter(Q(is_public=True) | Q(host=request.user))
+    if hours is not None:
+        qs = qs.filter(time__lte=now + timedelta(hours=min(hours, NEARBY_MAX_HOURS)))
+    if event_type:
+        qs = qs.filter(event_type__iexact=event_type)
+
+    radius = min(NEARBY_INITIAL_RADIUS_KM, max_radius)
+    for _ in range(NEARBY_MAX_EXPANSIONS + 1):
+        lat_delta = radius / 111.32
+        lon_delta = radius / (111.32 * max(math.cos(math.radians(lat)), 0.01))
+        candidates = list(
+            qs.filter(
+                _longitude_range_q(lon, lon_delta),
+                latitude__range=(lat - lat_delta, lat + lat_delta),
+            ).values_list('id', 'latitude', 'longitude')
+        )
+        distances = haversine_many(lat, lon, [(c_lat, c_lon) for _, c_lat, c_lon in candidates])
+        # Only events inside the radius are guaranteed to beat everything outside the box
+        in_radius = sorted(
+            (distance, event_id)
+            for (event_id, _, _), distance in zip(candidates, distances)
+            if distance <= radius
+        )
+        if len(in_radius) >= k or radius >= max_radius:
+            break
+        radius = min(radius * 2, max_radius)
+
+    nearest = in_radius[:k]
+    events_by_id = StudyEvent.objects.select_related('host', 'host__userprofile').in_bulk(
+        [event_id for _, event_id in nearest]
+    )
+
+    data = []
+    for distance, event_id in nearest:
+        event = events_by_id.get(event_id)
+        if event is None:
+            continue
+        data.append({
+            "id": str(event.id),
+            "title": event.title,
+            "description": event.description or "",
+            "latitude": event.latitude,
+            "longitude": event.longitude,
+            "time": event.time.isoformat(),
+            "end_time": event.end_time.isoformat(),
+            "host": event.host.username,
+            "hostIsCertified": event.host.userprofile.is_certified,
+            "isPublic": event.is_public,
+            "event_type": (event.event_type or "other").lower(),
+            "distance_km": round(distance, 3),
+        })
+
+    return JsonResponse({"events": data, "radius_km": radius}, safe=False)
+
 @ratelimit(key='user', rate='10/h', method='POST', block=True)
 @api_view(['POST'])
 @authentication_classes([JWTAuthentication])
@@ -3336,42 +3984,15 @@ def get_user_recent_location(user):
 
 
 def send_bulk_invitation_notifications(user_ids, event):
-    """Send invitation notifications to multiple users efficiently"""
-    try:
-        # Get all devices for the users in one query
-        devices = Device.objects.filter(
-            user_id__in=user_ids, 
-            is_active=True
-        ).select_related('user')
-        
-        # Group devices by user
-        devices_by_user = {}
-        for device in devices:
-            if device.user_id not in devices_by_user:
-                devices_by_user[device.user_id] = []
-            devices_by_user[device.user_id].append(device)
-        
-        # Prepare notification data
-        notification_data = {
-            'event_id': str(event.id),
-            'event_title': event.title,
-            'host': event.host.username
-        }
-        
-        # Send notifications (in reality, you would batch these through a message queue)
-        for user_id, user_devices in devices_by_user.items():
-            try:
-                send_push_notification(
-                    user_id=user_id,
-                    notification_type='event_invitation',
-                    **notification_data
-                )
-            except Exception as e:
-                pass
-                
-    except Exception as e:
-        # Continue execution even if notifications fail
-        pass
+    """Send invitation notifications to multiple users as one fan-out"""
+    send_bulk_push_notification(
+        user_ids,
+        'event_invitation',
+        event_id=str(event.id),
+        event_title=event.title,
+        host=event.host.username,
+        from_user=event.host.username
+    )
 
 
 """
@@ -3486,229 +4107,51 @@ def delete_device(request, device_id):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-# Function to send push notifications using aioapns
+# Function to queue push notifications (delivered by myapp/notifications.py)
 def send_push_notification(user_id, notification_type, **kwargs):
     """
-    Send push notification to a specific user using aioapns
+    Queue a push notification for a specific user
+    
+    The notification is written to the NotificationOutbox with the current
+    transaction and delivered by the notification worker, so the request
+    never waits on APNs.
     
     Parameters:
     - user_id: User ID to send notification to
     - notification_type: Type of notification (event_invitation, event_update, etc.)
     - **kwargs: Additional data for notification
     """
+    from myapp.notifications import enqueue_notification
+
     try:
-        # Get user's devices
-        devices = Device.objects.filter(user_id=user_id, is_active=True)
-        
-        if not devices.exists():
-            print(f"⚠️  No active devices found for user_id: {user_id}")
-            return
-        
-        print(f"📱 Sending {notification_type} notification to user_id: {user_id} ({devices.count()} device(s))")
-        
-        # Prepare notification payload
-        payload = {
-            'type': notification_type,
-            **kwargs
-        }
-        
-        # Create appropriate title and message based on notification type
-        title = "PinIt"
-        message = "You have a new notification"
-        
-        if notification_type == 'event_invitation':
-            event_title = kwargs.get('event_title', 'an event')
-            from_user = kwargs.get('from_user', 'Someone')
-            message = f"{from_user} invited you to {event_title}"
-            title = "Event Invitation"
-        elif notification_type == 'event_update':
-            event_title = kwargs.get('event_title', 'an event')
-            message = f"{event_title} has been updated"
-            title = "Event Updated"
-        elif notification_type == 'event_cancellation':
-            event_title = kwargs.get('event_title', 'an event')
-            message = f"{event_title} has been cancelled"
-            title = "Event Cancelled"
-        elif notification_type == 'new_attendee':
-            event_title = kwargs.get('event_title', 'your event')
-            attendee_name = kwargs.get('attendee_name', 'Someone')
-            message = f"{attendee_name} joined {event_title}"
-            title = "New Attendee"
-        elif notification_type == 'join_request':
-            event_title = kwargs.get('event_title', 'your event')
-            requester_name = kwargs.get('requester_name', 'Someone')
-            message = f"{requester_name} wants to join {event_title}"
-            title = "Join Request"
-        elif notification_type == 'request_approved':
-            event_title = kwargs.get('event_title', 'an event')
-            message = f"Your request to join {event_title} was approved!"
-            title = "Request Approved"
-        elif notification_type == 'new_rating':
-            from_user = kwargs.get('from_user', 'Someone')
-            rating = kwargs.get('rating', 5)
-            message = f"{from_user} rated you {rating} stars"
-            title = "New Rating"
-        elif notification_type == 'trust_level_change':
-            level_title = kwargs.get('level_title', 'a new level')
-            message = f"Congratulations! You've reached {level_title}"
-            title = "Level Up!"
-        elif notification_type == 'rating_reminder':
-            event_title = kwargs.get('event_title', 'an event')
-            message = f"Rate attendees from {event_title}"
-            title = "Rate Event"
-        elif notification_type == 'review_reminder':
-            event_title = kwargs.get('event_title', 'an event')
-            reviewable_count = kwargs.get('reviewable_count', 0)
-            if reviewable_count > 1:
-                message = f"Rate {reviewable_count} attendees from {event_title}"
-            else:
-                message = f"Rate attendees from {event_title}"
-            title = "Rate Attendees"
-        
-        # Send to each device based on type
-        for device in devices:
-            if device.device_type == 'ios':
-                try:
-                    _send_apns_notification(
-                        device_token=device.token,
-                        title=title,
-                        message=message,
-                        payload=payload,
-                        notification_type=notification_type
-                    )
-                    print(f"✅ Push notification sent to iOS device: {title} - {message}")
-                    
-                except Exception as e:
-                    print(f"❌ APNS send error for user {user_id}: {e}")
-                    import traceback
-                    traceback.print_exc()
-            
-            elif device.device_type == 'android':
-                # Implementation for FCM (Android) would go here
-                print(f"⚠️  Android push notifications not yet implemented")
-                pass
-                
+        enqueue_notification([user_id], notification_type, **kwargs)
+        print(f"📱 Queued {notification_type} notification for user_id: {user_id}")
     except Exception as e:
-        print(f"❌ Error sending push notification to user {user_id}: {e}")
+        print(f"❌ Error queueing push notification for user {user_id}: {e}")
         import traceback
         traceback.print_exc()
 
 
-def _send_apns_notification(device_token, title, message, payload, notification_type):
+def send_bulk_push_notification(user_ids, notification_type, **kwargs):
     """
-    Internal function to send APNs notification using aioapns
-    This uses synchronous execution of async code for compatibility with Django views
-    """
-    import asyncio
-    from aioapns import APNs, NotificationRequest, PushType
-    import os
-    
-    # Get APNs configuration from settings
-    auth_key_path = settings.PUSH_NOTIFICATIONS_SETTINGS.get('APNS_AUTH_KEY_PATH', '')
-    auth_key_id = settings.PUSH_NOTIFICATIONS_SETTINGS.get('APNS_AUTH_KEY_ID', '')
-    team_id = settings.PUSH_NOTIFICATIONS_SETTINGS.get('APNS_TEAM_ID', '')
-    topic = settings.PUSH_NOTIFICATIONS_SETTINGS.get('APNS_TOPIC', 'com.pinit.app')
-    use_sandbox = settings.PUSH_NOTIFICATIONS_SETTINGS.get('APNS_USE_SANDBOX', True)
-    
-    # Validate configuration
-    if not auth_key_path or not os.path.exists(auth_key_path):
-        print(f"❌ APNs auth key not found at: {auth_key_path}")
-        return
+    Queue the same push notification for many users
     
-    if not auth_key_id or not team_id:
-        print(f"❌ APNs configuration incomplete: auth_key_id={auth_key_id}, team_id={team_id}")
+    One outbox row covers every user: delivery loads all their devices in one
+    query, builds the payload once and multiplexes the sends over the shared
+    APNs connection.
+    """
+    from myapp.notifications import enqueue_notification
+
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
         return
-    
-    print(f"🔍 Attempting to send APNs notification...")
-    print(f"🔍 APNs device: {device_token[:20]}...")
-    print(f"🔍 Message: {message}")
-    print(f"🔍 Title: {title}")
-    print(f"🔍 Using sandbox: {use_sandbox}")
-    
-    async def send_notification():
-        """Async function to send the notification"""
-        import tempfile
-        temp_key_file = None
-        
-        try:
-            # Handle both file path and direct key content
-            # If auth_key_path starts with "-----BEGIN", it's the key content itself
-            if auth_key_path.startswith('-----BEGIN'):
-                # Write key content to a temporary file
-                # aioapns requires a file path, not key content directly
-                temp_key_file = tempfile.NamedTemporaryFile(mode='w', suffix='.p8', delete=False)
-                temp_key_file.write(auth_key_path)
-                temp_key_file.close()
-                key_file_path = temp_key_file.name
-                print(f"🔑 Using APNs auth key from environment variable content (temp file: {key_file_path})")
-            else:
-                # Use the file path directly
-                key_file_path = auth_key_path
-                print(f"🔑 Using APNs auth key from file: {auth_key_path}")
-            
-            # Create APNs client with file path
-            client = APNs(
-                key=key_file_path,
-                key_id=auth_key_id,
-                team_id=team_id,
-                topic=topic,
-                use_sandbox=use_sandbox
-            )
-            
-            # Build the notification payload
-            notification_payload = {
-                'aps': {
-                    'alert': {
-                        'title': title,
-                        'body': message
-                    },
-                    'sound': 'default',
-                    'badge': 1,
-                    'thread-id': notification_type  # Group notifications by type
-                },
-                # Include custom payload
-                **payload
-            }
-            
-            # Create notification request
-            request = NotificationRequest(
-                device_token=device_token,
-                message=notification_payload,
-                push_type=PushType.ALERT
-            )
-            
-            # Send the notification
-            result = await client.send_notification(request)
-            
-            # Note: aioapns APNs client does not require explicit close
-            
-            print(f"✅ APNs notification sent successfully: {result}")
-            return result
-            
-        except Exception as e:
-            print(f"❌ Error in async send_notification: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
-        finally:
-            # Clean up temporary key file if created
-            if temp_key_file is not None:
-                try:
-                    os.unlink(temp_key_file.name)
-                except:
-                    pass
-    
-    # Run the async function synchronously
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(send_notification())
-        loop.close()
-        return result
+        enqueue_notification(user_ids, notification_type, **kwargs)
+        print(f"📱 Queued {notification_type} notification for {len(user_ids)} user(s)")
     except Exception as e:
-        print(f"❌ Error running async notification: {e}")
-        raise
-
+        print(f"❌ Error queueing {notification_type} notification for {len(user_ids)} user(s): {e}")
+        import traceback
+        traceback.print_exc()
 
 # ✅ SECURITY: Debug endpoint removed for production security
 
@@ -5344,13 +5787,8 @@ def approve_join_request(request):
             except Exception as notif_error:
                 print(f"⚠️ Failed to send request_approved notification: {notif_error}")
             
-            # Broadcast event update
-            broadcast_event_updated(
-                event_id=join_request.event.id,
-                host_username=join_request.event.host.username,
-                attendees=[u.username for u in join_request.event.attendees.all()],
-                invited_friends=[u.username for u in join_request.event.invited_friends.all()]
-            )
+            # Broadcast event update (the new attendee may not be subscribed yet)
+            _broadcast_event_saved(join_request.event, usernames=[join_request.user.username])
             
             return JsonResponse({
                 "success": True,
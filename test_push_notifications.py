@@ -25,7 +25,7 @@ django.setup()
 from django.contrib.auth.models import User
 from myapp.models import Device
 from myapp.views import send_push_notification
-from push_notifications.models import APNSDevice
+from myapp import push
 
 
 def test_device_registration():
@@ -50,14 +50,6 @@ def test_device_registration():
         print("   3. Wait for device registration")
         return False
     
-    # Check APNSDevice registration
-    apns_devices = APNSDevice.objects.filter(active=True).count()
-    print(f"✓ APNs devices registered: {apns_devices}")
-    
-    if ios_devices > 0 and apns_devices == 0:
-        print("\n⚠️  WARNING: iOS devices registered but no APNs devices found")
-        print("   This might cause issues with push notifications")
-    
     return True
 
 
@@ -71,27 +63,34 @@ def test_apns_configuration():
     
     config = settings.PUSH_NOTIFICATIONS_SETTINGS
     
-    # Check for modern token-based auth
-    auth_key_path = config.get('APNS_AUTH_KEY_PATH', '')
-    auth_key_id = config.get('APNS_AUTH_KEY_ID', '')
-    team_id = config.get('APNS_TEAM_ID', '')
-    topic = config.get('APNS_TOPIC', '')
-    use_sandbox = config.get('APNS_USE_SANDBOX', True)
-    
-    print(f"APNS_AUTH_KEY_PATH: {'✓ Set' if auth_key_path else '❌ Not set'}")
-    print(f"APNS_AUTH_KEY_ID: {'✓ Set' if auth_key_id else '❌ Not set'}")
-    print(f"APNS_TEAM_ID: {'✓ Set' if team_id else '❌ Not set'}")
-    print(f"APNS_TOPIC: {topic if topic else '❌ Not set'}")
-    print(f"APNS_USE_SANDBOX: {use_sandbox}")
-    
-    if not auth_key_path and not config.get('APNS_CERTIFICATE', ''):
-        print("\n❌ ERROR: No APNs authentication configured!")
-        print("   You need to set either:")
-        print("   - Token-based: APNS_AUTH_KEY_PATH, APNS_AUTH_KEY_ID, APNS_TEAM_ID")
-        print("   - Certificate-based: APNS_CERTIFICATE")
+    # The key comes inline (APNS_AUTH_KEY, e.g. from the environment) or from a file
+    if config.get('APNS_AUTH_KEY'):
+        key_source = '✓ Set inline (APNS_AUTH_KEY)'
+    elif config.get('APNS_AUTH_KEY_PATH'):
+        key_source = f"✓ File {config['APNS_AUTH_KEY_PATH']}"
+    else:
+        key_source = '❌ Not set'
+    
+    print(f"APNs auth key: {key_source}")
+    print(f"APNS_AUTH_KEY_ID: {config.get('APNS_AUTH_KEY_ID') or '❌ Not set'}")
+    print(f"APNS_TEAM_ID: {config.get('APNS_TEAM_ID') or '❌ Not set'}")
+    print(f"APNS_TOPIC: {config.get('APNS_TOPIC') or '❌ Not set'}")
+    print(f"APNS_USE_SANDBOX: {config.get('APNS_USE_SANDBOX', True)}")
+    
+    # Load the key the same way the sender does
+    credentials = push.get_credentials()
+    if credentials is None:
+        try:
+            push.load_credentials()
+        except push.APNsConfigurationError as e:
+            print(f"\n❌ ERROR: {e}")
+        else:
+            print("\n❌ ERROR: No APNs authentication configured!")
+            print("   Set APNS_AUTH_KEY (or APNS_AUTH_KEY_PATH), APNS_AUTH_KEY_ID and APNS_TEAM_ID")
         print("\n   See PUSH_NOTIFICATION_SETUP_GUIDE.md for details")
         return False
     
+    print(f"✓ Signing key loaded (key ID {credentials.key_id}, team {credentials.team_id})")
     return True
 
 
@@ -125,12 +124,13 @@ def test_send_notification(username=None):
             from_user='Test System',
             event_id='test-12345'
         )
-        print("✓ Test notification sent successfully!")
+        print("✓ Test notification queued!")
         print("\n  Check your iOS device for the notification.")
         print("  If you don't see it:")
         print("  1. Check that notifications are enabled for PinIt")
         print("  2. Verify APNS_USE_SANDBOX matches your build type")
-        print("  3. Check the Django server logs for errors")
+        print("  3. Make sure a dispatcher is running (embedded, or run_notification_worker)")
+        print("  4. Check the Django server logs and NotificationOutbox.last_error")
         return True
     except Exception as e:
         print(f"❌ Error sending notification: {e}")